@@ -0,0 +1,311 @@
+"""
+Benchmark suite for the scraper, run against the local mock storefront
+
+Author: Business Analytics Team
+Purpose: Measure crawl throughput, parsing cost, memory, output and analytics cost, and catch regressions between runs
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ecommerce_scraper import EcommerceMarketScraper
+from mock_storefront import MockStorefront, generate_product, render_product_page
+from product_analytics import analyze_output
+from product_records import CompactProductStore
+from product_writers import PRODUCT_SCHEMA, ParquetProductWriter, product_to_row
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+RESULTS_FILE = "benchmark_results.jsonl"
+
+# A result is flagged when it is this much worse than the previous run
+REGRESSION_THRESHOLD = 0.10
+
+
+@contextmanager
+def scratch_directory() -> Iterator[str]:
+    """
+    Run inside a temporary directory so the scraper's output files are thrown away
+    """
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as path:
+        os.chdir(path)
+        try:
+            yield path
+        finally:
+            os.chdir(cwd)
+
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    High-water mark of the process resident set size
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak / (1024 * 1024) if platform.system() == 'Darwin' else peak / 1024
+
+
+def bench_end_to_end(skus: int = 2000, concurrency: int = 20, parser_processes: int = 0,
+                     page_size: int = 20000, latency: float = 0.0, not_found_rate: float = 0.3,
+                     error_rate: float = 0.0) -> Dict:
+    """
+    Crawl the mock storefront with the async engine and report pages per second
+    """
+    with MockStorefront(page_size=page_size, latency=latency, not_found_rate=not_found_rate,
+                        error_rate=error_rate) as storefront, scratch_directory():
+        scraper = EcommerceMarketScraper(storefront.base_url, enable_logging=False, journal_path="bench.db")
+        started = time.perf_counter()
+        asyncio.run(scraper.run_market_analysis_async(0, skus - 1, max_consecutive_failures=skus,
+                                                      concurrency=concurrency, requests_per_second=1e6,
+                                                      parser_processes=parser_processes))
+        elapsed = time.perf_counter() - started
+        products = scraper.collected_count()
+        expected = sum(storefront.sku_exists(sku) for sku in range(skus))
+        scraper.journal.close()
+    return {
+        'pages': skus,
+        'products': products,
+        'products_expected': expected,
+        'elapsed_seconds': elapsed,
+        'pages_per_second': skus / elapsed,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def bench_parse(pages: int = 200, page_size: int = 20000) -> Dict:
+    """
+    Per-page parse, validate and extract cost of each extractor backend
+    """
+    documents = [(sku, render_product_page(generate_product(sku), page_size)) for sku in range(pages)]
+    results = {}
+    for backend in ('soup', 'fast'):
+        scraper = EcommerceMarketScraper(enable_logging=False, extractor=backend)
+        started = time.perf_counter()
+        for sku, content in documents:
+            scraper.parse_product_page(content, sku, f"http://127.0.0.1/SKU-{sku}")
+        elapsed = time.perf_counter() - started
+        results[backend] = {
+            'pages_per_second': pages / elapsed,
+            'page_ms': elapsed / pages * 1000,
+        }
+        for stage in ('parse', 'validate', 'extract'):
+            stats = scraper.metrics.stages[stage]
+            results[backend][f"{stage}_ms"] = stats.total / stats.count * 1000
+    return results
+
+
+def bench_output(sizes: Sequence[int] = (10000, 100000, 1000000)) -> Dict:
+    """
+    Time and Python memory peak of writing n products with save_to_csv and the Parquet writer
+    """
+    results = {}
+    for size in sizes:
+        scraper = EcommerceMarketScraper(enable_logging=False, output_format='csv')
+        for sku in range(size):
+            scraper.products_data.append(generate_product(sku))
+        with scratch_directory():
+            started = time.perf_counter()
+            scraper.save_to_csv("bench.csv")
+            csv_seconds = time.perf_counter() - started
+
+            # tracemalloc slows allocation-heavy code several times, so the peak is measured in a separate pass
+            tracemalloc.start()
+            scraper.save_to_csv("bench.csv")
+            csv_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            started = time.perf_counter()
+            with ParquetProductWriter("bench.parquet") as writer:
+                for product in scraper.products_data:
+                    writer.write(product)
+            parquet_seconds = time.perf_counter() - started
+        results[str(size)] = {
+            'save_csv_seconds': csv_seconds,
+            'save_csv_peak_mb': csv_peak / (1024 * 1024),
+            'parquet_seconds': parquet_seconds,
+        }
+        scraper.products_data.clear()
+    return results
+
+
+def bench_memory(products: int = 20000) -> Dict:
+    """
+    Python memory per product held as plain dicts and in the compact product store
+    """
+    def held_bytes(build) -> int:
+        tracemalloc.start()
+        held = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del held
+        return size
+
+    def build_store(spill_text: bool) -> CompactProductStore:
+        store = CompactProductStore(spill_text)
+        for sku in range(products):
+            store.append(generate_product(sku))
+        return store
+
+    return {
+        'dict_bytes_per_product': held_bytes(lambda: [generate_product(sku) for sku in range(products)]) / products,
+        'compact_bytes_per_product': held_bytes(lambda: build_store(False)) / products,
+        'spilled_bytes_per_product': held_bytes(lambda: build_store(True)) / products,
+    }
+
+
+def bench_analytics(products: int = 2000000, distinct: int = 10000) -> Dict:
+    """
+    Time to analyse a Parquet output of n products from scratch, and to load the saved analytics
+
+    The output repeats `distinct` generated products, which keeps building it cheap.
+    """
+    rows = [product_to_row(generate_product(sku)) for sku in range(distinct)]
+    table = pa.Table.from_pylist(rows, schema=PRODUCT_SCHEMA)
+    with scratch_directory():
+        with pq.ParquetWriter("bench.parquet", PRODUCT_SCHEMA, compression='zstd') as writer:
+            for written in range(0, products, distinct):
+                writer.write_table(table.slice(0, min(distinct, products - written)))
+
+        started = time.perf_counter()
+        analyze_output("bench.parquet", use_saved=False)
+        analyze_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        analyze_output("bench.parquet")
+        load_seconds = time.perf_counter() - started
+    return {'products': products, 'analyze_seconds': analyze_seconds, 'load_saved_seconds': load_seconds}
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results: Dict, prefix: str = '') -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def find_regressions(previous: Dict, current: Dict, threshold: float = REGRESSION_THRESHOLD) -> List[str]:
+    """
+    Metrics that got worse than the previous run by more than threshold
+
+    Metrics ending in _per_second are better when higher; _seconds, _ms, _mb
+    and _per_product metrics are better when lower. Anything else is not
+    compared.
+    """
+    old, new = flatten(previous), flatten(current)
+    regressions = []
+    for name, value in new.items():
+        before = old.get(name)
+        if not before:
+            continue
+        if name.endswith('_per_second'):
+            change = (before - value) / before
+        elif name.endswith(('_seconds', '_ms', '_mb', '_per_product')):
+            change = (value - before) / before
+        else:
+            continue
+        if change > threshold:
+            regressions.append(f"{name}: {before:.4g} -> {value:.4g} ({change:+.0%} worse)")
+    return regressions
+
+
+def load_results(path: str = RESULTS_FILE) -> List[Dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run_benchmarks(quick: bool = False, skus: int = 2000, concurrency: int = 20, parser_processes: int = 0,
+                   page_size: int = 20000, latency: float = 0.0, not_found_rate: float = 0.3,
+                   error_rate: float = 0.0, output_sizes: Optional[Sequence[int]] = None,
+                   results_path: str = RESULTS_FILE) -> Dict:
+    """
+    Run the whole suite, append the results to results_path and report regressions against the last run
+    """
+    if quick:
+        skus = min(skus, 300)
+        output_sizes = output_sizes or (1000, 10000)
+
+    results = {
+        'end_to_end': bench_end_to_end(skus, concurrency, parser_processes, page_size, latency,
+                                       not_found_rate, error_rate),
+        'parse': bench_parse(50 if quick else 200, page_size),
+        'output': bench_output(output_sizes or (10000, 100000, 1000000)),
+        'memory': bench_memory(2000 if quick else 20000),
+        'analytics': bench_analytics(200000 if quick else 2000000),
+    }
+    record = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'quick': quick,
+        'config': {'skus': skus, 'concurrency': concurrency, 'parser_processes': parser_processes,
+                   'page_size': page_size, 'latency': latency, 'not_found_rate': not_found_rate,
+                   'error_rate': error_rate},
+        'results': results,
+    }
+
+    # Only runs with the same configuration are comparable
+    comparable = [r for r in load_results(results_path) if r['config'] == record['config'] and r['quick'] == quick]
+    record['regressions'] = find_regressions(comparable[-1]['results'], results) if comparable else []
+
+    with open(results_path, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+    return record
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark the scraper against a local mock storefront")
+    parser.add_argument('--quick', action='store_true', help="small sizes for a fast sanity run")
+    parser.add_argument('--skus', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--parser-processes', type=int, default=0)
+    parser.add_argument('--page-size', type=int, default=20000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--not-found-rate', type=float, default=0.3)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--output-sizes', type=int, nargs='+', help="product counts for the output benchmark")
+    parser.add_argument('--results', default=RESULTS_FILE)
+    args = parser.parse_args(argv)
+
+    record = run_benchmarks(args.quick, args.skus, args.concurrency, args.parser_processes, args.page_size,
+                            args.latency, args.not_found_rate, args.error_rate, args.output_sizes, args.results)
+    print(json.dumps(record['results'], indent=2))
+    if record['regressions']:
+        print("REGRESSIONS since the last comparable run:")
+        for regression in record['regressions']:
+            print(f"  {regression}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
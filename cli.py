@@ -0,0 +1,359 @@
+"""
+Command-line interface for crawls, exports, reports and benchmarks
+
+Author: Business Analytics Team
+Purpose: Run the scraper unattended (cron, containers) with options from flags or a TOML config file
+"""
+
+import argparse
+import os
+import signal
+import sys
+import tomllib
+from typing import Dict, Optional, Sequence
+
+# Exit codes
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_USAGE = 2
+EXIT_NO_PRODUCTS = 3
+# 128 + signal number, as shells report a process killed by that signal
+EXIT_INTERRUPTED = 128 + signal.SIGINT
+EXIT_TERMINATED = 128 + signal.SIGTERM
+
+# SKU range of a crawl: `resume` takes what the journal recorded, other runs these defaults
+CRAWL_RANGE_DEFAULTS = {'start': 0, 'max': 50000, 'max_failures': 100}
+# Where each option is recorded in the journal's crawl range
+CRAWL_RANGE_KEYS = {'start': 'start_sku', 'max': 'max_sku', 'max_failures': 'max_consecutive_failures'}
+
+# Config file sections and the subcommands they apply to; top-level keys apply to every subcommand
+CONFIG_SECTIONS = {
+    'crawl': ('crawl', 'resume'),
+    'export': ('export',),
+    'report': ('report',),
+    'status': ('status',),
+}
+
+
+class Interrupted(KeyboardInterrupt):
+    """
+    SIGTERM, raised like Ctrl-C so the same code path saves the partial results
+    """
+
+    def __init__(self, signum: int):
+        super().__init__(signum)
+        self.signum = signum
+
+
+def raise_interrupted(signum, frame):
+    raise Interrupted(signum)
+
+
+class ExtractorChoices:
+    """
+    Extractor backend names for argparse choices, looked up only when a value is checked or listed
+
+    Importing the backends loads BeautifulSoup, which commands other than crawl and resume do not need.
+    """
+
+    def names(self):
+        from product_extractors import EXTRACTOR_BACKENDS
+
+        return sorted(EXTRACTOR_BACKENDS)
+
+    def __contains__(self, name) -> bool:
+        return name in self.names()
+
+    def __iter__(self):
+        return iter(self.names())
+
+
+def optional_path(value: str) -> Optional[str]:
+    # An empty value switches the store off
+    return value or None
+
+
+def add_store_options(parser: argparse.ArgumentParser):
+    stores = parser.add_argument_group("stores (an empty value disables one)")
+    stores.add_argument('--journal', default="crawl_journal.db", help="crawl journal, needed to resume")
+    stores.add_argument('--history', default="price_history.db", help="price history database")
+    stores.add_argument('--search-index', default="product_search.db", help="search index database")
+    stores.add_argument('--cache-dir', default="page_cache", help="raw page cache directory")
+
+
+def add_crawl_options(parser: argparse.ArgumentParser):
+    parser.add_argument('--base-url', default="https://store.nerokas.co.ke/SKU-")
+    # No defaults here, so resume can tell a flag from an unset option; see CRAWL_RANGE_DEFAULTS
+    parser.add_argument('--start', type=int, help="first SKU (default 0; resume: the journaled crawl's)")
+    parser.add_argument('--max', type=int, help="last SKU (default 50000; resume: the journaled crawl's)")
+    parser.add_argument('--max-failures', type=int,
+                        help="consecutive failures before stopping (default 100; resume: the journaled crawl's)")
+    parser.add_argument('--concurrency', type=int, default=1, help="concurrent workers; 1 crawls sequentially")
+    parser.add_argument('--parser-processes', type=int, default=0, help="parser processes (concurrent crawls)")
+    parser.add_argument('--rps', type=float, default=2.0, help="starting requests per second")
+    parser.add_argument('--max-rps', type=float, help="request rate ceiling (default 10x --rps)")
+    parser.add_argument('--incremental', action='store_true', help="only re-parse pages that changed")
+    parser.add_argument('--adaptive', action='store_true', help="probe SKUs in the order the SKU index suggests")
+    parser.add_argument('--output-format', choices=['parquet', 'csv', 'both'], default='parquet')
+    # An explicit metavar keeps argparse from listing, and so importing, the backends while building the parser
+    parser.add_argument('--extractor', default='fast', choices=ExtractorChoices(), metavar='BACKEND',
+                        help="page extractor backend (see product_extractors.EXTRACTOR_BACKENDS)")
+    parser.add_argument('--images', action='store_true', help="download product images after the crawl")
+    parser.add_argument('--image-dir', default="images")
+    parser.add_argument('--metrics-port', type=int, help="serve Prometheus metrics on this port")
+    parser.add_argument('--spill-text', action='store_true', help="keep long product text on disk")
+    add_store_options(parser)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="cli.py", description="Electronics ecommerce market analysis")
+    parser.add_argument('--config', help="TOML config file; flags override it")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add_crawl_options(commands.add_parser('crawl', help="crawl a SKU range from scratch"))
+    add_crawl_options(commands.add_parser('resume', help="continue the last crawl recorded in the journal"))
+
+    export = commands.add_parser('export', help="write the journaled products to Parquet/CSV with a summary")
+    export.add_argument('--output-format', choices=['parquet', 'csv', 'both'], default='parquet')
+    export.add_argument('--journal', default="crawl_journal.db")
+
+    report = commands.add_parser('report', help="print the summary report of a crawl output")
+    report.add_argument('output', nargs='?', help="crawl output (default: the newest in --directory)")
+    report.add_argument('--directory', default='.')
+
+    # Every argument, --help included, goes to benchmark.py
+    commands.add_parser('bench', help="run the benchmark suite (options as for benchmark.py)", add_help=False)
+
+    status = commands.add_parser('status', help="show the journal, the newest output and the stores")
+    status.add_argument('--directory', default='.')
+    add_store_options(status)
+    status.add_argument('--image-dir', default="images")
+    return parser
+
+
+def load_config(path: str) -> Dict:
+    with open(path, 'rb') as f:
+        return tomllib.load(f)
+
+
+def apply_config(parser: argparse.ArgumentParser, config: Dict):
+    """
+    Make config values the defaults of the matching subcommands, so flags still override them
+    """
+    commands = next(action for action in parser._actions if isinstance(action, argparse._SubParsersAction))
+    top_level = {key: value for key, value in config.items() if not isinstance(value, dict)}
+    for section in config:
+        if isinstance(config[section], dict) and section not in CONFIG_SECTIONS:
+            parser.error(f"unknown config section [{section}]")
+    accepted = {action.dest for subparser in commands.choices.values() for action in subparser._actions}
+    for key in top_level:
+        if key.replace('-', '_') not in accepted:
+            parser.error(f"unknown top-level config option '{key}'")
+
+    for name, subparser in commands.choices.items():
+        actions = {action.dest: action for action in subparser._actions}
+        values = {key.replace('-', '_'): value for key, value in top_level.items()
+                  if key.replace('-', '_') in actions}
+        for section, section_commands in CONFIG_SECTIONS.items():
+            if name in section_commands:
+                for key, value in config.get(section, {}).items():
+                    dest = key.replace('-', '_')
+                    if dest not in actions:
+                        parser.error(f"unknown option '{key}' in config section [{section}]")
+                    values[dest] = value
+        # Defaults skip argparse's choices check, so config values are checked here
+        for dest, value in values.items():
+            choices = actions[dest].choices
+            if choices is not None and value not in choices:
+                parser.error(f"invalid config value {value!r} for '{dest}' (choose from {', '.join(choices)})")
+        subparser.set_defaults(**values)
+
+
+def create_scraper(args, output_format: Optional[str] = None, enable_logging: bool = True):
+    from ecommerce_scraper import EcommerceMarketScraper
+
+    options = dict(enable_logging=enable_logging, journal_path=optional_path(args.journal),
+                   output_format=output_format or args.output_format)
+    if args.command in ('crawl', 'resume'):
+        options.update(base_url=args.base_url, extractor=args.extractor,
+                       history_path=optional_path(args.history), search_path=optional_path(args.search_index),
+                       cache_dir=optional_path(args.cache_dir), metrics_port=args.metrics_port,
+                       spill_text=args.spill_text, image_dir=args.image_dir if args.images else None)
+    return EcommerceMarketScraper(**options)
+
+
+def recorded_crawl_range(journal_path: str) -> Dict[str, int]:
+    """
+    Options of the crawl recorded in a journal, keyed like the command-line options; empty if it has none
+    """
+    if not os.path.exists(journal_path):
+        return {}
+    from crawl_journal import CrawlJournal
+
+    journal = CrawlJournal(journal_path)
+    crawl_range = journal.crawl_range() or {}
+    journal.close()
+    return {dest: crawl_range[key] for dest, key in CRAWL_RANGE_KEYS.items() if key in crawl_range}
+
+
+def run_crawl(args) -> int:
+    import asyncio
+
+    resume = args.command == 'resume'
+    if resume:
+        if not args.journal:
+            print("resume needs a crawl journal (--journal)", file=sys.stderr)
+            return EXIT_USAGE
+        # Flags and config values override the range the interrupted crawl recorded
+        for dest, value in recorded_crawl_range(args.journal).items():
+            if getattr(args, dest) is None:
+                setattr(args, dest, value)
+        if args.start is None or args.max is None:
+            print(f"{args.journal} records no crawl to resume; give --start and --max", file=sys.stderr)
+            return EXIT_USAGE
+    for dest, default in CRAWL_RANGE_DEFAULTS.items():
+        if getattr(args, dest) is None:
+            setattr(args, dest, default)
+
+    scraper = create_scraper(args)
+    try:
+        if args.concurrency > 1:
+            asyncio.run(scraper.run_market_analysis_async(
+                args.start, args.max, args.max_failures, args.concurrency, args.rps,
+                parser_processes=args.parser_processes, resume=resume, incremental=args.incremental,
+                adaptive=args.adaptive, max_requests_per_second=args.max_rps))
+        else:
+            scraper.run_market_analysis(args.start, args.max, args.max_failures, resume=resume,
+                                        incremental=args.incremental, adaptive=args.adaptive,
+                                        requests_per_second=args.rps, max_requests_per_second=args.max_rps)
+    except KeyboardInterrupt as e:
+        scraper.logger.warning("Crawl interrupted; saving partial results")
+        if scraper.sku_index:
+            scraper.sku_index.save()
+        scraper.save_results()
+        if args.journal:
+            scraper.logger.info("Continue with: cli.py resume")
+        return EXIT_TERMINATED if isinstance(e, Interrupted) else EXIT_INTERRUPTED
+    except Exception:
+        scraper.logger.exception("Crawl failed; saving partial results")
+        scraper.save_results()
+        return EXIT_ERROR
+    return EXIT_OK if scraper.collected_count() else EXIT_NO_PRODUCTS
+
+
+def run_export(args) -> int:
+    if not args.journal or not os.path.exists(args.journal):
+        print(f"No crawl journal at {args.journal!r}", file=sys.stderr)
+        return EXIT_NO_PRODUCTS
+    scraper = create_scraper(args, enable_logging=False)
+    if not scraper.collected_count():
+        print("The journal holds no products", file=sys.stderr)
+        return EXIT_NO_PRODUCTS
+    # A resumed product stream replays the journal into the outputs
+    scraper.open_product_stream(resume=True)
+    # An export crawls nothing, so it has no profile to save
+    scraper.save_results(save_profile=False)
+    return EXIT_OK
+
+
+def run_report(args) -> int:
+    from crawl_outputs import find_latest_output
+    from product_aggregates import ProductAggregates, current_aggregates_path, summary_report
+
+    output = args.output or find_latest_output(args.directory)
+    if output is None:
+        print(f"No crawl output found in {args.directory}", file=sys.stderr)
+        return EXIT_NO_PRODUCTS
+    path = current_aggregates_path(output)
+    if path:
+        aggregates = ProductAggregates.load(path)
+    else:
+        # Missing or older than the output: stream the output itself
+        from product_analytics import aggregate_output
+
+        aggregates = aggregate_output(output)
+    print(f"Report for {output}\n")
+    print(summary_report(aggregates), end='')
+    return EXIT_OK
+
+
+def run_bench(args) -> int:
+    import benchmark
+
+    try:
+        benchmark.main(args.bench_args)
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else EXIT_ERROR
+    return EXIT_OK
+
+
+def disk_usage(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def run_status(args) -> int:
+    from crawl_outputs import find_latest_output
+    from product_aggregates import ProductAggregates, aggregates_path
+
+    if args.journal and os.path.exists(args.journal):
+        from crawl_journal import CrawlJournal
+
+        journal = CrawlJournal(args.journal)
+        print(f"Journal {args.journal}: {journal.outcome_counts()}")
+        changes = journal.change_counts()
+        if changes:
+            print(f"  changes since the last crawl: {changes}")
+        journal.close()
+    else:
+        print("No crawl journal")
+
+    output = find_latest_output(args.directory)
+    if output:
+        path = aggregates_path(output)
+        products = ProductAggregates.load(path).product_count if os.path.exists(path) else 'unknown'
+        print(f"Newest output {output}: {products} products")
+    else:
+        print("No crawl output")
+
+    for name, path in (('Price history', args.history), ('Search index', args.search_index),
+                       ('Page cache', args.cache_dir), ('Images', args.image_dir)):
+        if path and os.path.exists(path):
+            print(f"{name} {path}: {disk_usage(path) / 1024 ** 2:.1f} MB")
+    return EXIT_OK
+
+
+COMMANDS = {
+    'crawl': run_crawl,
+    'resume': run_crawl,
+    'export': run_export,
+    'report': run_report,
+    'bench': run_bench,
+    'status': run_status,
+}
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = build_parser()
+    known, _ = parser.parse_known_args(argv)
+    if known.config:
+        try:
+            apply_config(parser, load_config(known.config))
+        except (OSError, tomllib.TOMLDecodeError) as e:
+            parser.error(f"cannot read config {known.config}: {e}")
+    args, extra = parser.parse_known_args(argv)
+    if args.command == 'bench':
+        args.bench_args = extra
+    elif extra:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    if args.command in ('crawl', 'resume') and args.parser_processes and args.concurrency <= 1:
+        parser.error("--parser-processes needs a concurrent crawl (--concurrency 2 or more)")
+
+    # SIGTERM (docker stop, systemd, cron timeouts) takes the same path as Ctrl-C
+    signal.signal(signal.SIGTERM, raise_interrupted)
+    return COMMANDS[args.command](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
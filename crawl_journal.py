@@ -0,0 +1,208 @@
+"""
+Durable crawl journal for resumable scraping runs
+
+Author: Business Analytics Team
+Purpose: Record every SKU outcome as it happens so an interrupted run can resume
+"""
+
+import json
+import sqlite3
+from datetime import datetime
+from typing import Dict, Iterator, Optional
+
+# SKU outcomes
+PRODUCT = 'product'
+NOT_FOUND = 'not_found'
+INVALID = 'invalid'
+ERROR = 'error'
+
+# Outcomes that will not change on a retry; errors are fetched again on resume
+SETTLED_OUTCOMES = (PRODUCT, NOT_FOUND, INVALID)
+
+# Product changes reported by an incremental crawl
+NEW = 'new'
+CHANGED = 'changed'
+DISAPPEARED = 'disappeared'
+
+
+class CrawlJournal:
+    """
+    SQLite (WAL mode) journal of per-SKU crawl outcomes and scraped products
+
+    Besides the per-run outcomes, the journal keeps page_state across runs:
+    the HTTP validators, body hash and last product seen for every product
+    SKU, which incremental crawls use to skip unchanged pages.
+    """
+
+    def __init__(self, path: str = "crawl_journal.db"):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL survives process crashes; only an OS crash can lose the last commits
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS outcomes (
+                sku INTEGER PRIMARY KEY,
+                outcome TEXT NOT NULL,
+                product TEXT,
+                updated_at TEXT NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS page_state (
+                sku INTEGER PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT,
+                product TEXT,
+                updated_at TEXT NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS changes (
+                sku INTEGER PRIMARY KEY,
+                change_type TEXT NOT NULL,
+                product TEXT
+            )
+        """)
+        # Per-run values a resumed run picks up again, such as its SKU range and price history snapshot
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS run_state (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def record(self, sku: int, outcome: str, product_data: Optional[Dict] = None):
+        """
+        Record the outcome of one SKU, replacing any earlier outcome
+        """
+        product_json = json.dumps(product_data, ensure_ascii=False) if product_data else None
+        self.conn.execute(
+            "INSERT OR REPLACE INTO outcomes (sku, outcome, product, updated_at) VALUES (?, ?, ?, ?)",
+            (sku, outcome, product_json, datetime.now().isoformat())
+        )
+        self.conn.commit()
+
+    def settled_outcomes(self, start_sku: int, max_sku: int) -> Dict[int, bool]:
+        """
+        SKUs in the range that need no refetch, mapped to whether they were products
+        """
+        placeholders = ', '.join('?' for _ in SETTLED_OUTCOMES)
+        rows = self.conn.execute(
+            f"SELECT sku, outcome FROM outcomes WHERE sku BETWEEN ? AND ? AND outcome IN ({placeholders})",
+            (start_sku, max_sku, *SETTLED_OUTCOMES)
+        )
+        return {sku: outcome == PRODUCT for sku, outcome in rows}
+
+    def product_count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM outcomes WHERE outcome = ?", (PRODUCT,)).fetchone()[0]
+
+    def iter_products(self) -> Iterator[Dict]:
+        """
+        Yield every scraped product in SKU order without loading them all at once
+        """
+        cursor = self.conn.execute("SELECT product FROM outcomes WHERE outcome = ? ORDER BY sku", (PRODUCT,))
+        for (product_json,) in cursor:
+            yield json.loads(product_json)
+
+    def outcome_counts(self) -> Dict[str, int]:
+        return dict(self.conn.execute("SELECT outcome, COUNT(*) FROM outcomes GROUP BY outcome"))
+
+    def page_state(self, sku: int) -> Optional[Dict]:
+        """
+        Validators, body hash and last product seen for a SKU, or None if it was never a product
+        """
+        row = self.conn.execute(
+            "SELECT etag, last_modified, content_hash, product FROM page_state WHERE sku = ?", (sku,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'etag': row[0],
+            'last_modified': row[1],
+            'content_hash': row[2],
+            'product': json.loads(row[3]) if row[3] else None,
+        }
+
+    def update_page_state(self, sku: int, etag: Optional[str], last_modified: Optional[str],
+                          content_hash: Optional[str], product_data: Dict):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO page_state (sku, etag, last_modified, content_hash, product, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (sku, etag, last_modified, content_hash, json.dumps(product_data, ensure_ascii=False),
+             datetime.now().isoformat())
+        )
+        self.conn.commit()
+
+    def update_validators(self, sku: int, etag: Optional[str], last_modified: Optional[str]):
+        """
+        Replace the validators of a page whose body is unchanged, keeping its hash and product
+        """
+        self.conn.execute(
+            "UPDATE page_state SET etag = ?, last_modified = ?, updated_at = ? WHERE sku = ?",
+            (etag, last_modified, datetime.now().isoformat(), sku)
+        )
+        self.conn.commit()
+
+    def remove_page_state(self, sku: int):
+        self.conn.execute("DELETE FROM page_state WHERE sku = ?", (sku,))
+        self.conn.commit()
+
+    def record_change(self, sku: int, change_type: str, product_data: Dict):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO changes (sku, change_type, product) VALUES (?, ?, ?)",
+            (sku, change_type, json.dumps(product_data, ensure_ascii=False))
+        )
+        self.conn.commit()
+
+    def iter_changes(self) -> Iterator[Dict]:
+        """
+        Yield the products changed in this run, each tagged with its change_type
+        """
+        cursor = self.conn.execute("SELECT change_type, product FROM changes ORDER BY sku")
+        for change_type, product_json in cursor:
+            product_data = json.loads(product_json)
+            product_data['change_type'] = change_type
+            yield product_data
+
+    def change_counts(self) -> Dict[str, int]:
+        return dict(self.conn.execute("SELECT change_type, COUNT(*) FROM changes GROUP BY change_type"))
+
+    def price_snapshot(self) -> Optional[str]:
+        """
+        Price history snapshot of this run, or None if it has not recorded one
+        """
+        row = self.conn.execute("SELECT value FROM run_state WHERE key = 'price_snapshot'").fetchone()
+        return row[0] if row else None
+
+    def set_price_snapshot(self, snapshot: str):
+        self.conn.execute("INSERT OR REPLACE INTO run_state (key, value) VALUES ('price_snapshot', ?)", (snapshot,))
+        self.conn.commit()
+
+    def crawl_range(self) -> Optional[Dict[str, int]]:
+        """
+        SKU range and failure limit this run was started with, or None if it has not recorded them
+        """
+        row = self.conn.execute("SELECT value FROM run_state WHERE key = 'crawl_range'").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_crawl_range(self, start_sku: int, max_sku: int, max_consecutive_failures: int):
+        crawl_range = {'start_sku': start_sku, 'max_sku': max_sku,
+                       'max_consecutive_failures': max_consecutive_failures}
+        self.conn.execute("INSERT OR REPLACE INTO run_state (key, value) VALUES ('crawl_range', ?)",
+                          (json.dumps(crawl_range),))
+        self.conn.commit()
+
+    def clear(self):
+        """
+        Forget this run's outcomes, changes and run state, for a fresh run; page_state is kept
+        """
+        self.conn.execute("DELETE FROM outcomes")
+        self.conn.execute("DELETE FROM changes")
+        self.conn.execute("DELETE FROM run_state")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
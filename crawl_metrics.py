@@ -0,0 +1,197 @@
+"""
+Crawl instrumentation: per-stage latency, bytes, status codes and throughput
+
+Author: Business Analytics Team
+Purpose: Show where a slow crawl spends its time, live through Prometheus and after the run as a JSON profile
+"""
+
+import json
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from product_aggregates import QuantileSketch
+
+# Crawl stages, in pipeline order
+STAGES = ('connect', 'tls', 'ttfb', 'download', 'parse', 'validate', 'extract', 'record', 'save_csv')
+
+# Prometheus histogram buckets in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class StageStats:
+    """
+    Count, total, maximum and latency sketch of one stage
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.sketch = QuantileSketch(relative_accuracy=0.01)
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.sketch.add(seconds)
+
+    def to_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'total_seconds': self.total,
+            'mean_ms': self.total / self.count * 1000 if self.count else None,
+            'p50_ms': self.percentile_ms(0.5),
+            'p95_ms': self.percentile_ms(0.95),
+            'p99_ms': self.percentile_ms(0.99),
+            'max_ms': self.max * 1000,
+        }
+
+    def percentile_ms(self, q: float) -> Optional[float]:
+        value = self.sketch.quantile(q)
+        return min(value, self.max) * 1000 if value is not None else None
+
+
+class CrawlMetrics:
+    """
+    Hot-path crawl telemetry
+
+    Always keeps in-process statistics for the JSON profile; with a port,
+    the same measurements are also exported through prometheus_client.
+    Parser worker processes set forward=True and hand their observations
+    back with drain() so the parent process can record them.
+    """
+
+    def __init__(self, prometheus_port: Optional[int] = None):
+        self.stages: Dict[str, StageStats] = {stage: StageStats() for stage in STAGES}
+        self.status_counts: Dict[str, int] = {}
+        self.outcome_counts: Dict[str, int] = {}
+        self.bytes_downloaded = 0
+        self.pages = 0
+        self.retries = 0
+        self.started = time.monotonic()
+        self.forward = False
+        self.unreported: List[Tuple[str, float]] = []
+        self.prometheus = None
+        if prometheus_port is not None:
+            self.start_prometheus(prometheus_port)
+
+    def start_prometheus(self, port: int):
+        """
+        Serve the metrics on http://0.0.0.0:<port>/metrics
+        """
+        from prometheus_client import CollectorRegistry, Counter, Histogram, start_http_server
+
+        # A private registry lets several scrapers live in one process
+        registry = CollectorRegistry()
+        self.prometheus = {
+            'stage_seconds': Histogram('crawl_stage_seconds', 'Latency of each crawl stage', ['stage'],
+                                       buckets=LATENCY_BUCKETS, registry=registry),
+            'responses': Counter('crawl_responses_total', 'HTTP responses by status code', ['status'],
+                                 registry=registry),
+            'outcomes': Counter('crawl_outcomes_total', 'SKU outcomes', ['outcome'], registry=registry),
+            'bytes': Counter('crawl_downloaded_bytes_total', 'Response body bytes downloaded', registry=registry),
+            'pages': Counter('crawl_pages_total', 'SKUs settled', registry=registry),
+            'retries': Counter('crawl_retries_total', 'Requests retried after a transient failure',
+                               registry=registry),
+        }
+        start_http_server(port, registry=registry)
+
+    def start_run(self):
+        self.started = time.monotonic()
+
+    def observe(self, stage: str, seconds: float):
+        self.stages[stage].observe(seconds)
+        if self.forward:
+            self.unreported.append((stage, seconds))
+        if self.prometheus:
+            self.prometheus['stage_seconds'].labels(stage).observe(seconds)
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def drain(self) -> List[Tuple[str, float]]:
+        """
+        Observations made since the last drain, for forwarding to another process
+        """
+        observations, self.unreported = self.unreported, []
+        return observations
+
+    def count_response(self, status_code: Optional[int], size: int = 0):
+        status = str(status_code) if status_code is not None else 'error'
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+        self.bytes_downloaded += size
+        if self.prometheus:
+            self.prometheus['responses'].labels(status).inc()
+            self.prometheus['bytes'].inc(size)
+
+    def count_retry(self):
+        self.retries += 1
+        if self.prometheus:
+            self.prometheus['retries'].inc()
+
+    def count_outcome(self, outcome: str):
+        self.outcome_counts[outcome] = self.outcome_counts.get(outcome, 0) + 1
+        self.pages += 1
+        if self.prometheus:
+            self.prometheus['outcomes'].labels(outcome).inc()
+            self.prometheus['pages'].inc()
+
+    @property
+    def pages_per_second(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.pages / elapsed if elapsed > 0 else 0.0
+
+    def profile(self) -> Dict:
+        return {
+            'elapsed_seconds': time.monotonic() - self.started,
+            'pages': self.pages,
+            'pages_per_second': self.pages_per_second,
+            'bytes_downloaded': self.bytes_downloaded,
+            'retries': self.retries,
+            'status_codes': self.status_counts,
+            'outcomes': self.outcome_counts,
+            'stages': {stage: stats.to_dict() for stage, stats in self.stages.items() if stats.count},
+        }
+
+    def save_profile(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.profile(), f, indent=2)
+
+
+class HttpTrace:
+    """
+    httpx trace hook that turns connection events into connect, tls, ttfb and download timings
+
+    Name resolution happens inside httpcore's TCP connect, so connect includes DNS.
+    """
+
+    SPANS = {'connect_tcp': 'connect', 'start_tls': 'tls', 'receive_response_body': 'download'}
+
+    def __init__(self, metrics: CrawlMetrics):
+        self.metrics = metrics
+        self.started: Dict[str, float] = {}
+
+    async def __call__(self, event_name: str, info: Dict):
+        now = time.perf_counter()
+        # Event names look like "connection.connect_tcp.started" or "http11.receive_response_body.complete"
+        prefix, phase = event_name.rsplit('.', 1)
+        step = prefix.rsplit('.', 1)[-1]
+        if step == 'send_request_headers' and phase == 'started':
+            self.started['ttfb'] = now
+        elif step == 'receive_response_headers' and phase == 'complete':
+            self.finish('ttfb', 'ttfb', now)
+        elif step in self.SPANS:
+            if phase == 'started':
+                self.started[step] = now
+            elif phase == 'complete':
+                self.finish(step, self.SPANS[step], now)
+
+    def finish(self, key: str, stage: str, now: float):
+        if key in self.started:
+            self.metrics.observe(stage, now - self.started.pop(key))
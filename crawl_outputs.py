@@ -0,0 +1,26 @@
+"""
+Discovery of crawl output files
+
+Author: Business Analytics Team
+Purpose: Find the newest crawl output for the dashboard and the CLI
+"""
+
+import glob
+import os
+from typing import Optional
+
+# Crawl outputs, newest run first; Parquet wins over the CSV export of the same run
+OUTPUT_PATTERNS = ('ecommerce_products_*.parquet', 'ecommerce_products_*.csv')
+
+
+def find_latest_output(directory: str = '.') -> Optional[str]:
+    """
+    Path of the newest crawl output in directory, or None if there is none
+    """
+    paths = []
+    for pattern in OUTPUT_PATTERNS:
+        paths.extend(glob.glob(os.path.join(directory, pattern)))
+    if not paths:
+        return None
+    # File names carry the run timestamp, so the stem orders runs
+    return max(paths, key=lambda path: (os.path.splitext(os.path.basename(path))[0], path.endswith('.parquet')))
@@ -1,29 +1,62 @@
 # nohup streamlit run dashboard.py --server.address=0.0.0.0 --server.port=8501 &
 
-import pandas as pd
-import re
-from wordcloud import STOPWORDS
-from wordcloud import WordCloud
-import matplotlib.pyplot as plt
-import seaborn as sns
+import threading
+
 import plotly.express as px
 import streamlit as st
 
+from crawl_outputs import find_latest_output
+from dashboard_data import (BRAND_SUMMARY_COLUMNS, brand_summary_frame, file_version, find_search_index,
+                            load_aggregates, read_columns, summarize_brands)
+from product_analytics import (analyze_output, price_distribution, share, stock_availability, top_tag_words,
+                               word_cloud_image)
+from product_search import ProductSearchIndex
+
 st.title("🚀 Brand and Price Comparison")
 
-data = pd.read_csv("ecommerce_products_20250531_194248.csv")
 
-categories = data[data["brand"].notna()]["brand"].unique()
-# 26 Unique Brands
+# Cached on (path, mtime): reruns reuse the frame until the crawl output changes
+@st.cache_data
+def load_columns(path, mtime, columns):
+    return read_columns(path, list(columns))
+
+
+@st.cache_data
+def load_brand_summary(path, mtime):
+    # Served from the scraper's precomputed aggregates; older outputs fall back to the rows
+    aggregates = load_aggregates(path)
+    if aggregates is not None:
+        return brand_summary_frame(aggregates)
+    return summarize_brands(load_columns(path, mtime, tuple(BRAND_SUMMARY_COLUMNS)))
+
+
+@st.cache_resource
+def load_analytics(path, mtime):
+    # The scraper's aggregates, the same numbers as the summary report; outputs older than their
+    # breakdowns are streamed once in record batches and their aggregates file rewritten
+    return analyze_output(path)
+
+
+@st.cache_resource
+def open_search_index(path):
+    # One connection for every rerun and session; WAL lets it see the scraper's later commits.
+    # Sessions run on separate threads, so queries on the shared connection take the lock.
+    return ProductSearchIndex(path, check_same_thread=False), threading.Lock()
+
+
+@st.cache_data
+def load_word_cloud(frequencies):
+    # Rendered once per distinct tag frequency table, then read from the image cache
+    return word_cloud_image(frequencies)
+
 
-brand_summary = data.groupby('brand').agg(
-    Basket_Cost=('price_numeric', 'sum'),
-    Item_Count=('sku', 'count')
-).reset_index()
+data_path = find_latest_output()
+if data_path is None:
+    st.error("No crawl output found; run `python cli.py crawl` first.")
+    st.stop()
+st.caption(f"Data: {data_path}")
 
-# This helps answer: Is a brand expensive because it has many items, or because each item is costly?
-# Add average item price
-brand_summary['Avg_Item_Price'] = brand_summary['Basket_Cost'] / brand_summary['Item_Count']
+brand_summary = load_brand_summary(data_path, file_version(data_path))
 
 # Plotly bubble chart
 fig = px.scatter(
@@ -44,4 +77,77 @@ fig.update_layout(
     yaxis_title='Total Basket Cost',
     legend_title='Brand'
 )
-st.plotly_chart(fig, use_container_width=True)
\ No newline at end of file
+st.plotly_chart(fig, use_container_width=True)
+
+
+# Market analytics: price distribution, brand/category share, stock availability and tag words
+aggregates = load_analytics(data_path, file_version(data_path))
+
+st.header("💰 Price Distribution")
+if aggregates.price_count:
+    stats = st.columns(4)
+    stats[0].metric("Priced products", f"{aggregates.price_count:,}")
+    stats[1].metric("Median price", f"{aggregates.price_quantile(0.5):,.2f}")
+    stats[2].metric("Average price", f"{aggregates.price_mean:,.2f}")
+    stats[3].metric("Price range", f"{aggregates.price_min:,.0f} - {aggregates.price_max:,.0f}")
+    distribution = price_distribution(aggregates)
+    fig = px.bar(distribution, x='price_from', y='products', log_x=True,
+                 title='Products per Price Band (log scale)')
+    fig.update_layout(xaxis_title='Price', yaxis_title='Products', bargap=0)
+    st.plotly_chart(fig, use_container_width=True)
+
+st.header("🏷️ Brand and Category Share")
+share_columns = st.columns(2)
+for column, field in zip(share_columns, ('brand', 'category')):
+    shares = share(aggregates, field, limit=12)
+    fig = px.pie(shares, names=field, values='products', hole=0.4, title=f'{field.title()} Share of Products')
+    column.plotly_chart(fig, use_container_width=True)
+    column.dataframe(shares, use_container_width=True, hide_index=True)
+
+st.header("📦 Stock Availability")
+availability = stock_availability(aggregates, 'category', limit=20)
+if not availability.empty:
+    statuses = [column for column in availability.columns if column not in ('category', 'in_stock_rate')]
+    fig = px.bar(availability, y='category', x=statuses, orientation='h', title='Stock Status by Category')
+    fig.update_layout(xaxis_title='Products', yaxis_title='', legend_title='Stock status',
+                      yaxis={'categoryorder': 'total ascending'})
+    st.plotly_chart(fig, use_container_width=True)
+
+st.header("🔤 Tag Words")
+tag_words = top_tag_words(aggregates, 200)
+if tag_words:
+    word_columns = st.columns([2, 1])
+    word_cloud = load_word_cloud(tag_words)
+    word_columns[0].image(word_cloud, use_container_width=True)
+    top_words = list(tag_words.items())[:20]
+    word_columns[1].dataframe([{'word': word, 'mentions': count} for word, count in top_words],
+                              use_container_width=True, hide_index=True)
+
+
+# Keyword search with facet filters, answered by the scraper's search index
+search_path = find_search_index()
+if search_path:
+    st.header("🔎 Product Search")
+    index, index_lock = open_search_index(search_path)
+    query = st.text_input("Search products", placeholder="e.g. ESP32 wifi module")
+
+    with index_lock:
+        all_facets = index.facets(limit=1000)
+        lowest, highest = index.price_range()
+    facet_columns = st.columns(3)
+    brands = facet_columns[0].multiselect("Brand", list(all_facets['brand']))
+    categories = facet_columns[1].multiselect("Category", list(all_facets['category']))
+    stock_statuses = facet_columns[2].multiselect("Stock status", list(all_facets['stock_status']))
+    min_price, max_price = (None, None)
+    if lowest is not None and highest > lowest:
+        min_price, max_price = st.slider("Price range", float(lowest), float(highest), (float(lowest), float(highest)))
+
+    filters = dict(brands=brands, categories=categories, stock_statuses=stock_statuses,
+                   min_price=min_price, max_price=max_price)
+    with index_lock:
+        results = index.search(query, limit=100, **filters)
+        matches = index.facets(query, limit=10, **filters)
+        match_count = index.count(query, **filters)
+    st.caption(f"{match_count} matching products; top brands: "
+               + ", ".join(f"{brand} ({count})" for brand, count in matches['brand'].items()))
+    st.dataframe(results.drop(columns=['score'], errors='ignore'), use_container_width=True)
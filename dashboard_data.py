@@ -0,0 +1,74 @@
+"""
+Data access layer for the dashboard
+
+Author: Business Analytics Team
+Purpose: Load only the columns a chart needs from a crawl output
+"""
+
+import os
+from typing import List, Optional
+
+import pandas as pd
+
+from product_aggregates import ProductAggregates, current_aggregates_path
+
+# Columns used by the brand bubble chart
+BRAND_SUMMARY_COLUMNS = ['sku', 'brand', 'price_numeric']
+
+# Search index the scraper keeps up to date across crawls
+SEARCH_INDEX_FILE = "product_search.db"
+
+
+def find_search_index(directory: str = '.') -> Optional[str]:
+    """
+    Path of the product search index in directory, or None if no crawl has built one
+    """
+    path = os.path.join(directory, SEARCH_INDEX_FILE)
+    return path if os.path.exists(path) else None
+
+
+def file_version(path: str) -> float:
+    """
+    Modification time of path, used as a cache key so a rewritten file is reloaded
+    """
+    return os.path.getmtime(path)
+
+
+def read_columns(path: str, columns: List[str]) -> pd.DataFrame:
+    """
+    Read only the requested columns of a Parquet or CSV crawl output
+    """
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path, columns=columns)
+    # Older CSV exports may lack some columns; read the ones that exist
+    wanted = set(columns)
+    return pd.read_csv(path, usecols=lambda column: column in wanted)
+
+
+def load_aggregates(output_path: str) -> Optional[ProductAggregates]:
+    """
+    Aggregates the scraper saved next to a crawl output, or None for older outputs without them
+    and outputs rewritten since
+    """
+    path = current_aggregates_path(output_path)
+    if path is None:
+        return None
+    return ProductAggregates.load(path)
+
+
+def brand_summary_frame(aggregates: ProductAggregates) -> pd.DataFrame:
+    return pd.DataFrame(aggregates.brand_summary(), columns=['brand', 'Basket_Cost', 'Item_Count', 'Avg_Item_Price'])
+
+
+def summarize_brands(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Basket cost, item count and average item price per brand, computed from the rows
+    """
+    summary = data.groupby('brand').agg(
+        Basket_Cost=('price_numeric', 'sum'),
+        Item_Count=('sku', 'count')
+    ).reset_index()
+
+    # This helps answer: Is a brand expensive because it has many items, or because each item is costly?
+    summary['Avg_Item_Price'] = summary['Basket_Cost'] / summary['Item_Count']
+    return summary
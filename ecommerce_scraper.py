@@ -7,6 +7,17 @@ Author: Business Analytics Team
 Purpose: Market analysis for integrated circuits, sensors, and microcontrollers
 """
 
+import sys
+
+if __name__ == "__main__":
+    # Running this file runs cli.py; hand off before loading the crawl dependencies a command may not need
+    import cli
+
+    sys.exit(cli.main())
+
+import asyncio
+import heapq
+import httpx
 import requests
 from bs4 import BeautifulSoup
 import pandas as pd
@@ -14,17 +25,37 @@ import time
 import logging
 from urllib.parse import urljoin
 import re
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 import csv
 from datetime import datetime
 import os
+from tenacity import Retrying, retry_if_exception_type, retry_if_result, stop_after_attempt
+
+from crawl_journal import CHANGED, CrawlJournal, DISAPPEARED, ERROR, INVALID, NEW, NOT_FOUND, PRODUCT
+from crawl_metrics import CrawlMetrics, HttpTrace
+from image_pipeline import ImagePipeline
+from page_cache import PageCache, content_hash as page_content_hash
+from parse_pipeline import ParsePipeline
+from price_history import PriceHistory
+from product_aggregates import ProductAggregates, aggregates_path, summary_report
+from product_extractors import create_extractor, new_product_record, product_fields
+from product_records import CompactProductStore
+from product_search import ProductSearchIndex
+from product_writers import ParquetProductWriter
+from rate_limiter import (RETRY_BACKOFF, AdaptiveHostLimiter, AimdController,
+                          HostRateLimiter, backoff_delay, is_transient, parse_retry_after)
+from sku_index import AdaptiveProbeScheduler, DEAD, LIVE, LinearProbeScheduler, SkuIndex
 
 class EcommerceMarketScraper:
     """
     A comprehensive scraper for electronics ecommerce market analysis
     """
     
-    def __init__(self, base_url: str = "https://store.nerokas.co.ke/SKU-"):
+    def __init__(self, base_url: str = "https://store.nerokas.co.ke/SKU-", enable_logging: bool = True,
+                 extractor: str = 'fast', journal_path: Optional[str] = None, output_format: str = 'parquet',
+                 history_path: Optional[str] = None, metrics_port: Optional[int] = None, max_attempts: int = 4,
+                 spill_text: bool = False, search_path: Optional[str] = None, cache_dir: Optional[str] = None,
+                 image_dir: Optional[str] = None):
         self.base_url = base_url
         self.session = requests.Session()
         self.session.headers.update({
@@ -36,14 +67,67 @@ class EcommerceMarketScraper:
             'Upgrade-Insecure-Requests': '1'
         })
         
-        # Initialize logging
-        self.setup_logging()
+        # Initialize logging; parser worker processes reuse the parent's handlers instead
+        if enable_logging:
+            self.setup_logging()
+        else:
+            self.logger = logging.getLogger(__name__)
+        
+        # Transient failures (network errors, 429 and 5xx) are retried up to max_attempts in total
+        self.max_attempts = max_attempts
+        self.retry_backoff = RETRY_BACKOFF
+        
+        # Request pacing of the sequential loop, adapted to server feedback
+        self.politeness = AimdController(2.0, 20.0)
+        
+        # Per-stage timings and counters; exported to Prometheus when a port is given
+        self.metrics = CrawlMetrics(metrics_port)
+        
+        # Page extraction backend (see product_extractors.EXTRACTOR_BACKENDS)
+        self.extractor = create_extractor(extractor, self)
         
         # Counters for monitoring
         self.successful_scrapes = 0
         self.failed_scrapes = 0
         self.consecutive_failures = 0
-        self.products_data = []
+        self.unchanged_pages = 0
+        
+        # Start time of the current run, shared by the names of its output files
+        self.run_stamp: Optional[str] = None
+        
+        # Products collected without a journal, stored column-wise; spill_text moves long text to disk
+        self.products_data = CompactProductStore(spill_text)
+        
+        # Optional durable journal; when set, products live there instead of in products_data
+        self.journal = CrawlJournal(journal_path) if journal_path else None
+        self.incremental = False
+        
+        # Products stream to Parquet as they arrive; CSV is an optional end-of-run export.
+        # 'none' writes no files, for shard workers whose results are merged by the coordinator.
+        if output_format not in ('parquet', 'csv', 'both', 'none'):
+            raise ValueError(f"Unknown output format '{output_format}', expected parquet, csv, both or none")
+        self.output_format = output_format
+        self.parquet_writer: Optional[ParquetProductWriter] = None
+        
+        # Report statistics, updated as each product is saved
+        self.aggregates = ProductAggregates()
+        
+        # Optional price time series; every run adds one snapshot
+        self.price_history = PriceHistory(history_path) if history_path else None
+        
+        # Optional keyword and facet search index, holding the latest scrape of every live SKU
+        self.search_index = ProductSearchIndex(search_path) if search_path else None
+        
+        # Optional compressed cache of raw pages, for re-extraction without re-crawling
+        self.page_cache = PageCache(cache_dir) if cache_dir else None
+        
+        # Optional image stage after the crawl: thumbnails and metadata, every image fetched only once
+        self.image_pipeline = (ImagePipeline(image_dir, headers={'User-Agent': self.session.headers['User-Agent']})
+                               if image_dir else None)
+        
+        # Live/dead SKU intervals learned from past runs, kept alongside the journal
+        self.sku_index = SkuIndex(self.journal.conn) if self.journal else None
+        self.index_updates = 0
         
     def setup_logging(self):
         """Setup comprehensive logging for monitoring scraping progress"""
@@ -59,6 +143,9 @@ class EcommerceMarketScraper:
         )
         self.logger = logging.getLogger(__name__)
         
+        # httpx logs every request at INFO, which drowns out the progress lines
+        logging.getLogger('httpx').setLevel(logging.WARNING)
+        
     def is_valid_product_page(self, soup: BeautifulSoup, url: str) -> bool:
         """
         Comprehensive validation to check if page contains valid product data
@@ -91,30 +178,7 @@ class EcommerceMarketScraper:
         """
         Extract comprehensive product data from the HTML soup
         """
-        product_data = {
-            'sku': sku,
-            'url': url,
-            'scraped_at': datetime.now().isoformat(),
-            'product_name': '',
-            'price': '',
-            'price_numeric': 0.0,
-            'currency': 'KES',
-            'product_description': '',
-            'product_features': '',
-            'stock_status': '',
-            'model': '',
-            'brand': '',
-            'manufacturer': '',
-            'category': '',
-            'tags': '',
-            'rating': 0,
-            'review_count': 0,
-            'reviews_text': '',
-            'image_urls': [],
-            'main_image_url': '',
-            'product_labels': '',
-            'specifications': {}
-        }
+        product_data = new_product_record(sku, url)
         
         try:
             # Extract product name
@@ -203,23 +267,12 @@ class EcommerceMarketScraper:
                 if review_match:
                     product_data['review_count'] = int(review_match.group(1))
             
-            # Extract image URLs
-            image_urls = []
-            main_image = soup.find('img', {'alt': product_data['product_name']})
-            if main_image and main_image.get('src'):
-                main_url = urljoin(url, main_image['src'])
-                product_data['main_image_url'] = main_url
-                image_urls.append(main_url)
-            
-            # Get additional images
-            additional_images = soup.find_all('img', {'alt': product_data['product_name']})
-            for img in additional_images[1:]:  # Skip first (main) image
-                if img.get('src'):
-                    img_url = urljoin(url, img['src'])
-                    if img_url not in image_urls:
-                        image_urls.append(img_url)
-            
-            product_data['image_urls'] = image_urls
+            # Extract image URLs: the first product image is the main one, duplicates are dropped in order
+            product_images = soup.find_all('img', {'alt': product_data['product_name']})
+            if product_images and product_images[0].get('src'):
+                product_data['main_image_url'] = urljoin(url, product_images[0]['src'])
+            product_data['image_urls'] = list(dict.fromkeys(urljoin(url, img['src'])
+                                                            for img in product_images if img.get('src')))
             
             # Extract product labels
             labels = soup.find_all('span', class_='product-label')
@@ -243,61 +296,382 @@ class EcommerceMarketScraper:
             
         return product_data
     
-    def scrape_product(self, sku: int) -> Optional[Dict]:
+    def parse_product_page(self, content: bytes, sku: int, url: str) -> Optional[Dict]:
         """
-        Scrape a single product by SKU
+        Validate a downloaded page and extract its product data
+        """
+        product_data = self.extractor.extract(content, sku, url)
+        
+        if product_data is None:
+            self.logger.debug(f"SKU {sku}: Invalid product page")
+            return None
+        
+        if not product_data['product_name']:  # Basic validation
+            self.logger.warning(f"SKU {sku}: No product name found")
+            return None
+        
+        return product_data
+    
+    def classify_response(self, sku: int, url: str, status_code: Optional[int],
+                          content: Optional[bytes]) -> Tuple[str, Optional[Dict]]:
+        """
+        Turn a fetched page into a crawl outcome and, for product pages, the product data
+        """
+        if status_code is None:
+            return ERROR, None
+        if status_code == 404:
+            self.logger.debug(f"SKU {sku}: 404 Not Found")
+            return NOT_FOUND, None
+        elif status_code != 200:
+            self.logger.warning(f"SKU {sku}: HTTP {status_code}")
+            return ERROR, None
+        
+        try:
+            product_data = self.parse_product_page(content, sku, url)
+        except Exception as e:
+            self.logger.error(f"Unexpected error for SKU {sku}: {str(e)}")
+            return ERROR, None
+        
+        return (PRODUCT, product_data) if product_data else (INVALID, None)
+    
+    def previous_page_state(self, sku: int) -> Optional[Dict]:
+        """
+        Journaled page state for a SKU when running incrementally
+        """
+        if not (self.incremental and self.journal):
+            return None
+        return self.journal.page_state(sku)
+    
+    @staticmethod
+    def conditional_headers(previous: Optional[Dict]) -> Dict[str, str]:
+        """
+        If-None-Match / If-Modified-Since headers from the validators of the last crawl
+        """
+        headers = {}
+        if previous:
+            if previous['etag']:
+                headers['If-None-Match'] = previous['etag']
+            if previous['last_modified']:
+                headers['If-Modified-Since'] = previous['last_modified']
+        return headers
+    
+    def cache_page(self, sku: int, url: str, content: Optional[bytes], content_hash: Optional[str]):
+        """
+        Keep the body of a 200 response in the page cache, if there is one
+        """
+        if self.page_cache and content_hash:
+            self.page_cache.put(sku, url, content, content_hash)
+    
+    def is_unchanged(self, status_code: Optional[int], content_hash: Optional[str],
+                     previous: Optional[Dict]) -> bool:
+        """
+        Whether the page is known to be unchanged: a 304, or a body identical to the last crawl
+        """
+        if not previous or not previous['product']:
+            return False
+        return status_code == 304 or (status_code == 200 and content_hash == previous['content_hash'])
+    
+    def reuse_product(self, sku: int, previous: Dict) -> Dict:
+        """
+        Product data of an unchanged page, carried over from the last crawl
+        """
+        self.unchanged_pages += 1
+        self.logger.debug(f"SKU {sku}: unchanged since last crawl")
+        product_data = dict(previous['product'])
+        product_data['scraped_at'] = datetime.now().isoformat()
+        return product_data
+    
+    def refresh_validators(self, sku: int, status_code: int, previous: Dict, response_headers: Optional[Dict]):
+        """
+        Store the validators an unchanged page came back with, so the next crawl sends the current ones
+        
+        A 304 may leave out validators that still hold; a 200 with the same body replaces them.
+        """
+        headers = response_headers or {}
+        etag, last_modified = headers.get('ETag'), headers.get('Last-Modified')
+        if status_code == 304:
+            etag, last_modified = etag or previous['etag'], last_modified or previous['last_modified']
+        if (etag, last_modified) != (previous['etag'], previous['last_modified']):
+            self.journal.update_validators(sku, etag, last_modified)
+    
+    def update_page_state(self, sku: int, outcome: str, product_data: Optional[Dict], previous: Optional[Dict],
+                          response_headers: Optional[Dict], content_hash: Optional[str]):
+        """
+        Store the validators and body hash of a freshly parsed page and record how the product changed
+        """
+        if not self.journal:
+            return
+        
+        change_type = None
+        if outcome == PRODUCT:
+            headers = response_headers or {}
+            self.journal.update_page_state(sku, headers.get('ETag'), headers.get('Last-Modified'),
+                                           content_hash, product_data)
+            if not previous or not previous['product']:
+                change_type = NEW
+            elif product_fields(previous['product']) != product_fields(product_data):
+                change_type = CHANGED
+        elif outcome in (NOT_FOUND, INVALID) and previous:
+            self.journal.remove_page_state(sku)
+            if previous['product']:
+                change_type, product_data = DISAPPEARED, previous['product']
+        
+        if change_type and self.incremental:
+            self.journal.record_change(sku, change_type, product_data)
+    
+    def settle_response(self, sku: int, url: str, status_code: Optional[int], content: Optional[bytes],
+                        response_headers: Optional[Dict] = None,
+                        previous: Optional[Dict] = None) -> Tuple[str, Optional[Dict]]:
+        """
+        Classify a fetched page, skipping the parse when it is unchanged since the last crawl
+        """
+        content_hash = page_content_hash(content) if status_code == 200 else None
+        self.cache_page(sku, url, content, content_hash)
+        if self.is_unchanged(status_code, content_hash, previous):
+            self.refresh_validators(sku, status_code, previous, response_headers)
+            return PRODUCT, self.reuse_product(sku, previous)
+        
+        outcome, product_data = self.classify_response(sku, url, status_code, content)
+        self.update_page_state(sku, outcome, product_data, previous, response_headers, content_hash)
+        return outcome, product_data
+    
+    def scrape_product_with_outcome(self, sku: int) -> Tuple[str, Optional[Dict]]:
+        """
+        Scrape a single product by SKU, also reporting the crawl outcome
         """
         url = f"{self.base_url}{sku}"
         
         try:
-            response = self.session.get(url, timeout=10)
-            
-            if response.status_code == 404:
-                self.logger.debug(f"SKU {sku}: 404 Not Found")
-                return None
-            elif response.status_code != 200:
-                self.logger.warning(f"SKU {sku}: HTTP {response.status_code}")
-                return None
+            previous = self.previous_page_state(sku)
+            response, content = self.fetch_with_retries(url, self.conditional_headers(previous))
             
-            soup = BeautifulSoup(response.content, 'html.parser')
+            outcome, product_data = self.settle_response(sku, url, response.status_code, content,
+                                                         response.headers, previous)
             
-            if not self.is_valid_product_page(soup, url):
-                self.logger.debug(f"SKU {sku}: Invalid product page")
-                return None
-            
-            product_data = self.extract_product_data(soup, sku, url)
-            
-            if product_data['product_name']:  # Basic validation
+            if product_data:
                 self.successful_scrapes += 1
                 self.consecutive_failures = 0
                 self.logger.info(f"Successfully scraped SKU {sku}: {product_data['product_name']}")
-                return product_data
-            else:
-                self.logger.warning(f"SKU {sku}: No product name found")
-                return None
+            return outcome, product_data
                 
         except requests.exceptions.RequestException as e:
             self.logger.error(f"Network error for SKU {sku}: {str(e)}")
-            return None
+            return ERROR, None
         except Exception as e:
             self.logger.error(f"Unexpected error for SKU {sku}: {str(e)}")
-            return None
+            return ERROR, None
     
-    def save_to_csv(self, filename: str = None):
+    def fetch_page(self, url: str, headers: Optional[Dict] = None) -> Tuple[requests.Response, bytes]:
         """
-        Save collected data to CSV with optimal structure for ecommerce analysis
+        One timed GET of a page, reported to the request pacing controller
         """
-        if not filename:
-            filename = f"ecommerce_products_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        started = time.perf_counter()
+        try:
+            # Streaming splits the request (connect and time to first byte) from the body download
+            with self.metrics.time('ttfb'):
+                response = self.session.get(url, timeout=10, headers=headers, stream=True)
+            with self.metrics.time('download'):
+                content = response.content
+        except requests.exceptions.RequestException:
+            self.metrics.count_response(None)
+            self.politeness.on_response(None)
+            raise
         
-        if not self.products_data:
-            self.logger.warning("No product data to save")
-            return
+        self.metrics.count_response(response.status_code, len(content))
+        self.politeness.on_response(response.status_code, time.perf_counter() - started)
+        return response, content
+    
+    def fetch_with_retries(self, url: str, headers: Optional[Dict] = None) -> Tuple[requests.Response, bytes]:
+        """
+        fetch_page, retrying network errors, 429 and 5xx with jittered exponential backoff
+        
+        When attempts run out, the last response is returned or the last network error raised.
+        """
+        retrying = Retrying(
+            stop=stop_after_attempt(self.max_attempts),
+            wait=self.retry_wait,
+            retry=(retry_if_exception_type(requests.exceptions.RequestException)
+                   | retry_if_result(lambda result: is_transient(result[0].status_code))),
+            before_sleep=self.log_retry,
+            retry_error_callback=lambda retry_state: retry_state.outcome.result(),
+        )
+        return retrying(self.fetch_page, url, headers)
+    
+    def retry_wait(self, retry_state) -> float:
+        """
+        Backoff before the next attempt, stretched to the server's Retry-After when it sent one
+        """
+        delay = self.retry_backoff(retry_state)
+        if not retry_state.outcome.failed:
+            response = retry_state.outcome.result()[0]
+            delay = max(delay, parse_retry_after(response.headers.get('Retry-After')) or 0)
+        return delay
+    
+    def log_retry(self, retry_state):
+        self.metrics.count_retry()
+        url = retry_state.args[0]
+        if retry_state.outcome.failed:
+            reason = str(retry_state.outcome.exception())
+        else:
+            reason = f"HTTP {retry_state.outcome.result()[0].status_code}"
+        self.logger.warning(f"Retrying {url} in {retry_state.next_action.sleep:.1f}s "
+                            f"(attempt {retry_state.attempt_number} failed: {reason})")
+    
+    def scrape_product(self, sku: int) -> Optional[Dict]:
+        """
+        Scrape a single product by SKU
+        """
+        return self.scrape_product_with_outcome(sku)[1]
+    
+    async def fetch_page_async(self, client: httpx.AsyncClient, limiter: HostRateLimiter, sku: int,
+                               headers: Optional[Dict] = None) -> Tuple[str, Optional[int], Optional[bytes], Dict]:
+        """
+        Download a single product page by SKU; returns the URL, status code, body and response headers
+        
+        The status code is None when the request itself failed.
+        """
+        url = f"{self.base_url}{sku}"
+        status_code, response_headers = None, {}
+        
+        await limiter.acquire(url)
+        started = time.perf_counter()
+        try:
+            response = await client.get(url, headers=headers, extensions={'trace': HttpTrace(self.metrics)})
+            status_code, response_headers = response.status_code, response.headers
+            self.metrics.count_response(status_code, len(response.content))
+            return url, status_code, response.content, response_headers
+            
+        except httpx.HTTPError as e:
+            self.logger.error(f"Network error for SKU {sku}: {str(e)}")
+            self.metrics.count_response(None)
+            return url, None, None, {}
+        except Exception as e:
+            self.logger.error(f"Unexpected error for SKU {sku}: {str(e)}")
+            return url, None, None, {}
+        finally:
+            # Feedback for the adaptive limiter; also frees the host's concurrency slot
+            await limiter.release(url, status_code, time.perf_counter() - started,
+                                  parse_retry_after(response_headers.get('Retry-After')))
+    
+    def record_outcome(self, sku: int, outcome: str, product_data: Optional[Dict] = None):
+        """
+        Persist a SKU outcome to the crawl journal, or keep the product in memory without one
+        """
+        self.metrics.count_outcome(outcome)
+        with self.metrics.time('record'):
+            self.store_outcome(sku, outcome, product_data)
+    
+    def store_outcome(self, sku: int, outcome: str, product_data: Optional[Dict]):
+        if self.journal:
+            self.journal.record(sku, outcome, product_data)
+        elif product_data:
+            self.products_data.append(product_data)
+        
+        if product_data:
+            self.aggregates.add(product_data)
+            if self.parquet_writer:
+                self.parquet_writer.write(product_data)
+            if self.price_history:
+                self.price_history.record(product_data)
+            if self.search_index:
+                self.search_index.add(product_data)
+        elif self.search_index and outcome in (NOT_FOUND, INVALID):
+            self.search_index.remove(sku)
+        
+        if self.sku_index and outcome != ERROR:
+            self.sku_index.mark(sku, LIVE if outcome == PRODUCT else DEAD)
+            self.index_updates += 1
+            if self.index_updates % 1000 == 0:
+                self.sku_index.save()
+    
+    def collected_products(self) -> Iterable[Dict]:
+        """
+        All products collected so far, streamed from the journal when there is one
+        """
+        return self.journal.iter_products() if self.journal else self.products_data
+    
+    def collected_count(self) -> int:
+        return self.journal.product_count() if self.journal else len(self.products_data)
+    
+    def create_scheduler(self, start_sku: int, max_sku: int, max_consecutive_failures: int,
+                         adaptive: bool = False):
+        """
+        Probe scheduler for a run: linear, or adaptive when a SKU index is available
+        """
+        if adaptive and self.sku_index:
+            counts = self.sku_index.counts()
+            self.logger.info(f"Adaptive probing: index knows {counts[LIVE]} live and {counts[DEAD]} dead SKUs")
+            return AdaptiveProbeScheduler(self.sku_index, start_sku, max_sku, max_consecutive_failures)
+        if adaptive:
+            self.logger.warning("Adaptive probing needs a crawl journal; falling back to a linear scan")
+        return LinearProbeScheduler(start_sku, max_sku, max_consecutive_failures)
+    
+    def open_product_stream(self, resume: bool = False):
+        """
+        Start this run's Parquet output, aggregates, price snapshot and search updates
+        
+        A resumed run first replays the products already journaled.
+        """
+        self.aggregates = ProductAggregates()
+        # One timestamp names every output of the run, so its Parquet and CSV files share a stem
+        self.run_stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        if self.output_format in ('parquet', 'both'):
+            filename = self.output_filename('parquet')
+            self.parquet_writer = ParquetProductWriter(filename)
+        if self.price_history:
+            # A resumed run adds to its own snapshot, recorded in the journal, never just the newest one
+            snapshot = self.journal.price_snapshot() if resume and self.journal else None
+            snapshot = self.price_history.start_snapshot(snapshot)
+            if self.journal:
+                self.journal.set_price_snapshot(snapshot)
+        
+        if resume and self.journal:
+            for product in self.journal.iter_products():
+                self.aggregates.add(product)
+                if self.parquet_writer:
+                    self.parquet_writer.write(product)
+                if self.price_history:
+                    self.price_history.record(product)
+                if self.search_index:
+                    self.search_index.add(product)
+    
+    def current_aggregates(self) -> ProductAggregates:
+        """
+        Aggregates over all collected products, rebuilt if products were collected outside a run
+        """
+        if self.aggregates.product_count != self.collected_count():
+            self.aggregates = ProductAggregates()
+            for product in self.collected_products():
+                self.aggregates.add(product)
+        return self.aggregates
+    
+    def load_settled_outcomes(self, start_sku: int, max_sku: int, resume: bool,
+                              max_consecutive_failures: int = 100) -> Dict[int, bool]:
+        """
+        SKUs a resumed run can skip, mapped to whether they were products; a fresh run clears the journal
+        and records its SKU range there for `cli.py resume`
+        """
+        if not self.journal:
+            return {}
+        if not resume:
+            self.journal.clear()
+            self.journal.set_crawl_range(start_sku, max_sku, max_consecutive_failures)
+            return {}
         
+        settled = self.journal.settled_outcomes(start_sku, max_sku)
+        self.logger.info(f"Resuming: {len(settled)} SKUs already settled in {self.journal.path}")
+        return settled
+    
+    def build_products_frame(self, products: Iterable[Dict]) -> pd.DataFrame:
+        """
+        Flatten product records into a DataFrame with analysis-friendly column order
+        
+        The records are flattened in place; both the product store and the journal build fresh
+        dicts on every read.
+        """
         # Flatten specifications for CSV
         flattened_data = []
-        for product in self.products_data:
-            flat_product = product.copy()
+        for flat_product in products:
             
             # Convert specifications dict to separate columns
             if 'specifications' in flat_product and isinstance(flat_product['specifications'], dict):
@@ -315,7 +689,7 @@ class EcommerceMarketScraper:
         
         # Optimize column order for analysis
         priority_columns = [
-            'sku', 'product_name', 'price', 'price_numeric', 'currency',
+            'change_type', 'sku', 'product_name', 'price', 'price_numeric', 'currency',
             'stock_status', 'brand', 'manufacturer', 'category', 'model',
             'rating', 'review_count', 'product_labels', 'tags',
             'product_description', 'product_features', 'main_image_url',
@@ -325,143 +699,337 @@ class EcommerceMarketScraper:
         # Reorder columns
         other_columns = [col for col in df.columns if col not in priority_columns]
         ordered_columns = [col for col in priority_columns if col in df.columns] + other_columns
-        df = df[ordered_columns]
+        return df[ordered_columns]
+    
+    def output_filename(self, extension: str) -> str:
+        """
+        Product output file name, stamped with the run's start time (or now, outside a run)
+        """
+        stamp = self.run_stamp or datetime.now().strftime('%Y%m%d_%H%M%S')
+        return f"ecommerce_products_{stamp}.{extension}"
+    
+    def save_to_csv(self, filename: str = None) -> Optional[str]:
+        """
+        Save collected data to CSV with optimal structure for ecommerce analysis; returns the file name
+        """
+        if not filename:
+            filename = self.output_filename('csv')
         
-        df.to_csv(filename, index=False, encoding='utf-8')
+        if not self.collected_count():
+            self.logger.warning("No product data to save")
+            return
+        
+        with self.metrics.time('save_csv'):
+            df = self.build_products_frame(self.collected_products())
+            df.to_csv(filename, index=False, encoding='utf-8')
         self.logger.info(f"Saved {len(df)} products to {filename}")
         
         # Create summary statistics
-        self.create_summary_report(df, filename.replace('.csv', '_summary.txt'))
+        self.create_summary_report(self.current_aggregates(), filename.replace('.csv', '_summary.txt'),
+                                   df['price_numeric'].median() if 'price_numeric' in df else None)
+        return filename
+    
+    def save_results(self, save_profile: bool = True):
+        """
+        Close the Parquet stream, then write the optional CSV export, the aggregates, the summary report
+        and, for a crawl, the crawl profile
+        """
+        if self.price_history:
+            self.price_history.flush()
+        if self.search_index:
+            self.search_index.optimize()
+        if self.page_cache:
+            self.page_cache.flush()
+        
+        parquet_path = None
+        if self.parquet_writer:
+            self.parquet_writer.close()
+            if self.parquet_writer.rows_written:
+                parquet_path = self.parquet_writer.path
+                self.logger.info(f"Saved {self.parquet_writer.rows_written} products to {parquet_path}")
+            else:
+                os.remove(self.parquet_writer.path)
+            self.parquet_writer = None
+        
+        csv_path = self.save_to_csv() if self.output_format in ('csv', 'both') else None
+        output_path = parquet_path or csv_path
+        if output_path:
+            # The dashboard reads these instead of recomputing them from the rows
+            aggregates = self.current_aggregates()
+            aggregates.save(aggregates_path(output_path))
+            if not csv_path:
+                # One column of the file just written is enough for the exact median
+                prices = pd.read_parquet(parquet_path, columns=['price_numeric'])['price_numeric']
+                self.create_summary_report(aggregates, parquet_path.replace('.parquet', '_summary.txt'),
+                                           prices.median())
+        
+        # Where the run spent its time, stage by stage
+        if not save_profile:
+            return
+        profile_path = f"ecommerce_profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        self.metrics.save_profile(profile_path)
+        self.logger.info(f"Saved crawl profile to {profile_path}")
+    
+    def save_delta_csv(self, filename: str = None):
+        """
+        Save the new, changed and disappeared products of an incremental crawl
+        """
+        if not filename:
+            filename = f"ecommerce_delta_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        
+        df = self.build_products_frame(self.journal.iter_changes())
+        if df.empty:
+            self.logger.info("No product changes since the last crawl")
+            return
+        
+        df.to_csv(filename, index=False, encoding='utf-8')
+        self.logger.info(f"Saved {len(df)} changed products to {filename}")
     
-    def create_summary_report(self, df: pd.DataFrame, filename: str):
+    def create_summary_report(self, aggregates: ProductAggregates, filename: str,
+                              median_price: Optional[float] = None):
         """
         Create a summary report for business analysis
         """
         with open(filename, 'w') as f:
-            f.write("ECOMMERCE MARKET ANALYSIS SUMMARY REPORT\n")
-            f.write("=" * 50 + "\n\n")
-            f.write(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-            
-            f.write("DATASET OVERVIEW:\n")
-            f.write(f"Total products scraped: {len(df)}\n")
-            f.write(f"Successful scrapes: {self.successful_scrapes}\n")
-            f.write(f"Failed scrapes: {self.failed_scrapes}\n\n")
-            
-            if len(df) > 0:
-                f.write("PRICE ANALYSIS:\n")
-                f.write(f"Average price: {df['price_numeric'].mean():.2f} KES\n")
-                f.write(f"Median price: {df['price_numeric'].median():.2f} KES\n")
-                f.write(f"Price range: {df['price_numeric'].min():.2f} - {df['price_numeric'].max():.2f} KES\n\n")
-                
-                f.write("BRAND DISTRIBUTION:\n")
-                brand_counts = df['brand'].value_counts().head(10)
-                for brand, count in brand_counts.items():
-                    f.write(f"{brand}: {count} products\n")
-                f.write("\n")
-                
-                f.write("CATEGORY DISTRIBUTION:\n")
-                category_counts = df['category'].value_counts().head(10)
-                for category, count in category_counts.items():
-                    f.write(f"{category}: {count} products\n")
-                f.write("\n")
-                
-                f.write("STOCK STATUS:\n")
-                stock_counts = df['stock_status'].value_counts()
-                for status, count in stock_counts.items():
-                    f.write(f"{status}: {count} products\n")
+            f.write(summary_report(aggregates, self.successful_scrapes, self.failed_scrapes, median_price))
     
-    def run_market_analysis(self, start_sku: int = 0, max_sku: int = 50000, max_consecutive_failures: int = 100):
+    def run_market_analysis(self, start_sku: int = 0, max_sku: int = 50000, max_consecutive_failures: int = 100,
+                            resume: bool = False, incremental: bool = False, adaptive: bool = False,
+                            requests_per_second: float = 2.0, max_requests_per_second: Optional[float] = None):
         """
         Main method to run the comprehensive market analysis
+        
+        With a crawl journal and resume=True, SKUs settled by an earlier run are
+        replayed from the journal instead of being fetched again. With
+        incremental=True, pages are requested conditionally and only re-parsed
+        when their body changed; new, changed and disappeared products are
+        written to a separate delta CSV. With adaptive=True, the SKU index from
+        earlier runs decides the probe order (see AdaptiveProbeScheduler) and
+        the consecutive-failure limit only applies to never-probed SKUs.
+        
+        Requests are paced by an AIMD controller: starting at
+        requests_per_second, the delay between requests shrinks while the
+        server answers promptly (up to max_requests_per_second, default 10x)
+        and doubles on 429/5xx responses, network errors or rising latency.
+        Transient failures are retried with backoff (see fetch_with_retries).
         """
         self.logger.info(f"Starting market analysis scraping from SKU {start_sku} to {max_sku}")
         self.logger.info(f"Will stop after {max_consecutive_failures} consecutive failures")
         
+        self.incremental = incremental
+        settled = self.load_settled_outcomes(start_sku, max_sku, resume, max_consecutive_failures)
+        self.open_product_stream(resume)
+        self.metrics.start_run()
+        scheduler = self.create_scheduler(start_sku, max_sku, max_consecutive_failures, adaptive)
+        self.politeness = AimdController(requests_per_second, max_requests_per_second or requests_per_second * 10)
         page_count = 0
         
-        for sku in range(start_sku, max_sku + 1):
-            # Rate limiting: 3 second delay after every 100 pages
-            if page_count > 0 and page_count % 100 == 0:
-                self.logger.info(f"Rate limiting: Sleeping for 3 seconds after {page_count} requests")
-                time.sleep(3)
+        while True:
+            sku = scheduler.next_sku()
+            if sku is None:
+                break
             
-            product_data = self.scrape_product(sku)
+            if sku in settled:
+                # Replay the journaled outcome so the failure run carries on where it stopped
+                is_product = settled[sku]
+            else:
+                outcome, product_data = self.scrape_product_with_outcome(sku)
+                self.record_outcome(sku, outcome, product_data)
+                is_product = product_data is not None
+                
+                if not is_product:
+                    self.failed_scrapes += 1
+                
+                page_count += 1
+                
+                # Progress reporting
+                if page_count % 50 == 0:
+                    self.logger.info(f"Progress: {page_count} pages processed, {self.collected_count()} products found, "
+                                     f"{self.metrics.pages_per_second:.1f} pages/s")
+            
+            # Stop condition, applied by the scheduler
+            if scheduler.report(sku, is_product):
+                self.logger.info(f"Stopping: {max_consecutive_failures} consecutive failures reached")
+            self.consecutive_failures = scheduler.consecutive_failures
             
+            # Delay between requests, adapted to how the server is coping
+            if sku not in settled:
+                time.sleep(self.politeness.interval)
+        
+        if self.image_pipeline:
+            asyncio.run(self.image_pipeline.run(self.collected_products()))
+        self.finish_market_analysis()
+    
+    async def run_market_analysis_async(self, start_sku: int = 0, max_sku: int = 50000,
+                                        max_consecutive_failures: int = 100, concurrency: int = 10,
+                                        requests_per_second: float = 2.0, burst: Optional[float] = None,
+                                        parser_processes: int = 0, parse_queue_size: int = 100,
+                                        resume: bool = False, incremental: bool = False,
+                                        adaptive: bool = False, adaptive_rate: bool = True,
+                                        max_requests_per_second: Optional[float] = None):
+        """
+        Concurrent variant of run_market_analysis using a bounded pool of async workers
+        
+        All workers share one per-host token bucket with an explicit
+        requests_per_second budget. With parser_processes > 0, fetched pages
+        are handed to a process pool through a bounded queue so HTML parsing
+        never blocks the network loop. See run_market_analysis for resume,
+        incremental and adaptive.
+        
+        With adaptive_rate=True, requests_per_second and concurrency are
+        starting points and ceilings (max_requests_per_second, default 10x)
+        for AIMD control from latency, 429/503 responses and Retry-After (see
+        AdaptiveHostLimiter). SKUs whose fetch failed transiently wait in a
+        retry queue with jittered exponential backoff while the workers carry
+        on with other SKUs; only after max_attempts do they count as errors.
+        """
+        await self.crawl_async(start_sku, max_sku, max_consecutive_failures, concurrency, requests_per_second, burst,
+                               parser_processes, parse_queue_size, resume, incremental, adaptive, adaptive_rate,
+                               max_requests_per_second)
+        if self.image_pipeline:
+            await self.image_pipeline.run(self.collected_products())
+        self.finish_market_analysis()
+    
+    async def crawl_async(self, start_sku: int = 0, max_sku: int = 50000,
+                          max_consecutive_failures: int = 100, concurrency: int = 10,
+                          requests_per_second: float = 2.0, burst: Optional[float] = None,
+                          parser_processes: int = 0, parse_queue_size: int = 100,
+                          resume: bool = False, incremental: bool = False,
+                          adaptive: bool = False, adaptive_rate: bool = True,
+                          max_requests_per_second: Optional[float] = None):
+        """
+        Crawl loop of run_market_analysis_async, without writing the end-of-run outputs
+        """
+        self.logger.info(f"Starting async market analysis from SKU {start_sku} to {max_sku} "
+                         f"with {concurrency} workers at {requests_per_second} req/s")
+        self.logger.info(f"Will stop after {max_consecutive_failures} consecutive failures")
+        
+        burst = burst if burst is not None else concurrency
+        if adaptive_rate:
+            limiter = AdaptiveHostLimiter(requests_per_second, max_requests_per_second, concurrency, burst)
+        else:
+            limiter = HostRateLimiter(requests_per_second, burst)
+        self.incremental = incremental
+        settled = self.load_settled_outcomes(start_sku, max_sku, resume, max_consecutive_failures)
+        self.open_product_stream(resume)
+        self.metrics.start_run()
+        scheduler = self.create_scheduler(start_sku, max_sku, max_consecutive_failures, adaptive)
+        page_count = 0
+        
+        # Incremental state of pages waiting in the parse pipeline, by SKU
+        pending_state: Dict[int, Tuple[Optional[Dict], Dict, str]] = {}
+        
+        # SKUs waiting to be retried as a heap of (due time, sku), and failed attempts so far
+        retries: List[Tuple[float, int]] = []
+        attempts: Dict[int, int] = {}
+        
+        def record_result(sku: int, outcome: str, product_data: Optional[Dict]):
+            nonlocal page_count
+            if sku in pending_state:
+                self.update_page_state(sku, outcome, product_data, *pending_state.pop(sku))
+            self.record_outcome(sku, outcome, product_data)
             if product_data:
-                self.products_data.append(product_data)
-                self.consecutive_failures = 0
+                self.successful_scrapes += 1
+                self.logger.info(f"Successfully scraped SKU {sku}: {product_data['product_name']}")
             else:
                 self.failed_scrapes += 1
-                self.consecutive_failures += 1
             
             page_count += 1
-            
-            # Progress reporting
             if page_count % 50 == 0:
-                self.logger.info(f"Progress: {page_count} pages processed, {len(self.products_data)} products found")
+                self.logger.info(f"Progress: {page_count} pages processed, {self.collected_count()} products found, "
+                                 f"{self.metrics.pages_per_second:.1f} pages/s")
             
-            # Stop condition
-            if self.consecutive_failures >= max_consecutive_failures:
+            # Stop condition, evaluated in dispatch order rather than completion order
+            if scheduler.report(sku, product_data is not None):
                 self.logger.info(f"Stopping: {max_consecutive_failures} consecutive failures reached")
-                break
-            
-            # Small delay between requests
-            time.sleep(0.5)
+            self.consecutive_failures = scheduler.consecutive_failures
+        
+        pipeline = None
+        if parser_processes > 0:
+            pipeline = ParsePipeline(self.base_url, parser_processes, parse_queue_size,
+                                     extractor=self.extractor.name, metrics=self.metrics)
+            pipeline.start(record_result)
         
-        # Save results
-        if self.products_data:
-            self.save_to_csv()
-            self.logger.info(f"Market analysis complete! Collected {len(self.products_data)} products")
+        async def worker(client: httpx.AsyncClient):
+            while True:
+                if retries and retries[0][0] <= time.monotonic():
+                    sku = heapq.heappop(retries)[1]
+                else:
+                    sku = scheduler.next_sku()
+                    if sku is None:
+                        if scheduler.exhausted and not retries:
+                            return
+                        # Results still in flight may schedule more SKUs (adaptive backfill) or retries
+                        await asyncio.sleep(0.05)
+                        continue
+                    
+                    if sku in settled:
+                        # Replay the journaled outcome without fetching
+                        scheduler.report(sku, settled[sku])
+                        continue
+                
+                previous = self.previous_page_state(sku)
+                url, status_code, content, response_headers = await self.fetch_page_async(
+                    client, limiter, sku, self.conditional_headers(previous))
+                
+                if is_transient(status_code) and attempts.get(sku, 1) < self.max_attempts:
+                    attempt = attempts.get(sku, 1)
+                    attempts[sku] = attempt + 1
+                    delay = max(backoff_delay(attempt), parse_retry_after(response_headers.get('Retry-After')) or 0)
+                    self.metrics.count_retry()
+                    self.logger.warning(f"Retrying SKU {sku} in {delay:.1f}s (attempt {attempt} failed: "
+                                        f"{'HTTP ' + str(status_code) if status_code else 'network error'})")
+                    heapq.heappush(retries, (time.monotonic() + delay, sku))
+                    continue
+                attempts.pop(sku, None)
+                
+                content_hash = page_content_hash(content) if status_code == 200 else None
+                if pipeline and status_code == 200 and not self.is_unchanged(status_code, content_hash, previous):
+                    self.cache_page(sku, url, content, content_hash)
+                    pending_state[sku] = (previous, response_headers, content_hash)
+                    # Blocks while the parse queue is full, throttling the fetchers
+                    await pipeline.put(sku, url, content)
+                else:
+                    record_result(sku, *self.settle_response(sku, url, status_code, content,
+                                                                  response_headers, previous))
+        
+        try:
+            async with httpx.AsyncClient(headers=dict(self.session.headers), timeout=10,
+                                         follow_redirects=True,
+                                         limits=httpx.Limits(max_connections=concurrency)) as client:
+                await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        finally:
+            if pipeline:
+                await pipeline.close()
+        
+        if adaptive_rate:
+            for host, controller in limiter.controllers.items():
+                self.logger.info(f"Adaptive rate for {host} settled at {controller.rate:.1f} req/s "
+                                 f"with {controller.concurrency_limit} concurrent requests")
+    
+    def finish_market_analysis(self):
+        """
+        Save the collected results at the end of a run
+        """
+        if self.sku_index:
+            self.sku_index.save()
+        
+        product_count = self.collected_count()
+        self.save_results()
+        if product_count:
+            self.logger.info(f"Market analysis complete! Collected {product_count} products")
         else:
             self.logger.warning("No products were successfully scraped")
+        
+        if self.incremental and self.journal:
+            self.logger.info(f"Incremental crawl: {self.unchanged_pages} pages unchanged, "
+                             f"changes: {self.journal.change_counts()}")
+            self.save_delta_csv()
 
 def main():
     """
-    Main execution function following CRISP-DM methodology
+    Run the command-line interface; see cli.py for the subcommands and their options
     """
-    print("Electronics Ecommerce Market Analysis Tool")
-    print("Following CRISP-DM Methodology for Business Understanding")
-    print("-" * 60)
-    
-    # Business Understanding Phase
-    print("PHASE 1: Business Understanding")
-    print("Market: Integrated circuits, sensors, and microcontrollers")
-    print("Goal: Comprehensive market analysis for new business entry")
-    print("Data Source: Electronics ecommerce platform")
-    print()
-    
-    # Data Understanding Phase
-    print("PHASE 2: Data Understanding & Collection")
-    
-    # Initialize scraper
-    scraper = EcommerceMarketScraper()
-    
-    # Allow user customization
-    start_sku = int(input("Enter starting SKU (default 0): ") or "0")
-    max_sku = int(input("Enter maximum SKU to check (default 50000): ") or "50000")
-    max_failures = int(input("Enter max consecutive failures before stopping (default 100): ") or "100")
-    
-    print(f"\nStarting scraping from SKU {start_sku} to {max_sku}")
-    print(f"Will stop after {max_failures} consecutive failures")
-    print("Implementing 3-second delay after every 100 requests")
-    print("-" * 60)
-    
-    # Run the analysis
-    try:
-        scraper.run_market_analysis(start_sku, max_sku, max_failures)
-        print("\nMarket analysis completed successfully!")
-        print("Check the generated CSV file and summary report for detailed results.")
-        
-    except KeyboardInterrupt:
-        print("\nScraping interrupted by user")
-        if scraper.products_data:
-            scraper.save_to_csv()
-            print("Partial data saved to CSV")
-    except Exception as e:
-        print(f"Error during scraping: {str(e)}")
-        if scraper.products_data:
-            scraper.save_to_csv()
-            print("Partial data saved to CSV")
+    import cli
 
-if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(cli.main())
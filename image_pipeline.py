@@ -0,0 +1,288 @@
+"""
+Product image stage: concurrent, deduplicated downloads with thumbnails and image metadata
+
+Author: Business Analytics Team
+Purpose: Fetch every product image once, ever, and describe it (size, format, perceptual hash) for catalog analysis
+"""
+
+import argparse
+import asyncio
+import io
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import httpx
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+from page_cache import content_hash
+from rate_limiter import AdaptiveHostLimiter, backoff_delay, is_transient, parse_retry_after
+
+# Side of the square a thumbnail is fitted into, in pixels
+THUMBNAIL_SIZE = 256
+
+# Perceptual hash: DCT of a 32x32 grayscale image, keeping the 8x8 lowest frequencies
+PHASH_IMAGE_SIZE = 32
+PHASH_SIZE = 8
+_k = np.arange(PHASH_IMAGE_SIZE)[:, None]
+_i = np.arange(PHASH_IMAGE_SIZE)[None, :]
+DCT_MATRIX = np.sqrt(2 / PHASH_IMAGE_SIZE) * np.cos(np.pi * (2 * _i + 1) * _k / (2 * PHASH_IMAGE_SIZE))
+DCT_MATRIX[0] /= np.sqrt(2)
+
+
+def perceptual_hash(image: Image.Image) -> str:
+    """
+    64-bit DCT perceptual hash as 16 hex digits; near-identical images differ in few bits
+    """
+    gray = image.convert('L').resize((PHASH_IMAGE_SIZE, PHASH_IMAGE_SIZE), Image.Resampling.LANCZOS)
+    dct = DCT_MATRIX @ np.asarray(gray, dtype=np.float64) @ DCT_MATRIX.T
+    low = dct[:PHASH_SIZE, :PHASH_SIZE].flatten()
+    # The DC term only carries overall brightness, so it is left out of the median
+    bits = low > np.median(low[1:])
+    return f"{int(''.join('1' if bit else '0' for bit in bits), 2):016x}"
+
+
+def hamming_distance(hash_a: str, hash_b: str) -> int:
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count('1')
+
+
+def image_urls_of(product: Dict) -> List[str]:
+    """
+    Distinct image URLs of a product, main image first
+    """
+    urls = product.get('image_urls') or []
+    if isinstance(urls, str):  # CSV exports join the list with '|'
+        urls = urls.split('|')
+    return list(dict.fromkeys(url for url in [product.get('main_image_url'), *urls] if url))
+
+
+class ImagePipeline:
+    """
+    Downloads product images through one pooled HTTP client and records them in SQLite
+
+    Every URL is fetched at most once across runs: successes and permanent
+    failures (404 and the like) are remembered, only transient failures are
+    tried again by a later run. Bodies are keyed by content hash, so the
+    same picture under several URLs or SKUs gets one thumbnail and one
+    metadata row. Requests share a per-host adaptive rate limit with the
+    same AIMD behaviour as the page crawl.
+    """
+
+    def __init__(self, directory: str = "images", concurrency: int = 8, requests_per_second: float = 5.0,
+                 max_attempts: int = 3, thumbnail_size: int = THUMBNAIL_SIZE, headers: Optional[Dict] = None,
+                 batch_size: int = 100):
+        self.directory = directory
+        self.concurrency = concurrency
+        self.requests_per_second = requests_per_second
+        self.max_attempts = max_attempts
+        self.thumbnail_size = thumbnail_size
+        self.headers = headers or {}
+        self.batch_size = batch_size
+        self.logger = logging.getLogger(__name__)
+        os.makedirs(os.path.join(directory, 'thumbnails'), exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(directory, 'images.db'))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS image_urls (
+                url TEXT PRIMARY KEY,
+                status_code INTEGER,
+                hash TEXT,
+                fetched_at TEXT NOT NULL
+            ) WITHOUT ROWID
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS images (
+                hash TEXT PRIMARY KEY,
+                width INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                format TEXT,
+                mode TEXT,
+                bytes INTEGER NOT NULL,
+                phash TEXT NOT NULL,
+                thumbnail TEXT NOT NULL
+            ) WITHOUT ROWID
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS product_images (
+                sku INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                url TEXT NOT NULL,
+                PRIMARY KEY (sku, position)
+            ) WITHOUT ROWID
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS product_images_url ON product_images (url)")
+        self.conn.commit()
+        self.pending_urls: List[Tuple] = []
+        self.pending_images: List[Tuple] = []
+
+    def link_products(self, products: Iterable[Dict]) -> List[str]:
+        """
+        Record which images each product shows; returns the distinct URLs in first-seen order
+        """
+        urls: Dict[str, None] = {}
+        with self.conn:
+            for product in products:
+                product_urls = image_urls_of(product)
+                self.conn.execute("DELETE FROM product_images WHERE sku = ?", (product['sku'],))
+                self.conn.executemany("INSERT INTO product_images (sku, position, url) VALUES (?, ?, ?)",
+                                      [(product['sku'], position, url) for position, url in enumerate(product_urls)])
+                urls.update(dict.fromkeys(product_urls))
+        return list(urls)
+
+    def settled_urls(self) -> set:
+        """
+        URLs that must not be fetched again: stored, or failed for good
+        """
+        return {url for url, status_code in self.conn.execute("SELECT url, status_code FROM image_urls")
+                if not is_transient(status_code)}
+
+    def known_hashes(self) -> set:
+        return {row[0] for row in self.conn.execute("SELECT hash FROM images")}
+
+    def thumbnail_path(self, digest: str) -> str:
+        return os.path.join(self.directory, 'thumbnails', digest[:2], f"{digest}.jpg")
+
+    def describe_image(self, digest: str, content: bytes) -> Tuple:
+        """
+        Decode an image, save its thumbnail and return its metadata row; runs in a worker thread
+        """
+        with Image.open(io.BytesIO(content)) as image:
+            image.load()
+            width, height, image_format, mode = image.width, image.height, image.format, image.mode
+            phash = perceptual_hash(image)
+            thumbnail = image.convert('RGB') if image.mode not in ('RGB', 'L') else image.copy()
+        thumbnail.thumbnail((self.thumbnail_size, self.thumbnail_size))
+        path = self.thumbnail_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        thumbnail.save(path, 'JPEG', quality=85)
+        return digest, width, height, image_format, mode, len(content), phash, path
+
+    def flush(self):
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO images (hash, width, height, format, mode, bytes, phash, "
+                                  "thumbnail) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self.pending_images)
+            self.conn.executemany("INSERT OR REPLACE INTO image_urls (url, status_code, hash, fetched_at) "
+                                  "VALUES (?, ?, ?, ?)", self.pending_urls)
+        self.pending_urls = []
+        self.pending_images = []
+
+    async def run(self, products: Iterable[Dict]) -> Dict[str, int]:
+        """
+        Fetch and describe the images of products that no earlier run has fetched; returns counts
+        """
+        urls = self.link_products(products)
+        settled = self.settled_urls()
+        queue = [url for url in urls if url not in settled]
+        stats = {'image_urls': len(urls), 'already_fetched': len(urls) - len(queue), 'downloaded': 0,
+                 'new_images': 0, 'duplicate_images': 0, 'failed': 0}
+        if not queue:
+            return stats
+        self.logger.info(f"Fetching {len(queue)} new product images ({stats['already_fetched']} already stored)")
+
+        known = self.known_hashes()
+        # Hashes being described right now, so concurrent duplicates wait instead of decoding twice
+        in_progress: Dict[str, asyncio.Future] = {}
+        limiter = AdaptiveHostLimiter(self.requests_per_second, concurrency=self.concurrency, burst=self.concurrency)
+        loop = asyncio.get_running_loop()
+        pending = iter(queue)
+
+        async def fetch(client: httpx.AsyncClient, url: str) -> Tuple[Optional[int], Optional[bytes]]:
+            for attempt in range(1, self.max_attempts + 1):
+                status_code, retry_after = None, None
+                await limiter.acquire(url)
+                started = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                    status_code, retry_after = response.status_code, response.headers.get('Retry-After')
+                    if not is_transient(status_code):
+                        return status_code, response.content if status_code == 200 else None
+                except httpx.HTTPError as e:
+                    self.logger.debug(f"Image download failed for {url}: {str(e)}")
+                finally:
+                    await limiter.release(url, status_code, time.perf_counter() - started,
+                                          parse_retry_after(retry_after))
+                if attempt < self.max_attempts:
+                    await asyncio.sleep(max(backoff_delay(attempt), parse_retry_after(retry_after) or 0))
+            return status_code, None
+
+        async def worker(client: httpx.AsyncClient):
+            for url in pending:
+                status_code, content = await fetch(client, url)
+                digest = content_hash(content) if content is not None else None
+                if content is not None:
+                    stats['downloaded'] += 1
+                    if digest in known:
+                        stats['duplicate_images'] += 1
+                    elif digest in in_progress:
+                        stats['duplicate_images'] += 1
+                        if not await in_progress[digest]:
+                            digest = None
+                    else:
+                        key = digest
+                        described = in_progress[key] = loop.create_future()
+                        try:
+                            self.pending_images.append(
+                                await loop.run_in_executor(None, self.describe_image, digest, content))
+                            known.add(digest)
+                            stats['new_images'] += 1
+                            described.set_result(True)
+                        except Exception as e:
+                            self.logger.warning(f"Unreadable image {url}: {str(e)}")
+                            described.set_result(False)
+                            digest = None
+                        finally:
+                            del in_progress[key]
+                if digest is None:
+                    stats['failed'] += 1
+                self.pending_urls.append((url, status_code, digest, datetime.now().isoformat()))
+                if len(self.pending_urls) >= self.batch_size:
+                    self.flush()
+
+        async with httpx.AsyncClient(headers=self.headers, timeout=20, follow_redirects=True,
+                                     limits=httpx.Limits(max_connections=self.concurrency)) as client:
+            await asyncio.gather(*(worker(client) for _ in range(self.concurrency)))
+        self.flush()
+        self.logger.info(f"Images: {stats['downloaded']} downloaded, {stats['new_images']} new, "
+                         f"{stats['duplicate_images']} duplicates, {stats['failed']} failed")
+        return stats
+
+    def image_frame(self) -> pd.DataFrame:
+        """
+        One row per product image with its metadata, for analysis
+        """
+        return pd.read_sql_query(
+            "SELECT product_images.sku, product_images.position, product_images.url, image_urls.status_code, "
+            "images.* FROM product_images LEFT JOIN image_urls ON image_urls.url = product_images.url "
+            "LEFT JOIN images ON images.hash = image_urls.hash ORDER BY product_images.sku, product_images.position",
+            self.conn
+        )
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+def main():
+    from product_search import read_output_products
+
+    parser = argparse.ArgumentParser(description="Download and describe the images of a crawl output's products")
+    parser.add_argument('output', help="Parquet or CSV crawl output")
+    parser.add_argument('--directory', default="images")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--rps', type=float, default=5.0, help="starting requests per second per host")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    pipeline = ImagePipeline(args.directory, args.concurrency, args.rps)
+    print(asyncio.run(pipeline.run(read_output_products(args.output))))
+    pipeline.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Local mock storefront for benchmarking the scraper
+
+Author: Business Analytics Team
+Purpose: Serve generated product pages with the store's markup so crawls can be measured without the real site
+"""
+
+import argparse
+import functools
+import hashlib
+import html
+import io
+import random
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+from PIL import Image, ImageDraw
+
+from product_extractors import new_product_record
+
+BRANDS = ['Espressif', 'Arduino', 'Raspberry Pi', 'STMicro', 'Microchip', 'Texas Instruments', 'Bosch',
+          'Adafruit', 'SparkFun', 'Seeed', 'DFRobot', 'Waveshare']
+CATEGORIES = [('Microcontrollers', 'Development Boards'), ('Sensors', 'Temperature'), ('Sensors', 'Motion'),
+              ('Integrated Circuits', 'Voltage Regulators'), ('Integrated Circuits', 'Logic'),
+              ('Modules', 'Wireless'), ('Displays', 'OLED')]
+PART_WORDS = ['ESP32', 'WiFi', 'Module', 'Sensor', 'Board', 'Regulator', 'Driver', 'Bluetooth', 'Relay',
+              'Temperature', 'Humidity', 'Accelerometer', 'Display', 'Amplifier', 'Converter', 'Shield']
+FILLER_WORDS = ['low', 'power', 'voltage', 'pin', 'compatible', 'supply', 'interface', 'range', 'output',
+                'input', 'digital', 'analog', 'package', 'current', 'signal', 'high', 'precision', 'board']
+STOCK_STATUSES = ['In Stock', 'In Stock', 'In Stock', 'Out Of Stock', '2-3 Days', 'Pre-Order']
+LABELS = ['New', 'Sale', 'Hot']
+
+
+def generate_product(sku: int, seed: int = 0, base_url: str = "http://127.0.0.1/SKU-") -> Dict:
+    """
+    Deterministic product record for a SKU, in the scraper's record layout
+    """
+    rng = random.Random(f"{seed}:{sku}")
+    product_data = new_product_record(sku, f"{base_url}{sku}")
+    name = ' '.join(rng.sample(PART_WORDS, 4))
+    brand = rng.choice(BRANDS)
+    category = rng.choice(CATEGORIES)
+    price = round(rng.lognormvariate(6, 1.2), 2)
+    stars = rng.randint(0, 5)
+    tags = rng.sample(PART_WORDS, 3)
+    labels = [label for label in LABELS if rng.random() < 0.2]
+    specifications = {'Model': f"MDL-{sku}", 'Stock': rng.choice(STOCK_STATUSES),
+                      'Weight': f"{rng.randint(1, 500)}g"}
+    host = base_url.split('/SKU-')[0]
+    product_data.update({
+        'product_name': name,
+        'price': f"KES {price:,.2f}",
+        'price_numeric': price,
+        'stock_status': specifications['Stock'],
+        'brand': brand,
+        'manufacturer': brand,
+        'category': ' > '.join(category),
+        'model': specifications['Model'],
+        'rating': stars,
+        'review_count': rng.randint(0, 200) if stars else 0,
+        'product_labels': ', '.join(labels),
+        'tags': ', '.join(tags),
+        'product_description': f"{name} for {category[1].lower()} projects.",
+        'product_features': f"● Features: {' '.join(rng.sample(FILLER_WORDS, 6))}",
+        'main_image_url': f"{host}/image/catalog/{sku}.jpg",
+        'image_urls': [f"{host}/image/catalog/{sku}.jpg", f"{host}/image/catalog/{sku}-2.jpg"],
+        'specifications': specifications,
+        'scraped_at': datetime.now().isoformat(),
+    })
+    return product_data
+
+
+def render_product_page(product_data: Dict, page_size: int = 0, seed: int = 0) -> bytes:
+    """
+    HTML product page carrying the fields of product_data, padded to at least page_size bytes
+    """
+    esc = html.escape
+    name = esc(product_data['product_name'])
+    category = [esc(part) for part in product_data['category'].split(' > ')]
+    stars = ''.join('<i class="fa fa-star"></i>' if i < product_data['rating'] else '<i class="fa fa-star-o"></i>'
+                    for i in range(5))
+    specs = ''.join(f'<li>{esc(key)}: <span>{esc(value)}</span></li>' if key in ('Model', 'Stock')
+                    else f'<li>{esc(key)}: {esc(value)}</li>'
+                    for key, value in product_data['specifications'].items())
+    specs = specs.replace('<li>Model:', '<li class="product-model">Model:', 1)
+    specs = specs.replace('<li>Stock:', '<li class="product-stock">Stock:', 1)
+    labels = ''.join(f'<span class="product-label">{esc(label)}</span>'
+                     for label in product_data['product_labels'].split(', ') if label)
+    tags = ''.join(f'<a href="/tag/{esc(tag)}">{esc(tag)}</a>' for tag in product_data['tags'].split(', '))
+    images = ''.join(f'<img src="{esc(url)}" alt="{name}" title="{name}">' for url in product_data['image_urls'])
+
+    page = f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{name}</title></head>
+<body>
+<ul class="breadcrumb"><li><a href="/">Home</a></li><li><a href="#">{category[0]}</a></li><li><a href="#">{category[1]}</a></li><li><a href="#">{name}</a></li></ul>
+<div id="product-product" class="container">
+<div class="product-image">{images}</div>
+<div class="product-details">
+<h1 class="title page-title">{name}</h1>
+<div class="brand-image product-manufacturer"><a href="/brand"><span>{esc(product_data['brand'])}</span></a></div>
+{labels}
+<ul class="list-unstyled">{specs}</ul>
+<div class="rating rating-page">{stars} <a href="#reviews">{product_data['review_count']} reviews</a></div>
+<div class="product-price">{esc(product_data['price'])}</div>
+</div>
+<div id="product_tabs_description"><div class="block-content">
+<p>{esc(product_data['product_description'])}</p>
+<p>{esc(product_data['product_features'])}</p>
+"""
+    # Pad with description text until the requested page size is reached
+    rng = random.Random(f"{seed}:{product_data['sku']}:filler")
+    filler = []
+    size = len(page.encode())
+    while size < page_size:
+        paragraph = f"<p>{' '.join(rng.choice(FILLER_WORDS) for _ in range(40))}.</p>\n"
+        filler.append(paragraph)
+        size += len(paragraph)
+    return (page + ''.join(filler) + f"""</div></div>
+<div class="tags">{tags}</div>
+</div>
+</body></html>""").encode('utf-8')
+
+
+@functools.lru_cache(maxsize=1024)
+def render_product_image(key: str, size: int = 400) -> bytes:
+    """
+    Deterministic JPEG for an image key: a few coloured shapes on a light background
+    """
+    rng = random.Random(key)
+    image = Image.new('RGB', (size, size), tuple(rng.randint(200, 255) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(4):
+        x0, y0 = rng.randint(0, size - 40), rng.randint(0, size - 40)
+        draw.rectangle((x0, y0, rng.randint(x0 + 20, size), rng.randint(y0 + 20, size)),
+                       fill=tuple(rng.randint(0, 200) for _ in range(3)))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=80)
+    return buffer.getvalue()
+
+
+class MockStorefront:
+    """
+    Threaded HTTP server answering /SKU-<n> with generated product pages
+
+    Whether a SKU exists is fixed by the seed (not_found_rate is the 404
+    density); server errors are drawn per request, so they are transient.
+    /image/catalog/<sku>.jpg is a picture of its own, while every
+    /image/catalog/<sku>-2.jpg shows the brand's logo, so products of one
+    brand share that image under different URLs. With etags=True, product
+    pages carry an ETag of their body and a matching If-None-Match is
+    answered with 304, like a server supporting conditional requests.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, page_size: int = 20000, latency: float = 0.0,
+                 not_found_rate: float = 0.3, error_rate: float = 0.0, seed: int = 0, etags: bool = False):
+        self.page_size = page_size
+        self.latency = latency
+        self.not_found_rate = not_found_rate
+        self.error_rate = error_rate
+        self.seed = seed
+        self.etags = etags
+        self.requests_served = 0
+        self.not_modified_served = 0
+        self.server = ThreadingHTTPServer((host, port), self.handler_class())
+        self.server.daemon_threads = True
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/SKU-"
+
+    def sku_exists(self, sku: int) -> bool:
+        return random.Random(f"{self.seed}:{sku}:exists").random() >= self.not_found_rate
+
+    def product_page(self, sku: int) -> bytes:
+        return render_product_page(generate_product(sku, self.seed, self.base_url), self.page_size, self.seed)
+
+    def page_etag(self, sku: int, body: bytes) -> str:
+        return f'"{hashlib.md5(body).hexdigest()}"'
+
+    def product_image(self, name: str) -> Optional[bytes]:
+        sku, _, variant = name.partition('-')
+        if not sku.isdigit() or not self.sku_exists(int(sku)):
+            return None
+        if variant:
+            return render_product_image(f"logo:{generate_product(int(sku), self.seed)['brand']}")
+        return render_product_image(f"{self.seed}:{sku}")
+
+    def handler_class(self):
+        storefront = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                storefront.requests_served += 1
+                if storefront.latency:
+                    time.sleep(storefront.latency)
+                try:
+                    sku = int(self.path.rsplit('SKU-', 1)[1])
+                except (IndexError, ValueError):
+                    sku = None
+
+                image, etag = None, None
+                if self.path.startswith('/image/catalog/') and self.path.endswith('.jpg'):
+                    image = storefront.product_image(self.path[len('/image/catalog/'):-len('.jpg')])
+
+                if storefront.error_rate and random.random() < storefront.error_rate:
+                    status, body = 500, b"<html><head><title>Internal Server Error</title></head></html>"
+                elif image is not None:
+                    status, body = 200, image
+                elif sku is not None and storefront.sku_exists(sku):
+                    status, body = 200, storefront.product_page(sku)
+                    if storefront.etags:
+                        etag = storefront.page_etag(sku, body)
+                        if self.headers.get('If-None-Match') == etag:
+                            storefront.not_modified_served += 1
+                            status, body = 304, b""
+                else:
+                    status, body = 404, b"<html><head><title>404 Not Found</title></head><body><h1>Page not found</h1></body></html>"
+
+                self.send_response(status)
+                self.send_header('Content-Type', 'image/jpeg' if image is not None and status == 200
+                                 else 'text/html; charset=utf-8')
+                if etag:
+                    self.send_header('ETag', etag)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def start(self) -> 'MockStorefront':
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve generated product pages for benchmarking")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--page-size', type=int, default=20000, help="minimum page size in bytes")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument('--not-found-rate', type=float, default=0.3, help="share of SKUs that return 404")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of requests that return 500")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    storefront = MockStorefront(args.host, args.port, args.page_size, args.latency, args.not_found_rate,
+                                args.error_rate, args.seed)
+    print(f"Serving mock storefront at {storefront.base_url}<sku>")
+    try:
+        storefront.server.serve_forever()
+    except KeyboardInterrupt:
+        storefront.stop()
+
+
+if __name__ == "__main__":
+    main()
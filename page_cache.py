@@ -0,0 +1,302 @@
+"""
+Content-addressed cache of raw product pages
+
+Author: Business Analytics Team
+Purpose: Keep the downloaded HTML so a fixed or extended extractor can be re-run over it without re-crawling
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+import pyarrow as pa
+
+from crawl_journal import INVALID, PRODUCT
+
+# Default cache size limit: compressed bytes on disk
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# Eviction frees space down to this share of the limit, so it does not run on every page
+EVICTION_TARGET = 0.9
+
+# Cached page as handed to reprocess workers: sku, url, fetched_at, blob path, codec, raw size
+CachedPage = Tuple[int, str, str, str, str, int]
+
+
+def content_hash(content: bytes) -> str:
+    """
+    Hash of a page or image body: names cache blobs, detects unchanged pages and deduplicates images
+    """
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+def read_blob(path: str, codec: str, size: int) -> bytes:
+    with open(path, 'rb') as f:
+        return pa.Codec(codec).decompress(f.read(), size, asbytes=True)
+
+
+class PageCache:
+    """
+    Compressed page bodies on disk, indexed by SKU and fetch time in SQLite
+
+    Each distinct body is stored once under its content hash, so a page
+    that did not change between crawls costs one index row, not another
+    blob. When the blobs outgrow max_bytes, those last fetched longest ago
+    are evicted with their index rows; a SKU's older bodies always go
+    before its newest one.
+    """
+
+    def __init__(self, directory: str = "page_cache", max_bytes: int = CACHE_MAX_BYTES, codec: str = 'zstd',
+                 compression_level: Optional[int] = None, batch_size: int = 200):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.codec_name = codec if pa.Codec.is_available(codec) else 'gzip'
+        self.codec = pa.Codec(self.codec_name, compression_level)
+        self.batch_size = batch_size
+        os.makedirs(os.path.join(directory, 'blobs'), exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(directory, 'index.db'))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                codec TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                stored_size INTEGER NOT NULL,
+                last_fetched TEXT NOT NULL
+            ) WITHOUT ROWID
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS blobs_last_fetched ON blobs (last_fetched)")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                sku INTEGER NOT NULL,
+                fetched_at TEXT NOT NULL,
+                url TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                PRIMARY KEY (sku, fetched_at)
+            ) WITHOUT ROWID
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS pages_hash ON pages (hash)")
+        self.conn.commit()
+        self.stored_bytes = self.conn.execute("SELECT COALESCE(SUM(stored_size), 0) FROM blobs").fetchone()[0]
+        # Blobs written or touched since the last flush, and their page rows
+        self.pending_blobs: Dict[str, Tuple] = {}
+        self.pending_pages: List[Tuple] = []
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.directory, 'blobs', digest[:2], digest)
+
+    def put(self, sku: int, url: str, content: bytes, digest: Optional[str] = None,
+            fetched_at: Optional[str] = None) -> str:
+        """
+        Cache the body of a fetched page; returns its content hash
+        """
+        digest = digest or content_hash(content)
+        fetched_at = fetched_at or datetime.now().isoformat()
+        path = self.blob_path(digest)
+        if digest in self.pending_blobs:
+            self.pending_blobs[digest] = self.pending_blobs[digest][:4] + (fetched_at,)
+        elif self.conn.execute("SELECT 1 FROM blobs WHERE hash = ?", (digest,)).fetchone():
+            self.pending_blobs[digest] = (digest, None, None, None, fetched_at)
+        else:
+            compressed = self.codec.compress(content, asbytes=True)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename, so a crash never leaves a truncated blob under a valid hash
+            with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as f:
+                f.write(compressed)
+            os.replace(f.name, path)
+            self.pending_blobs[digest] = (digest, self.codec_name, len(content), len(compressed), fetched_at)
+            self.stored_bytes += len(compressed)
+        self.pending_pages.append((sku, fetched_at, url, digest))
+
+        if len(self.pending_pages) >= self.batch_size:
+            self.flush()
+        return digest
+
+    def flush(self):
+        if not self.pending_pages:
+            return
+        new_blobs = [blob for blob in self.pending_blobs.values() if blob[1] is not None]
+        touched = [(blob[4], blob[0]) for blob in self.pending_blobs.values() if blob[1] is None]
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO blobs (hash, codec, size, stored_size, last_fetched) VALUES (?, ?, ?, ?, ?)",
+                new_blobs
+            )
+            self.conn.executemany("UPDATE blobs SET last_fetched = ? WHERE hash = ?", touched)
+            self.conn.executemany("INSERT OR REPLACE INTO pages (sku, fetched_at, url, hash) VALUES (?, ?, ?, ?)",
+                                  self.pending_pages)
+        self.pending_blobs = {}
+        self.pending_pages = []
+        if self.stored_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """
+        Delete the least recently fetched blobs until the cache is back under its target size
+        """
+        target = self.max_bytes * EVICTION_TARGET
+        evicted = []
+        for digest, stored_size in self.conn.execute("SELECT hash, stored_size FROM blobs ORDER BY last_fetched"):
+            if self.stored_bytes <= target:
+                break
+            evicted.append((digest,))
+            self.stored_bytes -= stored_size
+        with self.conn:
+            self.conn.executemany("DELETE FROM pages WHERE hash = ?", evicted)
+            self.conn.executemany("DELETE FROM blobs WHERE hash = ?", evicted)
+        for (digest,) in evicted:
+            try:
+                os.remove(self.blob_path(digest))
+            except FileNotFoundError:
+                pass
+        logging.getLogger(__name__).info(f"Page cache: evicted {len(evicted)} page bodies, "
+                                         f"{self.stored_bytes / 1024 ** 2:.0f} MB kept")
+
+    def get(self, sku: int, fetched_at: Optional[str] = None) -> Optional[bytes]:
+        """
+        Body of a SKU's page as fetched at fetched_at, or its most recent fetch; None when not cached
+        """
+        self.flush()
+        row = self.conn.execute(
+            "SELECT pages.hash, codec, size FROM pages JOIN blobs ON blobs.hash = pages.hash "
+            "WHERE sku = ? AND fetched_at <= ? ORDER BY fetched_at DESC LIMIT 1",
+            (sku, fetched_at or '9999')
+        ).fetchone()
+        return read_blob(self.blob_path(row[0]), row[1], row[2]) if row else None
+
+    def latest_pages(self, start_sku: Optional[int] = None, max_sku: Optional[int] = None) -> Iterator[CachedPage]:
+        """
+        The most recent cached fetch of every SKU in the range, in SKU order
+        """
+        self.flush()
+        rows = self.conn.execute(
+            "SELECT pages.sku, pages.url, MAX(pages.fetched_at), pages.hash, codec, size "
+            "FROM pages JOIN blobs ON blobs.hash = pages.hash "
+            "WHERE pages.sku BETWEEN ? AND ? GROUP BY pages.sku ORDER BY pages.sku",
+            (start_sku if start_sku is not None else -2 ** 63, max_sku if max_sku is not None else 2 ** 63 - 1)
+        )
+        # SQLite takes the bare columns of a MAX() aggregate from the row holding the maximum
+        for sku, url, fetched_at, digest, codec, size in rows:
+            yield sku, url, fetched_at, self.blob_path(digest), codec, size
+
+    def stats(self) -> Dict:
+        self.flush()
+        blobs, raw, stored = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(stored_size), 0) FROM blobs"
+        ).fetchone()
+        skus, pages = self.conn.execute("SELECT COUNT(DISTINCT sku), COUNT(*) FROM pages").fetchone()
+        return {'skus': skus, 'fetches': pages, 'blobs': blobs, 'raw_mb': raw / 1024 ** 2,
+                'stored_mb': stored / 1024 ** 2, 'compression_ratio': raw / stored if stored else None}
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+def reprocess_in_worker(pages: List[CachedPage]) -> List[Tuple[int, Optional[Dict], List[Tuple[str, float]]]]:
+    """
+    Parse a chunk of cached pages inside a parser process, stamping each product with its fetch time
+    """
+    from parse_pipeline import parse_in_worker
+
+    results = []
+    for sku, url, fetched_at, path, codec, size in pages:
+        try:
+            product_data, timings = parse_in_worker(read_blob(path, codec, size), sku, url)
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Reprocess error for SKU {sku}: {str(e)}")
+            product_data, timings = None, []
+        if product_data:
+            product_data['scraped_at'] = fetched_at
+        results.append((sku, product_data, timings))
+    return results
+
+
+def reprocess(cache_dir: str = "page_cache", output_format: str = 'parquet', processes: Optional[int] = None,
+              extractor: str = 'fast', start_sku: Optional[int] = None, max_sku: Optional[int] = None,
+              chunk_size: int = 100, **scraper_options):
+    """
+    Run the current extractor over the latest cached page of every SKU, without network access
+
+    Pages are parsed on all cores and the products go through the scraper's
+    usual outputs (Parquet/CSV, aggregates, summary report, and any history or
+    search index passed in scraper_options). Returns the scraper.
+    """
+    from ecommerce_scraper import EcommerceMarketScraper
+    from parse_pipeline import init_parser_process
+
+    scraper = EcommerceMarketScraper(enable_logging=False, extractor=extractor, output_format=output_format,
+                                     **scraper_options)
+    processes = processes or os.cpu_count() or 1
+    cache = PageCache(cache_dir)
+    pages = cache.latest_pages(start_sku, max_sku)
+    scraper.logger.info(f"Reprocessing cached pages from {cache_dir}")
+
+    def record(results):
+        for sku, product_data, timings in results:
+            for stage, seconds in timings:
+                scraper.metrics.observe(stage, seconds)
+            scraper.record_outcome(sku, PRODUCT if product_data else INVALID, product_data)
+            if product_data:
+                scraper.successful_scrapes += 1
+            else:
+                scraper.failed_scrapes += 1
+
+    scraper.open_product_stream()
+    scraper.metrics.start_run()
+    # Chunks are read from the index cursor as workers free up, so only a few are held in memory at once
+    in_flight: Deque[Future] = deque()
+    with ProcessPoolExecutor(max_workers=processes, initializer=init_parser_process,
+                             initargs=(scraper.base_url, extractor)) as executor:
+        while True:
+            chunk = list(islice(pages, chunk_size))
+            if not chunk:
+                break
+            in_flight.append(executor.submit(reprocess_in_worker, chunk))
+            if len(in_flight) >= 2 * processes:
+                record(in_flight.popleft().result())
+        while in_flight:
+            record(in_flight.popleft().result())
+    cache.close()
+    scraper.finish_market_analysis()
+    return scraper
+
+
+def main():
+    from product_extractors import EXTRACTOR_BACKENDS
+
+    parser = argparse.ArgumentParser(description="Raw page cache: re-extract products offline or inspect the cache")
+    parser.add_argument('--cache-dir', default="page_cache")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('reprocess', help="run the current extractor over the cached pages")
+    command.add_argument('--output-format', choices=['parquet', 'csv', 'both'], default='parquet')
+    command.add_argument('--processes', type=int, help="parser processes (default: all cores)")
+    command.add_argument('--extractor', default='fast', choices=sorted(EXTRACTOR_BACKENDS))
+    command.add_argument('--start', type=int)
+    command.add_argument('--max', type=int)
+
+    commands.add_parser('stats', help="show cache size and compression")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == 'reprocess':
+        scraper = reprocess(args.cache_dir, args.output_format, args.processes, args.extractor, args.start, args.max)
+        print(f"Re-extracted {scraper.collected_count()} products")
+    elif args.command == 'stats':
+        cache = PageCache(args.cache_dir)
+        print(cache.stats())
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
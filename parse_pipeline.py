@@ -0,0 +1,102 @@
+"""
+Process-pool parsing stage for the async crawl engine
+
+Author: Business Analytics Team
+Purpose: Keep CPU-bound HTML parsing off the network event loop
+"""
+
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from crawl_journal import ERROR, INVALID, PRODUCT
+from crawl_metrics import CrawlMetrics
+
+# Per-process parser, created once by the pool initializer
+_parser = None
+
+
+def init_parser_process(base_url: str, extractor: str):
+    """
+    Pool initializer: build a scraper instance used only for parsing
+    """
+    global _parser
+    from ecommerce_scraper import EcommerceMarketScraper
+    _parser = EcommerceMarketScraper(base_url, enable_logging=False, extractor=extractor)
+    _parser.metrics.forward = True
+
+
+def parse_in_worker(content: bytes, sku: int, url: str) -> Tuple[Optional[Dict], List[Tuple[str, float]]]:
+    """
+    Validate and extract a product page inside a worker process; also returns the stage timings
+    """
+    return _parser.parse_product_page(content, sku, url), _parser.metrics.drain()
+
+
+class ParsePipeline:
+    """
+    Bounded queue of raw pages feeding a pool of parser processes
+
+    Fetchers call put(); when the queue is full they wait, so downloads can
+    never run further ahead of parsing than parse_queue_size pages.
+    """
+
+    def __init__(self, base_url: str, processes: Optional[int] = None, queue_size: int = 100,
+                 extractor: str = 'fast', metrics: Optional[CrawlMetrics] = None):
+        self.processes = processes or os.cpu_count() or 1
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.executor = ProcessPoolExecutor(max_workers=self.processes,
+                                            initializer=init_parser_process,
+                                            initargs=(base_url, extractor))
+        self.consumers: List[asyncio.Task] = []
+        self.metrics = metrics
+        self.logger = logging.getLogger(__name__)
+
+    def start(self, on_result: Callable[[int, str, Optional[Dict]], None]):
+        """
+        Start one consumer per process; on_result(sku, outcome, product_data) runs on the event loop
+
+        An exception from on_result is logged and the consumer carries on with the next page.
+        """
+        loop = asyncio.get_running_loop()
+
+        async def consumer():
+            while True:
+                item = await self.queue.get()
+                if item is None:
+                    return
+                sku, url, content = item
+                try:
+                    product_data, timings = await loop.run_in_executor(self.executor, parse_in_worker,
+                                                                       content, sku, url)
+                    outcome = PRODUCT if product_data else INVALID
+                    if self.metrics:
+                        for stage, seconds in timings:
+                            self.metrics.observe(stage, seconds)
+                except Exception as e:
+                    self.logger.error(f"Parser error for SKU {sku}: {str(e)}")
+                    product_data, outcome = None, ERROR
+                # A failing callback loses this result, not the consumer and the pages queued behind it
+                try:
+                    on_result(sku, outcome, product_data)
+                except Exception:
+                    self.logger.exception(f"Error recording the parse result of SKU {sku}")
+
+        self.consumers = [asyncio.create_task(consumer()) for _ in range(self.processes)]
+
+    async def put(self, sku: int, url: str, content: bytes):
+        """
+        Queue a downloaded page for parsing, waiting while the queue is full
+        """
+        await self.queue.put((sku, url, content))
+
+    async def close(self):
+        """
+        Drain the queue, stop the consumers and shut the pool down
+        """
+        for _ in self.consumers:
+            await self.queue.put(None)
+        await asyncio.gather(*self.consumers)
+        self.executor.shutdown()
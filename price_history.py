@@ -0,0 +1,150 @@
+"""
+Price history store across crawl runs
+
+Author: Business Analytics Team
+Purpose: Keep one price point per SKU per crawl so price changes can be queried without re-reading old outputs
+"""
+
+import sqlite3
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+
+class PriceHistory:
+    """
+    SQLite time series of product prices, one row per (sku, snapshot)
+
+    A snapshot is one crawl run, identified by its start time to the
+    microsecond and registered as soon as the run starts. Rows are
+    clustered on (sku, snapshot), so the history of one SKU is a single
+    index range scan however many runs are stored; a secondary index on
+    snapshot serves the comparisons between two runs.
+    """
+
+    def __init__(self, path: str = "price_history.db", batch_size: int = 500):
+        self.path = path
+        self.batch_size = batch_size
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS price_points (
+                sku INTEGER NOT NULL,
+                snapshot TEXT NOT NULL,
+                scraped_at TEXT NOT NULL,
+                price_numeric REAL,
+                currency TEXT,
+                stock_status TEXT,
+                brand TEXT,
+                category TEXT,
+                PRIMARY KEY (sku, snapshot)
+            ) WITHOUT ROWID
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS price_points_snapshot ON price_points (snapshot, sku)")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS snapshots (
+                snapshot TEXT PRIMARY KEY,
+                started_at TEXT NOT NULL
+            )
+        """)
+        self.conn.commit()
+        self.snapshot: Optional[str] = None
+        self.pending: List[Tuple] = []
+
+    def start_snapshot(self, snapshot: Optional[str] = None) -> str:
+        """
+        Begin recording a crawl run under a new snapshot, or keep adding to `snapshot` when resuming it
+
+        The new snapshot is registered right away, so its ID can be stored
+        before any price point is flushed and no later run reuses it.
+        """
+        if snapshot is None:
+            while True:
+                snapshot = datetime.now().isoformat(timespec='microseconds')
+                with self.conn:
+                    inserted = self.conn.execute(
+                        "INSERT OR IGNORE INTO snapshots (snapshot, started_at) VALUES (?, ?)", (snapshot, snapshot)
+                    ).rowcount
+                if inserted:
+                    break
+        self.snapshot = snapshot
+        return snapshot
+
+    def record(self, product_data: Dict):
+        """
+        Queue the price point of a product for the current snapshot
+        """
+        if self.snapshot is None:
+            self.start_snapshot()
+        self.pending.append((
+            product_data['sku'], self.snapshot, product_data['scraped_at'], product_data.get('price_numeric'),
+            product_data.get('currency'), product_data.get('stock_status'), product_data.get('brand'),
+            product_data.get('category'),
+        ))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO price_points (sku, snapshot, scraped_at, price_numeric, currency, "
+                "stock_status, brand, category) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                self.pending
+            )
+        self.pending = []
+
+    def snapshots(self) -> List[str]:
+        return [row[0] for row in self.conn.execute("SELECT snapshot FROM snapshots ORDER BY snapshot")]
+
+    def sku_history(self, sku: int, since: Optional[str] = None) -> pd.DataFrame:
+        """
+        Price points of one SKU in time order, optionally only snapshots at or after `since`
+        """
+        return pd.read_sql_query(
+            "SELECT snapshot, scraped_at, price_numeric, currency, stock_status FROM price_points "
+            "WHERE sku = ? AND snapshot >= ? ORDER BY snapshot",
+            self.conn, params=(sku, since or '')
+        )
+
+    def price_changes(self, old_snapshot: str, new_snapshot: str) -> pd.DataFrame:
+        """
+        SKUs present in both snapshots whose price changed, with the absolute and relative change
+        """
+        changes = pd.read_sql_query(
+            "SELECT new.sku, new.brand, new.category, old.price_numeric AS old_price, "
+            "new.price_numeric AS new_price FROM price_points AS new "
+            "JOIN price_points AS old ON old.sku = new.sku AND old.snapshot = ? "
+            "WHERE new.snapshot = ? AND new.price_numeric IS NOT old.price_numeric ORDER BY new.sku",
+            self.conn, params=(old_snapshot, new_snapshot)
+        )
+        changes['change'] = changes['new_price'] - changes['old_price']
+        changes['change_pct'] = changes['change'] / changes['old_price'].where(changes['old_price'] != 0) * 100
+        return changes
+
+    def brand_price_index(self, base_snapshot: str, snapshot: str) -> pd.DataFrame:
+        """
+        Per-brand price index of snapshot against base_snapshot (base = 100) over SKUs priced in both
+
+        The index is the ratio of the brands' basket costs over the matched
+        SKUs, so products added or removed between the runs do not move it.
+        """
+        index = pd.read_sql_query(
+            "SELECT new.brand, COUNT(*) AS matched_skus, "
+            "SUM(new.price_numeric > old.price_numeric) AS raised, "
+            "SUM(new.price_numeric < old.price_numeric) AS lowered, "
+            "SUM(old.price_numeric) AS base_cost, SUM(new.price_numeric) AS cost FROM price_points AS new "
+            "JOIN price_points AS old ON old.sku = new.sku AND old.snapshot = ? "
+            "WHERE new.snapshot = ? AND new.brand != '' AND old.price_numeric > 0 "
+            "GROUP BY new.brand ORDER BY new.brand",
+            self.conn, params=(base_snapshot, snapshot)
+        )
+        index['price_index'] = index['cost'] / index['base_cost'] * 100
+        return index
+
+    def close(self):
+        self.flush()
+        self.conn.close()
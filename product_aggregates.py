@@ -0,0 +1,322 @@
+"""
+Materialized product aggregates shared by the summary report and the dashboard
+
+Author: Business Analytics Team
+Purpose: Keep brand/category/stock/price statistics up to date as products are saved
+"""
+
+import json
+import math
+import os
+import re
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch for non-negative values (DDSketch-style log buckets)
+
+    Every quantile is answered within relative_accuracy of a true sample
+    value, in memory proportional to the log of the value range rather than
+    the number of values.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.005):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value: float):
+        if value <= 0:
+            self.zero_count += 1
+        else:
+            key = math.ceil(math.log(value) / self.log_gamma)
+            self.buckets[key] = self.buckets.get(key, 0) + 1
+        self.count += 1
+
+    def add_buckets(self, buckets: Dict[int, int], zero_count: int = 0):
+        """
+        Add values already counted per bucket key, e.g. by a vectorized pass over many values
+        """
+        for key, count in buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.zero_count += zero_count
+        self.count += zero_count + sum(buckets.values())
+
+    def merge(self, other: 'QuantileSketch'):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        self.add_buckets(other.buckets, other.zero_count)
+
+    def bucket_value(self, key: int) -> float:
+        """
+        Representative value of a bucket, within relative_accuracy of every value counted in it
+        """
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                return self.bucket_value(key)
+        return self.bucket_value(max(self.buckets))
+
+    def to_dict(self) -> Dict:
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'zero_count': self.zero_count,
+            'buckets': {str(key): count for key, count in self.buckets.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'QuantileSketch':
+        sketch = cls(data['relative_accuracy'])
+        sketch.zero_count = data['zero_count']
+        sketch.buckets = {int(key): count for key, count in data['buckets'].items()}
+        sketch.count = sketch.zero_count + sum(sketch.buckets.values())
+        return sketch
+
+
+# Tag words: runs of letters, digits and underscores, lower-cased, without single characters and filler words
+TAG_WORD_SEPARATOR_RE = re.compile(r'[^\w]+')
+TAG_STOPWORDS = frozenset([
+    'a', 'an', 'and', 'as', 'at', 'by', 'for', 'from', 'in', 'of', 'on', 'or', 'the', 'to', 'with',
+])
+
+
+def tag_words(tags: str) -> List[str]:
+    return [word for word in TAG_WORD_SEPARATOR_RE.split(tags.lower())
+            if len(word) > 1 and word not in TAG_STOPWORDS]
+
+
+def add_count(counts: Dict[str, int], key: str, count: int = 1):
+    counts[key] = counts.get(key, 0) + count
+
+
+def top_counts(counts: Dict[str, int], limit: Optional[int] = None) -> List[Tuple[str, int]]:
+    """
+    (key, count) pairs, largest first; tied keys keep the order of counts
+
+    The sort is stable, so with counts in first-seen order ties come out
+    in the order their keys were first seen. pandas' value_counts does not
+    promise any particular order for ties, so it may differ on them.
+    """
+    ranked = sorted(counts.items(), key=lambda item: -item[1])
+    return ranked[:limit] if limit is not None else ranked
+
+
+class ProductAggregates:
+    """
+    Running counts and sums over scraped products
+
+    add() is O(1) per product and merge() combines the aggregates of two
+    disjoint product sets, so the statistics never need the raw rows. Empty
+    brand, category and stock status values are not counted, matching how
+    pandas reads them back from the CSV export. Counts per (brand, category,
+    stock status) combination and tag word counts feed the dashboard's
+    analytics views (see product_analytics).
+    """
+
+    def __init__(self):
+        self.product_count = 0
+        self.price_count = 0
+        self.price_sum = 0.0
+        self.price_min: Optional[float] = None
+        self.price_max: Optional[float] = None
+        self.price_sketch = QuantileSketch()
+        # brand -> [item count, basket cost]
+        self.brands: Dict[str, List[float]] = {}
+        self.categories: Dict[str, int] = {}
+        self.stock_statuses: Dict[str, int] = {}
+        # (brand, category, stock status) -> [products, priced products, price sum]; missing values are ''
+        self.groups: Dict[Tuple[str, str, str], List[float]] = {}
+        self.tag_words: Dict[str, int] = {}
+        # False for aggregates loaded from a file that predates groups and tag_words
+        self.has_breakdowns = True
+
+    def add(self, product: Dict):
+        self.product_count += 1
+
+        price = product.get('price_numeric')
+        if price is not None and not math.isnan(price):
+            self.price_count += 1
+            self.price_sum += price
+            self.price_min = price if self.price_min is None else min(self.price_min, price)
+            self.price_max = price if self.price_max is None else max(self.price_max, price)
+            self.price_sketch.add(price)
+            priced = 1
+        else:
+            price = 0.0
+            priced = 0
+
+        brand = product.get('brand')
+        if brand:
+            stats = self.brands.setdefault(brand, [0, 0.0])
+            stats[0] += 1
+            stats[1] += price
+        if product.get('category'):
+            add_count(self.categories, product['category'])
+        if product.get('stock_status'):
+            add_count(self.stock_statuses, product['stock_status'])
+        self.add_group((brand or '', product.get('category') or '', product.get('stock_status') or ''),
+                       1, priced, price)
+        for word in tag_words(product.get('tags') or ''):
+            add_count(self.tag_words, word)
+
+    def add_group(self, key: Tuple[str, str, str], count: int, priced: int, price_sum: float):
+        stats = self.groups.setdefault(key, [0, 0, 0.0])
+        stats[0] += count
+        stats[1] += priced
+        stats[2] += price_sum
+
+    def merge(self, other: 'ProductAggregates'):
+        self.product_count += other.product_count
+        self.price_count += other.price_count
+        self.price_sum += other.price_sum
+        for bound, pick in (('price_min', min), ('price_max', max)):
+            values = [v for v in (getattr(self, bound), getattr(other, bound)) if v is not None]
+            setattr(self, bound, pick(values) if values else None)
+        self.price_sketch.merge(other.price_sketch)
+        for brand, (count, cost) in other.brands.items():
+            stats = self.brands.setdefault(brand, [0, 0.0])
+            stats[0] += count
+            stats[1] += cost
+        for key, count in other.categories.items():
+            add_count(self.categories, key, count)
+        for key, count in other.stock_statuses.items():
+            add_count(self.stock_statuses, key, count)
+        for key, (count, priced, price_sum) in other.groups.items():
+            self.add_group(key, count, priced, price_sum)
+        for word, count in other.tag_words.items():
+            add_count(self.tag_words, word, count)
+
+    @property
+    def price_mean(self) -> Optional[float]:
+        return self.price_sum / self.price_count if self.price_count else None
+
+    def price_quantile(self, q: float) -> Optional[float]:
+        """
+        Approximate price quantile, clamped to the exact observed range
+        """
+        value = self.price_sketch.quantile(q)
+        if value is None:
+            return None
+        return min(max(value, self.price_min), self.price_max)
+
+    def brand_counts(self) -> Dict[str, int]:
+        return {brand: stats[0] for brand, stats in self.brands.items()}
+
+    def brand_summary(self) -> List[Dict]:
+        """
+        Basket cost, item count and average item price per brand, sorted by brand
+        """
+        return [
+            {'brand': brand, 'Basket_Cost': cost, 'Item_Count': count, 'Avg_Item_Price': cost / count}
+            for brand, (count, cost) in sorted(self.brands.items())
+        ]
+
+    def to_dict(self) -> Dict:
+        return {
+            'product_count': self.product_count,
+            'price_count': self.price_count,
+            'price_sum': self.price_sum,
+            'price_min': self.price_min,
+            'price_max': self.price_max,
+            'price_sketch': self.price_sketch.to_dict(),
+            'brands': self.brands,
+            'categories': self.categories,
+            'stock_statuses': self.stock_statuses,
+            'groups': [[*key, *stats] for key, stats in self.groups.items()],
+            'tag_words': self.tag_words,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ProductAggregates':
+        aggregates = cls()
+        for key in ('product_count', 'price_count', 'price_sum', 'price_min', 'price_max',
+                    'brands', 'categories', 'stock_statuses'):
+            setattr(aggregates, key, data[key])
+        aggregates.price_sketch = QuantileSketch.from_dict(data['price_sketch'])
+        aggregates.groups = {tuple(row[:3]): list(row[3:]) for row in data.get('groups', [])}
+        aggregates.tag_words = data.get('tag_words', {})
+        aggregates.has_breakdowns = 'groups' in data
+        return aggregates
+
+    def save(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> 'ProductAggregates':
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+def aggregates_path(output_path: str) -> str:
+    """
+    Aggregates file written next to a crawl output file
+    """
+    stem = output_path.rsplit('.', 1)[0]
+    return f"{stem}_aggregates.json"
+
+
+def current_aggregates_path(output_path: str) -> Optional[str]:
+    """
+    Aggregates file of a crawl output, or None if there is none or the output was rewritten after it
+    """
+    path = aggregates_path(output_path)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(output_path):
+        return None
+    return path
+
+
+def summary_report(aggregates: ProductAggregates, successful_scrapes: Optional[int] = None,
+                   failed_scrapes: Optional[int] = None, median_price: Optional[float] = None) -> str:
+    """
+    Plain-text summary report for business analysis; scrape counts are included when known
+
+    median_price is the exact median when the caller has the rows; without
+    it the median comes from the price sketch and is labelled approximate.
+    """
+    lines = [
+        "ECOMMERCE MARKET ANALYSIS SUMMARY REPORT",
+        "=" * 50,
+        "",
+        f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+        "",
+        "DATASET OVERVIEW:",
+        f"Total products scraped: {aggregates.product_count}",
+    ]
+    if successful_scrapes is not None:
+        lines.append(f"Successful scrapes: {successful_scrapes}")
+    if failed_scrapes is not None:
+        lines.append(f"Failed scrapes: {failed_scrapes}")
+    lines.append("")
+
+    if aggregates.price_count > 0:
+        lines += [
+            "PRICE ANALYSIS:",
+            f"Average price: {aggregates.price_mean:.2f} KES",
+            f"Median price: {median_price:.2f} KES" if median_price is not None else
+            f"Median price (approx. ±{aggregates.price_sketch.relative_accuracy:.1%}): "
+            f"{aggregates.price_quantile(0.5):.2f} KES",
+            f"Price range: {aggregates.price_min:.2f} - {aggregates.price_max:.2f} KES",
+            "",
+            "BRAND DISTRIBUTION:",
+        ]
+        lines += [f"{brand}: {count} products" for brand, count in top_counts(aggregates.brand_counts(), 10)]
+        lines += ["", "CATEGORY DISTRIBUTION:"]
+        lines += [f"{category}: {count} products" for category, count in top_counts(aggregates.categories, 10)]
+        lines += ["", "STOCK STATUS:"]
+        lines += [f"{status}: {count} products" for status, count in top_counts(aggregates.stock_statuses)]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,299 @@
+"""
+Vectorized market analytics over crawl outputs
+
+Author: Business Analytics Team
+Purpose: Price distribution, brand/category share, stock availability and tag word views over ProductAggregates,
+and Arrow batch ingestion so outputs larger than memory can be aggregated
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from typing import Dict, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from product_aggregates import (TAG_STOPWORDS, ProductAggregates, add_count, aggregates_path,
+                                current_aggregates_path)
+
+# Columns the analytics read; the rest of an output is never loaded
+ANALYTICS_COLUMNS = {
+    'brand': pa.string(),
+    'category': pa.string(),
+    'stock_status': pa.string(),
+    'price_numeric': pa.float64(),
+    'tags': pa.string(),
+}
+
+# Grouping fields of the per-combination counts
+GROUP_FIELDS = ('brand', 'category', 'stock_status')
+
+# Rows per record batch; memory use is bounded by this, not by the output size
+BATCH_SIZE = 256 * 1024
+
+# Log-scale price bands of the price distribution view
+PRICE_BANDS_PER_DECADE = 20
+
+# Same word boundaries as product_aggregates.tag_words: RE2's \w is ASCII-only, Python's is Unicode
+TAG_WORD_SEPARATOR = r'[^\p{L}\p{N}_]+'
+
+# Stock statuses that count as available
+IN_STOCK_STATUSES = frozenset(['In Stock'])
+
+# Rendered word clouds, named by the hash of their input
+WORD_CLOUD_CACHE = "analytics_cache"
+
+
+def scan_batches(path: str, batch_size: int = BATCH_SIZE) -> Iterator[pa.RecordBatch]:
+    """
+    Stream the analytics columns of a Parquet or CSV crawl output as record batches
+
+    Columns missing from older outputs come back as nulls, and NaN prices
+    as nulls, so every batch has the same schema.
+    """
+    schema = pa.schema(list(ANALYTICS_COLUMNS.items()))
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(path)
+        present = [column for column in ANALYTICS_COLUMNS if column in parquet_file.schema_arrow.names]
+        batches = parquet_file.iter_batches(batch_size=batch_size, columns=present)
+    else:
+        from pyarrow import csv
+
+        batches = csv.open_csv(
+            path,
+            read_options=csv.ReadOptions(block_size=batch_size * 256),
+            convert_options=csv.ConvertOptions(column_types=ANALYTICS_COLUMNS, include_columns=list(ANALYTICS_COLUMNS),
+                                               include_missing_columns=True)
+        )
+
+    for batch in batches:
+        columns = []
+        for column, column_type in ANALYTICS_COLUMNS.items():
+            if column in batch.schema.names:
+                array = batch.column(column).cast(column_type)
+            else:
+                array = pa.nulls(batch.num_rows, column_type)
+            if column == 'price_numeric':
+                array = pc.if_else(pc.is_nan(array), pa.scalar(None, pa.float64()), array)
+            columns.append(array)
+        yield pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+def add_batch(aggregates: ProductAggregates, batch: pa.RecordBatch):
+    """
+    Add a record batch from scan_batches to aggregates, with the same result as add() on each of its products
+    """
+    aggregates.product_count += batch.num_rows
+
+    prices = batch.column('price_numeric').drop_null().to_numpy()
+    if len(prices):
+        aggregates.price_count += len(prices)
+        aggregates.price_sum += float(prices.sum())
+        low, high = float(prices.min()), float(prices.max())
+        aggregates.price_min = low if aggregates.price_min is None else min(aggregates.price_min, low)
+        aggregates.price_max = high if aggregates.price_max is None else max(aggregates.price_max, high)
+        sketch = aggregates.price_sketch
+        positive = prices[prices > 0]
+        keys, counts = np.unique(np.ceil(np.log(positive) / sketch.log_gamma).astype(np.int64), return_counts=True)
+        sketch.add_buckets(dict(zip(keys.tolist(), counts.tolist())), len(prices) - len(positive))
+
+    table = pa.Table.from_batches([batch]).select([*GROUP_FIELDS, 'price_numeric'])
+    for position, field in enumerate(GROUP_FIELDS):
+        table = table.set_column(position, field, pc.fill_null(table.column(field), ''))
+    # A single-threaded group_by lists the groups in first-seen order, which the count dicts keep
+    groups = table.group_by(list(GROUP_FIELDS), use_threads=False).aggregate(
+        [([], 'count_all'), ('price_numeric', 'count'), ('price_numeric', 'sum')]
+    )
+    for row in groups.to_pylist():
+        brand, category, stock_status = key = tuple(row[field] for field in GROUP_FIELDS)
+        count, price_sum = row['count_all'], row['price_numeric_sum'] or 0.0
+        aggregates.add_group(key, count, row['price_numeric_count'], price_sum)
+        if brand:
+            stats = aggregates.brands.setdefault(brand, [0, 0.0])
+            stats[0] += count
+            stats[1] += price_sum
+        if category:
+            add_count(aggregates.categories, category, count)
+        if stock_status:
+            add_count(aggregates.stock_statuses, stock_status, count)
+
+    add_tag_words(aggregates, batch.column('tags'))
+
+
+def add_tag_words(aggregates: ProductAggregates, tags: pa.Array):
+    # Tag lists repeat across products, so each distinct list is split once and its words weighted by its count
+    encoded = tags.drop_null().dictionary_encode()
+    if not len(encoded):
+        return
+    occurrences = np.bincount(encoded.indices.to_numpy(), minlength=len(encoded.dictionary))
+    word_lists = pc.split_pattern_regex(pc.utf8_lower(encoded.dictionary), TAG_WORD_SEPARATOR)
+    words = pc.list_flatten(word_lists)
+    weights = occurrences[pc.list_parent_indices(word_lists).to_numpy()]
+    keep = pc.and_(pc.greater(pc.utf8_length(words), 1),
+                   pc.invert(pc.is_in(words, pa.array(sorted(TAG_STOPWORDS))))).to_numpy(zero_copy_only=False)
+    counts = pa.table({'word': words.filter(keep), 'weight': weights[keep]}).group_by('word').aggregate(
+        [('weight', 'sum')]
+    )
+    for word, count in zip(counts.column('word').to_pylist(), counts.column('weight_sum').to_pylist()):
+        add_count(aggregates.tag_words, word, count)
+
+
+def aggregate_output(path: str, batch_size: int = BATCH_SIZE) -> ProductAggregates:
+    """
+    Aggregates of a Parquet or CSV crawl output, streamed in record batches
+    """
+    aggregates = ProductAggregates()
+    for batch in scan_batches(path, batch_size):
+        add_batch(aggregates, batch)
+    return aggregates
+
+
+def analyze_output(path: str, batch_size: int = BATCH_SIZE, use_saved: bool = True) -> ProductAggregates:
+    """
+    Aggregates of a crawl output with the analytics breakdowns, from its aggregates file when that has them
+
+    Outputs written before the breakdowns existed, without an aggregates
+    file, or rewritten since their aggregates file was saved, are streamed
+    once and their aggregates file rewritten.
+    """
+    saved_path = current_aggregates_path(path)
+    if use_saved and saved_path:
+        aggregates = ProductAggregates.load(saved_path)
+        if aggregates.has_breakdowns:
+            return aggregates
+    aggregates = aggregate_output(path, batch_size)
+    aggregates.save(aggregates_path(path))
+    return aggregates
+
+
+def group_frame(aggregates: ProductAggregates) -> pd.DataFrame:
+    return pd.DataFrame(
+        [(*key, count, priced, price_sum) for key, (count, priced, price_sum) in aggregates.groups.items()],
+        columns=[*GROUP_FIELDS, 'products', 'priced_products', 'price_sum']
+    )
+
+
+def price_distribution(aggregates: ProductAggregates) -> pd.DataFrame:
+    """
+    Product count per log-scale price band, from the cheapest to the dearest occupied band
+
+    Bands are regrouped from the price sketch buckets; zero prices are left out.
+    """
+    sketch = aggregates.price_sketch
+    if not sketch.buckets:
+        return pd.DataFrame(columns=['price_from', 'price_to', 'products'])
+    keys = np.array(list(sketch.buckets), dtype=np.float64)
+    counts = np.array(list(sketch.buckets.values()), dtype=np.int64)
+    bands = np.floor(np.log10(sketch.bucket_value(keys)) * PRICE_BANDS_PER_DECADE).astype(np.int64)
+    first = bands.min()
+    products = np.bincount(bands - first, weights=counts).astype(np.int64)
+    edges = 10.0 ** ((first + np.arange(len(products) + 1)) / PRICE_BANDS_PER_DECADE)
+    return pd.DataFrame({'price_from': edges[:-1], 'price_to': edges[1:], 'products': products})
+
+
+def share(aggregates: ProductAggregates, field: str, limit: Optional[int] = None) -> pd.DataFrame:
+    """
+    Products, share of all products, average price and share of catalog value per value of field
+
+    Products without a value for field are left out of the rows but not
+    of the denominators. Values beyond limit are folded into 'Other'.
+    """
+    groups = group_frame(aggregates)
+    groups = groups[groups[field] != '']
+    shares = groups.groupby(field, as_index=False)[['products', 'priced_products', 'price_sum']].sum()
+    shares = shares.sort_values(['products', field], ascending=[False, True], ignore_index=True)
+    if limit is not None and len(shares) > limit:
+        other = shares.iloc[limit:][['products', 'priced_products', 'price_sum']].sum()
+        shares = pd.concat([shares.iloc[:limit], pd.DataFrame([{field: 'Other', **other.to_dict()}])],
+                           ignore_index=True).astype({'products': int, 'priced_products': int})
+    shares['share'] = shares['products'] / aggregates.product_count if aggregates.product_count else 0.0
+    shares['value_share'] = shares['price_sum'] / aggregates.price_sum if aggregates.price_sum else 0.0
+    shares['avg_price'] = shares['price_sum'] / shares['priced_products'].where(shares['priced_products'] > 0)
+    return shares[[field, 'products', 'share', 'avg_price', 'value_share']]
+
+
+def stock_availability(aggregates: ProductAggregates, by: str = 'category',
+                       limit: Optional[int] = None) -> pd.DataFrame:
+    """
+    Product count per stock status for each value of by, with the in-stock rate, largest first
+    """
+    groups = group_frame(aggregates)
+    groups = groups[(groups[by] != '') & (groups['stock_status'] != '')]
+    table = groups.pivot_table(index=by, columns='stock_status', values='products', aggfunc='sum', fill_value=0)
+    table.columns.name = None
+    totals = table.sum(axis=1)
+    in_stock = table[[status for status in table.columns if status in IN_STOCK_STATUSES]].sum(axis=1)
+    table['in_stock_rate'] = in_stock / totals
+    table = table.loc[totals.sort_values(ascending=False, kind='stable').index]
+    return (table.head(limit) if limit is not None else table).reset_index()
+
+
+def top_tag_words(aggregates: ProductAggregates, limit: Optional[int] = 50) -> Dict[str, int]:
+    ranked = sorted(aggregates.tag_words.items(), key=lambda item: (-item[1], item[0]))
+    return dict(ranked[:limit] if limit is not None else ranked)
+
+
+def word_cloud_image(frequencies: Dict[str, int], width: int = 800, height: int = 400,
+                     cache_dir: str = WORD_CLOUD_CACHE) -> Optional[str]:
+    """
+    PNG word cloud of frequencies, rendered once per distinct input and served from cache_dir afterwards
+
+    Returns None when there are no words to draw.
+    """
+    if not frequencies:
+        return None
+    key = json.dumps([width, height, sorted(frequencies.items())], ensure_ascii=False)
+    digest = hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+    path = os.path.join(cache_dir, f"wordcloud_{digest}.png")
+    if os.path.exists(path):
+        return path
+
+    # Rendering pulls in wordcloud and matplotlib, so they load only on a cache miss
+    from wordcloud import WordCloud
+
+    os.makedirs(cache_dir, exist_ok=True)
+    cloud = WordCloud(width=width, height=height, background_color='white').generate_from_frequencies(frequencies)
+    # Written under a temporary name first, so a concurrent reader never sees a partial image
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    cloud.to_image().save(temporary_path, 'PNG')
+    os.replace(temporary_path, path)
+    return path
+
+
+def main():
+    from crawl_outputs import find_latest_output
+
+    parser = argparse.ArgumentParser(description="Market analytics of a crawl output")
+    parser.add_argument('output', nargs='?', help="Parquet or CSV crawl output (default: the newest)")
+    parser.add_argument('--limit', type=int, default=10, help="rows per table")
+    parser.add_argument('--refresh', action='store_true', help="ignore the aggregates file and re-read the output")
+    parser.add_argument('--word-cloud', action='store_true', help="render the tag word cloud")
+    args = parser.parse_args()
+
+    output = args.output or find_latest_output()
+    if output is None:
+        parser.error("no crawl output found")
+    aggregates = analyze_output(output, use_saved=not args.refresh)
+    pd.set_option('display.width', 160)
+
+    print(f"{output}: {aggregates.product_count} products, {aggregates.price_count} priced")
+    if aggregates.price_count:
+        print(f"Price: mean {aggregates.price_mean:.2f}, median {aggregates.price_quantile(0.5):.2f}, "
+              f"range {aggregates.price_min:.2f} - {aggregates.price_max:.2f}\n")
+    for field in ('brand', 'category'):
+        print(share(aggregates, field, args.limit).to_string(index=False), end='\n\n')
+    print(stock_availability(aggregates, limit=args.limit).to_string(index=False), end='\n\n')
+    words = top_tag_words(aggregates, args.limit)
+    print("Tag words: " + ", ".join(f"{word} ({count})" for word, count in words.items()))
+    if args.word_cloud:
+        print(f"Word cloud: {word_cloud_image(top_tag_words(aggregates, 200))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,554 @@
+"""
+Product page extractor backends
+
+Author: Business Analytics Team
+Purpose: Turn a downloaded product page into the product record used across the toolkit
+
+Two interchangeable backends are provided:
+
+- ``soup``: the original BeautifulSoup tree search (EcommerceMarketScraper.
+  is_valid_product_page / extract_product_data).
+- ``fast``: a single-pass engine driven by the PRODUCT_SELECTORS table. It
+  tokenizes the page once with html.parser, reproduces the tree-building
+  rules BeautifulSoup's html.parser builder applies, and collects every
+  field while walking, so it yields exactly the same record without
+  building a tree or rescanning it per field.
+"""
+
+import re
+from collections import namedtuple
+from datetime import datetime
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+from bs4.builder import ParserRejectedMarkup
+from bs4.dammit import EntitySubstitution, UnicodeDammit
+
+
+def new_product_record(sku: int, url: str) -> Dict:
+    """
+    Empty product record with every field at its default value
+    """
+    return {
+        'sku': sku,
+        'url': url,
+        'scraped_at': datetime.now().isoformat(),
+        'product_name': '',
+        'price': '',
+        'price_numeric': 0.0,
+        'currency': 'KES',
+        'product_description': '',
+        'product_features': '',
+        'stock_status': '',
+        'model': '',
+        'brand': '',
+        'manufacturer': '',
+        'category': '',
+        'tags': '',
+        'rating': 0,
+        'review_count': 0,
+        'reviews_text': '',
+        'image_urls': [],
+        'main_image_url': '',
+        'product_labels': '',
+        'specifications': {}
+    }
+
+
+def product_fields(product_data: Dict) -> Dict:
+    """
+    Product record without the volatile scraped_at timestamp, for change comparison
+    """
+    return {key: value for key, value in product_data.items() if key != 'scraped_at'}
+
+
+# Selector spec table: each entry matches elements by tag name and an optional
+# attribute test. `within` restricts matches to descendants of the first
+# element matched by another entry; `many` keeps every match (find_all)
+# instead of only the first one (find).
+Selector = namedtuple('Selector', ['field', 'tag', 'attr', 'value', 'within', 'many'])
+
+PRODUCT_SELECTORS = [
+    # Page validation
+    Selector('title', 'h1', 'class', 'title page-title', None, False),
+    Selector('container', 'div', 'id', 'product-product', None, False),
+    Selector('error_div', 'div', 'class', 'error', None, False),
+    Selector('headings', 'h1', None, None, None, True),
+    Selector('page_titles', 'title', None, None, None, True),
+    # Product fields
+    Selector('price', 'div', 'class', 'product-price', None, False),
+    Selector('desc_tab', 'div', 'id', re.compile(r'product_tabs.*'), None, False),
+    Selector('desc_content', 'div', 'class', 'block-content', 'desc_tab', False),
+    Selector('desc_paragraphs', 'p', None, None, 'desc_content', True),
+    Selector('stock_elem', 'li', 'class', 'product-stock', None, False),
+    Selector('stock', 'span', None, None, 'stock_elem', False),
+    Selector('model_elem', 'li', 'class', 'product-model', None, False),
+    Selector('model', 'span', None, None, 'model_elem', False),
+    Selector('brand_elem', 'div', 'class', 'brand-image product-manufacturer', None, False),
+    Selector('brand_link', 'a', None, None, 'brand_elem', False),
+    Selector('brand', 'span', None, None, 'brand_link', False),
+    Selector('breadcrumb', 'ul', 'class', 'breadcrumb', None, False),
+    Selector('breadcrumb_items', 'li', None, None, 'breadcrumb', True),
+    Selector('tags_div', 'div', 'class', 'tags', None, False),
+    Selector('tag_links', 'a', None, None, 'tags_div', True),
+    Selector('rating', 'div', 'class', 'rating rating-page', None, False),
+    Selector('rating_stars', 'i', 'class', 'fa-star', 'rating', True),
+    Selector('images', 'img', None, None, None, True),
+    Selector('labels', 'span', 'class', 'product-label', None, True),
+    Selector('stats', 'ul', 'class', 'list-unstyled', None, False),
+    Selector('stats_items', 'li', None, None, 'stats', True),
+]
+
+ERROR_TEXT_RE = re.compile(r'404|not found|error', re.I)
+PRICE_RE = re.compile(r'[\d,]+\.?\d*')
+REVIEW_COUNT_RE = re.compile(r'(\d+)\s+reviews?', re.I)
+
+# Tree-building rules of BeautifulSoup's HTML builder that affect text
+EMPTY_ELEMENT_TAGS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem',
+    'meta', 'param', 'source', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame',
+    'image', 'isindex', 'nextid', 'spacer'
+}
+PRESERVE_WHITESPACE_TAGS = {'pre', 'textarea'}
+STRING_CONTAINER_TAGS = {'rt', 'rp', 'style', 'script', 'template'}
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+NONWHITESPACE_RE = re.compile(r'\S+')
+
+
+def compile_selectors(selectors: List[Selector]) -> Dict[str, List[Selector]]:
+    """
+    Index a selector table by tag name so each start tag only tests relevant entries
+    """
+    by_tag: Dict[str, List[Selector]] = {}
+    for selector in selectors:
+        by_tag.setdefault(selector.tag, []).append(selector)
+    return by_tag
+
+
+SELECTORS_BY_TAG = compile_selectors(PRODUCT_SELECTORS)
+
+
+class Element:
+    """
+    Lightweight stand-in for a parsed tag: attributes, collected text and child summary
+    """
+
+    __slots__ = ('name', 'attrs', 'texts', 'is_open', 'child_count', 'first_child')
+
+    def __init__(self, name: str, attrs: Dict[str, str]):
+        self.name = name
+        self.attrs = attrs
+        self.texts: Optional[List[str]] = None
+        self.is_open = True
+        self.child_count = 0
+        self.first_child = None
+
+    def get_text(self) -> str:
+        return ''.join(self.texts or ())
+
+    def get_stripped_text(self) -> str:
+        """
+        Equivalent of BeautifulSoup's get_text(strip=True)
+        """
+        return ''.join(text.strip() for text in self.texts or () if text.strip())
+
+    @property
+    def string(self) -> Optional[str]:
+        """
+        Equivalent of BeautifulSoup's Tag.string
+        """
+        element = self
+        while element.child_count == 1:
+            if isinstance(element.first_child, str):
+                return element.first_child
+            element = element.first_child
+        return None
+
+
+def attribute_matches(attrs: Dict[str, str], attr: Optional[str], value) -> bool:
+    """
+    Attribute test with BeautifulSoup's find() semantics
+    """
+    if attr is None:
+        return True
+    actual = attrs.get(attr)
+    if actual is None:
+        return False
+    if hasattr(value, 'search'):
+        return bool(value.search(actual))
+    if attr == 'class':
+        # class is multi-valued: match any single class or the whole list
+        classes = NONWHITESPACE_RE.findall(actual)
+        return value in classes or value == ' '.join(classes)
+    return actual == value
+
+
+class SinglePassParser(HTMLParser):
+    """
+    Tokenizes a page once and records the elements matched by the selector table
+    """
+
+    def __init__(self, original_encoding: Optional[str] = None,
+                 selectors_by_tag: Dict[str, List[Selector]] = SELECTORS_BY_TAG):
+        super().__init__(convert_charrefs=False)
+        self.original_encoding = original_encoding
+        self.selectors_by_tag = selectors_by_tag
+        self.stack = [Element('[document]', {})]
+        self.collecting: List[Element] = []
+        self.current_data: List[str] = []
+        self.preserve_whitespace_depth = 0
+        self.string_container_depth = 0
+        self.already_closed_empty_element: List[str] = []
+        self.matches: Dict[str, object] = {}
+
+    # Tree building
+
+    def add_child(self, node):
+        parent = self.stack[-1]
+        parent.child_count += 1
+        if parent.child_count == 1:
+            parent.first_child = node
+
+    def end_data(self, string_type: str = 'text'):
+        if not self.current_data:
+            return
+        data = ''.join(self.current_data)
+        self.current_data = []
+
+        # Whitespace-only strings collapse to one space or newline outside <pre>/<textarea>
+        if not self.preserve_whitespace_depth and all(c in ASCII_SPACES for c in data):
+            data = '\n' if '\n' in data else ' '
+
+        self.add_child(data)
+        # Comments, doctypes etc. are never text; plain strings inside <script>,
+        # <style> etc. don't count as text of their ancestors either
+        if string_type == 'cdata' or (string_type == 'text' and not self.string_container_depth):
+            for element in self.collecting:
+                element.texts.append(data)
+
+    def pop_element(self):
+        element = self.stack.pop()
+        element.is_open = False
+        if element.texts is not None:
+            self.collecting.pop()
+        if element.name in PRESERVE_WHITESPACE_TAGS:
+            self.preserve_whitespace_depth -= 1
+        if element.name in STRING_CONTAINER_TAGS:
+            self.string_container_depth -= 1
+
+    def pop_to_tag(self, name: str):
+        for i in range(len(self.stack) - 1, 0, -1):
+            if self.stack[i].name == name:
+                while len(self.stack) > i:
+                    self.pop_element()
+                return
+
+    def match_selectors(self, element: Element):
+        for selector in self.selectors_by_tag.get(element.name, ()):
+            if not selector.many and selector.field in self.matches:
+                continue
+            if selector.within is not None:
+                # Only proper descendants of the scope element qualify
+                scope = self.matches.get(selector.within)
+                if scope is None or scope is element or not scope.is_open:
+                    continue
+            if not attribute_matches(element.attrs, selector.attr, selector.value):
+                continue
+
+            if element.texts is None:
+                element.texts = []
+                self.collecting.append(element)
+            if selector.many:
+                self.matches.setdefault(selector.field, []).append(element)
+            else:
+                self.matches[selector.field] = element
+
+    # html.parser callbacks, mirroring bs4's BeautifulSoupHTMLParser
+
+    def handle_starttag(self, name, attrs, handle_empty_element=True):
+        attr_dict = {}
+        for key, value in attrs:
+            attr_dict[key] = '' if value is None else value
+
+        self.end_data()
+        element = Element(name, attr_dict)
+        self.add_child(element)
+        self.stack.append(element)
+        if name in PRESERVE_WHITESPACE_TAGS:
+            self.preserve_whitespace_depth += 1
+        if name in STRING_CONTAINER_TAGS:
+            self.string_container_depth += 1
+        if name in self.selectors_by_tag:
+            self.match_selectors(element)
+
+        if handle_empty_element and name in EMPTY_ELEMENT_TAGS:
+            self.handle_endtag(name, check_already_closed=False)
+            self.already_closed_empty_element.append(name)
+
+    def handle_startendtag(self, name, attrs):
+        self.handle_starttag(name, attrs, handle_empty_element=False)
+        self.handle_endtag(name)
+
+    def handle_endtag(self, name, check_already_closed=True):
+        if check_already_closed and name in self.already_closed_empty_element:
+            self.already_closed_empty_element.remove(name)
+        else:
+            self.end_data()
+            self.pop_to_tag(name)
+
+    def handle_data(self, data):
+        self.current_data.append(data)
+
+    def handle_charref(self, name):
+        if name.startswith('x'):
+            real_name = int(name.lstrip('x'), 16)
+        elif name.startswith('X'):
+            real_name = int(name.lstrip('X'), 16)
+        else:
+            real_name = int(name)
+
+        data = None
+        if real_name < 256:
+            for encoding in (self.original_encoding, 'windows-1252'):
+                if not encoding:
+                    continue
+                try:
+                    data = bytearray([real_name]).decode(encoding)
+                except UnicodeDecodeError:
+                    pass
+        if not data:
+            try:
+                data = chr(real_name)
+            except (ValueError, OverflowError):
+                pass
+        self.handle_data(data or '\N{REPLACEMENT CHARACTER}')
+
+    def handle_entityref(self, name):
+        character = EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)
+        self.handle_data(character if character is not None else f'&{name}')
+
+    def handle_comment(self, data):
+        self.end_data()
+        self.handle_data(data)
+        self.end_data('other')
+
+    def handle_decl(self, data):
+        self.end_data()
+        self.handle_data(data[len('DOCTYPE '):])
+        self.end_data('other')
+
+    def unknown_decl(self, data):
+        is_cdata = data.upper().startswith('CDATA[')
+        if is_cdata:
+            data = data[len('CDATA['):]
+        self.end_data()
+        self.handle_data(data)
+        self.end_data('cdata' if is_cdata else 'other')
+
+    def handle_pi(self, data):
+        self.end_data()
+        self.handle_data(data)
+        self.end_data('other')
+
+    def finish(self):
+        """
+        Flush trailing text and close any elements left open
+        """
+        self.close()
+        self.end_data()
+        while len(self.stack) > 1:
+            self.pop_element()
+
+
+class SoupExtractor:
+    """
+    Original backend: parse with BeautifulSoup and search the tree per field
+    """
+
+    name = 'soup'
+
+    def __init__(self, scraper):
+        self.scraper = scraper
+
+    def extract(self, content: bytes, sku: int, url: str) -> Optional[Dict]:
+        """
+        Return the product record, or None when the page is not a valid product page
+        """
+        metrics = self.scraper.metrics
+        with metrics.time('parse'):
+            soup = BeautifulSoup(content, 'html.parser')
+        with metrics.time('validate'):
+            is_valid = self.scraper.is_valid_product_page(soup, url)
+        if not is_valid:
+            return None
+        with metrics.time('extract'):
+            return self.scraper.extract_product_data(soup, sku, url)
+
+
+class FastExtractor:
+    """
+    Single-pass backend driven by PRODUCT_SELECTORS
+    """
+
+    name = 'fast'
+
+    def __init__(self, scraper):
+        self.logger = scraper.logger
+        self.metrics = scraper.metrics
+
+    def parse(self, content: bytes) -> Dict[str, object]:
+        """
+        Walk the page once and return the matched elements keyed by selector field
+        """
+        # Decode exactly like BeautifulSoup does for byte input
+        dammit = UnicodeDammit(content, is_html=True)
+        parser = SinglePassParser(dammit.original_encoding)
+        try:
+            parser.feed(dammit.unicode_markup)
+            parser.finish()
+        except AssertionError as e:
+            # html.parser rejects some malformed declarations this way; BeautifulSoup re-raises it like this
+            raise ParserRejectedMarkup(e)
+        return parser.matches
+
+    def is_valid(self, matches: Dict[str, object], url: str) -> bool:
+        title = matches.get('title')
+        has_errors = ('error_div' in matches
+                      or any(self.has_error_text(h1) for h1 in matches.get('headings', ()))
+                      or any(self.has_error_text(t) for t in matches.get('page_titles', ())))
+        return (title is not None and 'container' in matches and not has_errors
+                and len(title.get_text().strip()) > 3)
+
+    @staticmethod
+    def has_error_text(element: Element) -> bool:
+        string = element.string
+        return string is not None and bool(ERROR_TEXT_RE.search(string))
+
+    def extract(self, content: bytes, sku: int, url: str) -> Optional[Dict]:
+        """
+        Return the product record, or None when the page is not a valid product page
+        """
+        # Markup the parser rejects raises, as with the soup backend, and settles as an error
+        with self.metrics.time('parse'):
+            matches = self.parse(content)
+        try:
+            with self.metrics.time('validate'):
+                is_valid = self.is_valid(matches, url)
+            if not is_valid:
+                return None
+        except Exception as e:
+            self.logger.warning(f"Error validating page {url}: {str(e)}")
+            return None
+
+        product_data = new_product_record(sku, url)
+        try:
+            with self.metrics.time('extract'):
+                self.fill_product_data(product_data, matches, url)
+        except Exception as e:
+            self.logger.error(f"Error extracting data for SKU {sku}: {str(e)}")
+        return product_data
+
+    def fill_product_data(self, product_data: Dict, matches: Dict[str, object], url: str):
+        """
+        Derive every product field from the matched elements
+        """
+        product_data['product_name'] = matches['title'].get_text().strip()
+
+        price_elem = matches.get('price')
+        if price_elem:
+            price_text = price_elem.get_text().strip()
+            product_data['price'] = price_text
+            price_match = PRICE_RE.search(price_text.replace(',', ''))
+            if price_match:
+                try:
+                    product_data['price_numeric'] = float(price_match.group())
+                except ValueError:
+                    pass
+
+        desc_content = matches.get('desc_content')
+        if desc_content:
+            product_data['product_description'] = desc_content.get_stripped_text()
+            features = []
+            for p in matches.get('desc_paragraphs', ()):
+                text = p.get_text().strip()
+                if text and ('●' in text or 'Features:' in text):
+                    features.append(text)
+            product_data['product_features'] = ' | '.join(features)
+
+        if 'stock' in matches:
+            product_data['stock_status'] = matches['stock'].get_text().strip()
+
+        if 'model' in matches:
+            product_data['model'] = matches['model'].get_text().strip()
+
+        if 'brand' in matches:
+            product_data['brand'] = matches['brand'].get_text().strip()
+            product_data['manufacturer'] = product_data['brand']
+
+        if 'breadcrumb' in matches:
+            breadcrumb_items = [li.get_text().strip() for li in matches.get('breadcrumb_items', [])[1:]]
+            if breadcrumb_items:
+                product_data['category'] = ' > '.join(breadcrumb_items[:-1])
+
+        if 'tags_div' in matches:
+            tags = [link.get_text().strip() for link in matches.get('tag_links', ())]
+            product_data['tags'] = ', '.join(tags)
+
+        rating_div = matches.get('rating')
+        if rating_div:
+            product_data['rating'] = len(matches.get('rating_stars', ()))
+            review_match = REVIEW_COUNT_RE.search(rating_div.get_text())
+            if review_match:
+                product_data['review_count'] = int(review_match.group(1))
+
+        product_images = [img for img in matches.get('images', ())
+                          if img.attrs.get('alt') == product_data['product_name']]
+        if product_images and product_images[0].attrs.get('src'):
+            product_data['main_image_url'] = urljoin(url, product_images[0].attrs['src'])
+        # dict.fromkeys drops repeated URLs in one pass, keeping page order
+        product_data['image_urls'] = list(dict.fromkeys(urljoin(url, img.attrs['src'])
+                                                        for img in product_images if img.attrs.get('src')))
+
+        labels = matches.get('labels')
+        if labels:
+            product_data['product_labels'] = ', '.join(label.get_text().strip() for label in labels)
+
+        if 'stats' in matches:
+            specs = {}
+            for li in matches.get('stats_items', ()):
+                text = li.get_text()
+                if ':' in text:
+                    key, value = text.split(':', 1)
+                    specs[key.strip().replace(':', '')] = value.strip()
+            product_data['specifications'] = specs
+
+
+EXTRACTOR_BACKENDS = {
+    SoupExtractor.name: SoupExtractor,
+    FastExtractor.name: FastExtractor,
+}
+
+
+def create_extractor(name: str, scraper):
+    """
+    Instantiate an extractor backend by name
+    """
+    if name not in EXTRACTOR_BACKENDS:
+        raise ValueError(f"Unknown extractor backend '{name}', expected one of {sorted(EXTRACTOR_BACKENDS)}")
+    return EXTRACTOR_BACKENDS[name](scraper)
+
+
+def compare_extractors(content: bytes, sku: int, url: str, scraper) -> Dict[str, tuple]:
+    """
+    Run both backends on one page and return the fields where they disagree
+
+    scraped_at is excluded since it records the extraction time.
+    """
+    results = [create_extractor(name, scraper).extract(content, sku, url) for name in ('soup', 'fast')]
+    if results[0] is None or results[1] is None:
+        return {} if results[0] is results[1] else {'valid': (results[0] is not None, results[1] is not None)}
+    soup_fields, fast_fields = product_fields(results[0]), product_fields(results[1])
+    return {key: (soup_fields[key], fast_fields.get(key)) for key in soup_fields
+            if soup_fields[key] != fast_fields.get(key)}
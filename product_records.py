@@ -0,0 +1,237 @@
+"""
+Compact in-memory storage for scraped product records
+
+Author: Business Analytics Team
+Purpose: Hold large catalogs in memory at a fraction of the cost of one dict per product
+"""
+
+import json
+import tempfile
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+
+from product_extractors import new_product_record
+
+# Field order of a product record, kept when records are rebuilt
+RECORD_FIELDS = tuple(new_product_record(0, '').keys())
+
+# Columns by storage type
+INT_FIELDS = ('sku', 'rating', 'review_count')
+FLOAT_FIELDS = ('price_numeric',)
+# Few distinct values, stored once and referenced by code
+CODED_FIELDS = ('currency', 'stock_status', 'brand', 'manufacturer', 'category', 'product_labels')
+TEXT_FIELDS = ('url', 'product_name', 'price', 'model', 'tags', 'main_image_url')
+# Long free text that may be spilled to disk
+SPILL_FIELDS = ('product_description', 'product_features', 'reviews_text')
+# Nested values, kept as JSON text
+JSON_FIELDS = {'image_urls': list, 'specifications': dict}
+
+# Timestamps are kept as integer microseconds since this naive epoch, which round-trips isoformat() exactly
+EPOCH = datetime(1970, 1, 1)
+
+# Marks a field that was absent from the appended record
+MISSING = object()
+
+
+class TextColumn:
+    """
+    Strings packed end to end as UTF-8, in memory or in a temporary file
+
+    One bytes buffer plus an 8-byte end offset per value replaces a Python
+    str object (about 50 bytes of overhead each) per value.
+    """
+
+    def __init__(self, spill: bool = False):
+        self.file = tempfile.TemporaryFile() if spill else None
+        self.data = bytearray()
+        self.ends = array('q')
+
+    def __len__(self) -> int:
+        return len(self.ends)
+
+    def append(self, text: str):
+        data = text.encode('utf-8', 'surrogatepass')
+        end = (self.ends[-1] if self.ends else 0) + len(data)
+        if self.file:
+            self.file.seek(0, 2)
+            self.file.write(data)
+        else:
+            self.data += data
+        self.ends.append(end)
+
+    def __getitem__(self, index: int) -> str:
+        start = self.ends[index - 1] if index else 0
+        end = self.ends[index]
+        if self.file:
+            self.file.seek(start)
+            data = self.file.read(end - start)
+        else:
+            data = self.data[start:end]
+        return data.decode('utf-8', 'surrogatepass')
+
+    def close(self):
+        if self.file:
+            self.file.close()
+
+
+class CodedColumn:
+    """
+    Low-cardinality strings stored once each and referenced by a 4-byte code
+    """
+
+    def __init__(self):
+        self.values: List[str] = []
+        self.codes: Dict[str, int] = {}
+        self.rows = array('I')
+
+    def append(self, value: str):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        self.rows.append(code)
+
+    def __getitem__(self, index: int) -> str:
+        return self.values[self.rows[index]]
+
+
+class CompactProductStore:
+    """
+    Column-oriented, append-only store of product records
+
+    Numbers and timestamps live in typed arrays, repeated strings such as
+    brand, category and currency are stored once, and other text is packed
+    into byte buffers; with spill_text=True the long free-text fields go to
+    temporary files instead. Iterating yields records equal to the dicts
+    that were appended, in the same field order, so every output built from
+    them is unchanged. A value of an unexpected type is kept as-is on the
+    side instead of in its column.
+    """
+
+    def __init__(self, spill_text: bool = False):
+        self.spill_text = spill_text
+        self.ints: Dict[str, array] = {field: array('q') for field in INT_FIELDS}
+        self.floats: Dict[str, array] = {field: array('d') for field in FLOAT_FIELDS}
+        self.coded: Dict[str, CodedColumn] = {field: CodedColumn() for field in CODED_FIELDS}
+        self.texts: Dict[str, TextColumn] = {field: TextColumn() for field in TEXT_FIELDS + tuple(JSON_FIELDS)}
+        self.texts.update((field, TextColumn(spill_text)) for field in SPILL_FIELDS)
+        self.scraped_at = array('q')
+        # Row -> fields that did not fit their column, plus any keys beyond RECORD_FIELDS
+        self.extras: Dict[int, Dict] = {}
+
+    def __len__(self) -> int:
+        return len(self.scraped_at)
+
+    def append(self, product_data: Dict):
+        extra = {key: value for key, value in product_data.items() if key not in RECORD_FIELDS}
+
+        for field, column in self.ints.items():
+            value = product_data.get(field, MISSING)
+            if type(value) is not int or not -2 ** 63 <= value < 2 ** 63:
+                extra[field] = value
+                value = 0
+            column.append(value)
+        for field, column in self.floats.items():
+            value = product_data.get(field, MISSING)
+            if type(value) is not float:
+                extra[field] = value
+                value = 0.0
+            column.append(value)
+
+        for field, column in self.coded.items():
+            value = product_data.get(field, MISSING)
+            if type(value) is not str:
+                extra[field] = value
+                value = ''
+            column.append(value)
+        for field, column in self.texts.items():
+            value = product_data.get(field, MISSING)
+            if field in JSON_FIELDS:
+                value = self.encode_json(value, JSON_FIELDS[field])
+                if value is None:
+                    extra[field] = product_data.get(field, MISSING)
+            if type(value) is not str:
+                if field not in JSON_FIELDS:
+                    extra[field] = value
+                value = ''
+            column.append(value)
+
+        scraped_at = product_data.get('scraped_at', MISSING)
+        micros = self.timestamp_micros(scraped_at)
+        if micros is None:
+            extra['scraped_at'] = scraped_at
+            micros = 0
+        self.scraped_at.append(micros)
+
+        if extra:
+            self.extras[len(self) - 1] = extra
+
+    @staticmethod
+    def encode_json(value, kind: type) -> Optional[str]:
+        """
+        JSON text of a list or dict of strings, or None if it would not decode back to an equal value
+        """
+        if type(value) is not kind:
+            return None
+        if kind is list and not all(type(item) is str for item in value):
+            return None
+        if kind is dict and not all(type(key) is str and type(item) is str for key, item in value.items()):
+            return None
+        return json.dumps(value, ensure_ascii=False)
+
+    @staticmethod
+    def timestamp_micros(value) -> Optional[int]:
+        """
+        Microseconds since EPOCH of a naive ISO timestamp, or None if it would not round-trip exactly
+        """
+        if type(value) is not str:
+            return None
+        try:
+            timestamp = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+        if timestamp.tzinfo is not None:
+            return None
+        micros = (timestamp - EPOCH) // timedelta(microseconds=1)
+        return micros if (EPOCH + timedelta(microseconds=micros)).isoformat() == value else None
+
+    def record(self, index: int) -> Dict:
+        """
+        Rebuild the product record at index
+        """
+        values = {field: column[index] for field, column in self.ints.items()}
+        values.update((field, column[index]) for field, column in self.floats.items())
+        values.update((field, column[index]) for field, column in self.coded.items())
+        values.update((field, column[index]) for field, column in self.texts.items())
+        values['scraped_at'] = (EPOCH + timedelta(microseconds=self.scraped_at[index])).isoformat()
+
+        extra = self.extras.get(index)
+        for field in JSON_FIELDS:
+            if not extra or field not in extra:
+                values[field] = json.loads(values[field])
+        if extra:
+            values.update(extra)
+            product_data = {field: values[field] for field in RECORD_FIELDS}
+            product_data.update((key, value) for key, value in extra.items() if key not in product_data)
+            return {key: value for key, value in product_data.items() if value is not MISSING}
+        return {field: values[field] for field in RECORD_FIELDS}
+
+    def __getitem__(self, index: int) -> Dict:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("product index out of range")
+        return self.record(index)
+
+    def __iter__(self) -> Iterator[Dict]:
+        for index in range(len(self)):
+            yield self.record(index)
+
+    def clear(self):
+        self.close()
+        self.__init__(self.spill_text)
+
+    def close(self):
+        for column in self.texts.values():
+            column.close()
@@ -0,0 +1,303 @@
+"""
+Full-text and faceted product search
+
+Author: Business Analytics Team
+Purpose: Answer keyword searches with brand, category, stock and price filters in milliseconds, without loading a crawl output
+"""
+
+import argparse
+import re
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+# Text indexed for keyword search, with the bm25 weight of a match in each column
+TEXT_COLUMNS = {
+    'product_name': 10.0,
+    'tags': 4.0,
+    'category': 3.0,
+    'specifications': 2.0,
+    'product_features': 1.0,
+    'product_description': 1.0,
+}
+
+# Fields that can be filtered on and counted
+FACETS = ('brand', 'category', 'stock_status')
+
+# Columns returned for each search hit
+RESULT_COLUMNS = ['sku', 'product_name', 'brand', 'category', 'stock_status', 'price_numeric', 'currency', 'url']
+
+
+def match_query(text: str) -> Optional[str]:
+    """
+    FTS5 query requiring every word of text, the last one as a prefix; None when text has no words
+
+    Words are quoted, so input such as "ESP32-C3 (WiFi)" cannot be read as FTS5 syntax.
+    """
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"' for word in words) + '*'
+
+
+def specifications_text(specifications) -> str:
+    if not isinstance(specifications, dict):
+        return ''
+    return ' '.join(f"{key} {value}" for key, value in specifications.items())
+
+
+class ProductSearchIndex:
+    """
+    SQLite FTS5 index of products, one row per SKU
+
+    Facet fields live in an ordinary table with an index per facet; the
+    text lives in an FTS5 table sharing the SKU as rowid. Adding a product
+    replaces its previous version, so the index can be kept across crawls
+    and always reflects the latest scrape of each SKU. Writes are batched
+    like the price history; call flush() before querying from elsewhere.
+    With check_same_thread=False one index can serve queries from several
+    threads, one at a time, as the dashboard's cached index does behind a lock.
+    """
+
+    def __init__(self, path: str = "product_search.db", batch_size: int = 500, check_same_thread: bool = True):
+        self.path = path
+        self.batch_size = batch_size
+        self.conn = sqlite3.connect(path, check_same_thread=check_same_thread)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS products (
+                sku INTEGER PRIMARY KEY,
+                product_name TEXT,
+                brand TEXT,
+                category TEXT,
+                stock_status TEXT,
+                price_numeric REAL,
+                currency TEXT,
+                url TEXT,
+                scraped_at TEXT
+            )
+        """)
+        # Covers the facet counts, so they never touch the table rows
+        self.conn.execute(
+            f"CREATE INDEX IF NOT EXISTS products_facets ON products ({', '.join(FACETS)}, price_numeric)"
+        )
+        for column in ('category', 'stock_status', 'price_numeric'):
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS products_{column} ON products ({column})")
+        self.conn.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS product_text USING fts5({', '.join(TEXT_COLUMNS)}, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+        self.conn.commit()
+        self.pending: Dict[int, Optional[Dict]] = {}
+        self.modified = False
+
+    def add(self, product_data: Dict):
+        """
+        Queue a product for indexing, replacing any earlier version of its SKU
+        """
+        self.pending[product_data['sku']] = product_data
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def remove(self, sku: int):
+        """
+        Queue the removal of a SKU that no longer has a product page
+        """
+        self.pending[sku] = None
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        skus = [(sku,) for sku in self.pending]
+        products = [product for product in self.pending.values() if product]
+        with self.conn:
+            self.conn.executemany("DELETE FROM products WHERE sku = ?", skus)
+            self.conn.executemany("DELETE FROM product_text WHERE rowid = ?", skus)
+            self.conn.executemany(
+                f"INSERT INTO products ({', '.join(RESULT_COLUMNS)}, scraped_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [tuple(product.get(column) for column in RESULT_COLUMNS) + (product.get('scraped_at'),)
+                 for product in products]
+            )
+            self.conn.executemany(
+                f"INSERT INTO product_text (rowid, {', '.join(TEXT_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(product['sku'],) + tuple(specifications_text(product.get('specifications'))
+                                           if column == 'specifications' else product.get(column) or ''
+                                           for column in TEXT_COLUMNS)
+                 for product in products]
+            )
+        self.pending = {}
+        self.modified = True
+
+    def add_all(self, products: Iterable[Dict]):
+        for product_data in products:
+            self.add(product_data)
+        self.flush()
+
+    def product_count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    def where_clause(self, text: str, filters: Dict[str, Optional[Sequence[str]]], min_price: Optional[float],
+                     max_price: Optional[float]) -> Tuple[str, str, List]:
+        """
+        FROM/JOIN and WHERE SQL for a keyword query and facet filters, with their parameters
+        """
+        source = "products"
+        conditions, params = [], []
+        query = match_query(text)
+        if query:
+            source = "product_text JOIN products ON products.sku = product_text.rowid"
+            conditions.append("product_text MATCH ?")
+            params.append(query)
+        for column, values in filters.items():
+            if values:
+                conditions.append(f"products.{column} IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+        if min_price is not None:
+            conditions.append("products.price_numeric >= ?")
+            params.append(min_price)
+        if max_price is not None:
+            conditions.append("products.price_numeric <= ?")
+            params.append(max_price)
+        return source, f"WHERE {' AND '.join(conditions)}" if conditions else "", params
+
+    def search(self, text: str = '', brands: Optional[Sequence[str]] = None,
+               categories: Optional[Sequence[str]] = None, stock_statuses: Optional[Sequence[str]] = None,
+               min_price: Optional[float] = None, max_price: Optional[float] = None,
+               limit: int = 50, offset: int = 0) -> pd.DataFrame:
+        """
+        Products matching every word of text and the filters, best match first
+
+        Without text, the filtered products are returned in SKU order. Each
+        filter accepts several values, any of which may match.
+        """
+        filters = {'brand': brands, 'category': categories, 'stock_status': stock_statuses}
+        source, where, params = self.where_clause(text, filters, min_price, max_price)
+        columns = ', '.join(f"products.{column}" for column in RESULT_COLUMNS)
+        if match_query(text):
+            weights = ', '.join(str(weight) for weight in TEXT_COLUMNS.values())
+            sql = (f"SELECT {columns}, bm25(product_text, {weights}) AS score FROM {source} {where} "
+                   "ORDER BY score LIMIT ? OFFSET ?")
+        else:
+            sql = f"SELECT {columns} FROM {source} {where} ORDER BY products.sku LIMIT ? OFFSET ?"
+        return pd.read_sql_query(sql, self.conn, params=params + [limit, offset])
+
+    def count(self, text: str = '', brands: Optional[Sequence[str]] = None,
+              categories: Optional[Sequence[str]] = None, stock_statuses: Optional[Sequence[str]] = None,
+              min_price: Optional[float] = None, max_price: Optional[float] = None) -> int:
+        """
+        Number of products matching text and the filters
+        """
+        filters = {'brand': brands, 'category': categories, 'stock_status': stock_statuses}
+        source, where, params = self.where_clause(text, filters, min_price, max_price)
+        return self.conn.execute(f"SELECT COUNT(*) FROM {source} {where}", params).fetchone()[0]
+
+    def facets(self, text: str = '', brands: Optional[Sequence[str]] = None,
+               categories: Optional[Sequence[str]] = None, stock_statuses: Optional[Sequence[str]] = None,
+               min_price: Optional[float] = None, max_price: Optional[float] = None,
+               limit: int = 50) -> Dict[str, Dict[str, int]]:
+        """
+        Matching product counts per value of each facet, most common first
+
+        A facet's own filter is left out when counting it, so the counts
+        show what selecting another value of that facet would return. One
+        query counts every combination of facet values matching the text and
+        price filters; the facet filters are applied to those few rows.
+        """
+        filters = {'brand': brands, 'category': categories, 'stock_status': stock_statuses}
+        source, where, params = self.where_clause(text, {}, min_price, max_price)
+        columns = ', '.join(f"products.{facet}" for facet in FACETS)
+        combinations = self.conn.execute(f"SELECT {columns}, COUNT(*) FROM {source} {where} GROUP BY {columns}",
+                                         params).fetchall()
+
+        counts = {}
+        for position, facet in enumerate(FACETS):
+            others = [(i, set(filters[other])) for i, other in enumerate(FACETS) if other != facet and filters[other]]
+            facet_counts: Dict[str, int] = {}
+            for row in combinations:
+                if row[position] and all(row[i] in values for i, values in others):
+                    facet_counts[row[position]] = facet_counts.get(row[position], 0) + row[-1]
+            counts[facet] = dict(sorted(facet_counts.items(), key=lambda item: (-item[1], item[0]))[:limit])
+        return counts
+
+    def price_range(self) -> Tuple[Optional[float], Optional[float]]:
+        return self.conn.execute("SELECT MIN(price_numeric), MAX(price_numeric) FROM products").fetchone()
+
+    def optimize(self):
+        """
+        Write pending products and refresh the planner statistics, which steer facet counts to the covering index
+        """
+        self.flush()
+        if self.modified:
+            self.conn.execute("ANALYZE")
+            self.conn.commit()
+            self.modified = False
+
+    def close(self):
+        self.optimize()
+        self.conn.close()
+
+
+def read_output_products(path: str) -> Iterable[Dict]:
+    """
+    Product records of a Parquet or CSV crawl output, for indexing a run that was crawled without an index
+    """
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=10000):
+            for product in batch.to_pylist():
+                if product.get('specifications') is not None:
+                    product['specifications'] = dict(product['specifications'])
+                yield product
+        return
+
+    for chunk in pd.read_csv(path, chunksize=10000, dtype=str, keep_default_na=False):
+        spec_columns = [column for column in chunk.columns if column.startswith('spec_')]
+        for product in chunk.to_dict('records'):
+            product['sku'] = int(product['sku'])
+            product['price_numeric'] = float(product['price_numeric']) if product.get('price_numeric') else None
+            product['specifications'] = {column[len('spec_'):]: product.pop(column)
+                                         for column in spec_columns if product.get(column)}
+            yield product
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and query the product search index")
+    parser.add_argument('--db', default="product_search.db", help="search index database")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help="index the products of a crawl output")
+    build.add_argument('output', help="Parquet or CSV crawl output")
+
+    search = commands.add_parser('search', help="keyword search with facet filters")
+    search.add_argument('words', nargs='*', help="keywords; all must match")
+    search.add_argument('--brand', action='append')
+    search.add_argument('--category', action='append')
+    search.add_argument('--stock-status', action='append')
+    search.add_argument('--min-price', type=float)
+    search.add_argument('--max-price', type=float)
+    search.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    index = ProductSearchIndex(args.db)
+    if args.command == 'build':
+        index.add_all(read_output_products(args.output))
+        index.optimize()
+        print(f"Indexed {index.product_count()} products in {args.db}")
+    elif args.command == 'search':
+        text = ' '.join(args.words)
+        filters = dict(brands=args.brand, categories=args.category, stock_statuses=args.stock_status,
+                       min_price=args.min_price, max_price=args.max_price)
+        results = index.search(text, limit=args.limit, **filters)
+        print(results.to_string(index=False) if not results.empty else "No matching products")
+        for facet, counts in index.facets(text, limit=10, **filters).items():
+            print(f"{facet}: {', '.join(f'{value} ({count})' for value, count in counts.items())}")
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Streaming columnar output for scraped products
+
+Author: Business Analytics Team
+Purpose: Append products to Parquet as they arrive instead of building one big DataFrame at the end
+"""
+
+import os
+from datetime import datetime
+from typing import Dict, List
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Fixed schema: core fields as typed columns, specifications as a string map
+PRODUCT_SCHEMA = pa.schema([
+    ('sku', pa.int64()),
+    ('product_name', pa.string()),
+    ('price', pa.string()),
+    ('price_numeric', pa.float64()),
+    ('currency', pa.string()),
+    ('stock_status', pa.string()),
+    ('brand', pa.string()),
+    ('manufacturer', pa.string()),
+    ('category', pa.string()),
+    ('model', pa.string()),
+    ('rating', pa.int32()),
+    ('review_count', pa.int32()),
+    ('product_labels', pa.string()),
+    ('tags', pa.string()),
+    ('product_description', pa.string()),
+    ('product_features', pa.string()),
+    ('main_image_url', pa.string()),
+    ('url', pa.string()),
+    ('scraped_at', pa.timestamp('us')),
+    ('reviews_text', pa.string()),
+    ('image_urls', pa.list_(pa.string())),
+    ('specifications', pa.map_(pa.string(), pa.string())),
+])
+
+
+def product_to_row(product: Dict) -> Dict:
+    """
+    Convert a product record to a row matching PRODUCT_SCHEMA
+    """
+    row = {field.name: product.get(field.name) for field in PRODUCT_SCHEMA}
+    if isinstance(row['scraped_at'], str):
+        row['scraped_at'] = datetime.fromisoformat(row['scraped_at'])
+    return row
+
+
+class ParquetProductWriter:
+    """
+    Buffers products and appends them to a Parquet file one record batch at a time
+
+    Memory use is bounded by batch_size rows. Rows go to path + '.partial'
+    until close() has written the footer and renamed the file into place, so
+    a killed run never leaves an unreadable file under the output name.
+    """
+
+    def __init__(self, path: str, batch_size: int = 1000):
+        self.path = path
+        self.partial_path = f"{path}.partial"
+        self.batch_size = batch_size
+        self.writer = pq.ParquetWriter(self.partial_path, PRODUCT_SCHEMA, compression='zstd')
+        self.buffer: List[Dict] = []
+        self.rows_written = 0
+
+    def write(self, product: Dict):
+        self.buffer.append(product_to_row(product))
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        batch = pa.RecordBatch.from_pylist(self.buffer, schema=PRODUCT_SCHEMA)
+        self.writer.write_batch(batch)
+        self.rows_written += len(self.buffer)
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        os.replace(self.partial_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,276 @@
+"""
+Rate limiting primitives for polite crawling
+
+Author: Business Analytics Team
+Purpose: Share a per-host request budget between concurrent crawl workers
+"""
+
+import asyncio
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+from tenacity import RetryCallState, wait_random_exponential
+
+# Responses that mean the server is overloaded; the controller backs off on them
+THROTTLE_STATUSES = {429, 502, 503, 504}
+
+# Responses worth retrying; None stands for a failed request (connection error or timeout)
+TRANSIENT_STATUSES = {None, 429, 500, 502, 503, 504}
+
+# Jittered exponential backoff between retries, in seconds
+RETRY_BACKOFF_BASE = 0.5
+RETRY_BACKOFF_MAX = 30.0
+
+# The one backoff policy: tenacity's Retrying uses it directly, the async retry loops through backoff_delay
+RETRY_BACKOFF = wait_random_exponential(multiplier=RETRY_BACKOFF_BASE, max=RETRY_BACKOFF_MAX)
+
+# Longest Retry-After we honour, so a misconfigured server cannot stall a crawl
+RETRY_AFTER_MAX = 300.0
+
+
+def is_transient(status_code: Optional[int]) -> bool:
+    return status_code in TRANSIENT_STATUSES
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Seconds to wait from a Retry-After header given as seconds or as an HTTP date
+    """
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), RETRY_AFTER_MAX)
+
+
+def backoff_delay(attempt: int) -> float:
+    """
+    RETRY_BACKOFF delay before retrying after failed attempt number `attempt` (1-based)
+    """
+    retry_state = RetryCallState(None, None, (), {})
+    retry_state.attempt_number = attempt
+    return RETRY_BACKOFF(retry_state)
+
+
+class TokenBucket:
+    """
+    Async token bucket: refills at `rate` tokens per second up to `capacity`
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        # Nothing accrues before `updated`, which a pause moves to its end
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def set_rate(self, rate: float):
+        """
+        Change the refill rate from now on; tokens earned so far are counted at the old rate
+        """
+        self._refill()
+        self.rate = rate
+
+    async def acquire(self):
+        """
+        Wait until a token is available and consume it
+        """
+        # The lock keeps waiters in FIFO order so no worker starves
+        async with self._lock:
+            while True:
+                paused = self.paused_until - time.monotonic()
+                if paused > 0:
+                    await asyncio.sleep(paused)
+                    continue
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """
+        Hand out no tokens for the next `seconds`, then restart from an empty bucket
+        """
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+        # Refill from the end of the pause, or the pause itself would be credited as a full burst
+        self.updated = self.paused_until
+
+
+class HostRateLimiter:
+    """
+    One token bucket per host, shared by every worker of a crawl
+    """
+
+    def __init__(self, requests_per_second: float = 2.0, burst: Optional[float] = None):
+        self.requests_per_second = requests_per_second
+        self.burst = burst if burst is not None else 1.0
+        self.buckets: Dict[str, TokenBucket] = {}
+
+    def bucket_for(self, url: str) -> TokenBucket:
+        host = urlparse(url).netloc
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.requests_per_second, self.burst)
+        return self.buckets[host]
+
+    async def acquire(self, url: str):
+        """
+        Wait for permission to send a request to the host of `url`
+        """
+        await self.bucket_for(url).acquire()
+
+    async def release(self, url: str, status_code: Optional[int] = None, latency: Optional[float] = None,
+                      retry_after: Optional[float] = None):
+        """
+        Report how a request to the host of `url` went; the fixed-rate limiter only honours Retry-After
+        """
+        if retry_after:
+            self.bucket_for(url).pause(retry_after)
+
+
+class AimdController:
+    """
+    Additive-increase / multiplicative-decrease control of a request rate and a concurrency limit
+
+    Each healthy response raises the rate by `increase` requests per second
+    per second of traffic and the concurrency limit by about one per window
+    of responses. A throttling status, a failed request, or a smoothed
+    latency above latency_factor times the best seen, cuts both by
+    `decrease` (at most once per cooldown, so one burst of bad responses
+    counts as one congestion signal).
+    """
+
+    def __init__(self, rate: float, max_rate: float, min_rate: float = 0.1, max_concurrency: int = 1,
+                 increase: float = 0.5, decrease: float = 0.5, latency_factor: float = 3.0, cooldown: float = 1.0):
+        self.rate = rate
+        self.max_rate = max(max_rate, rate)
+        self.min_rate = min_rate
+        self.concurrency = float(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.cooldown = cooldown
+        self.latency: Optional[float] = None
+        self.best_latency: Optional[float] = None
+        self.last_decrease = 0.0
+
+    @property
+    def interval(self) -> float:
+        """
+        Delay between requests at the current rate
+        """
+        return 1 / self.rate
+
+    @property
+    def concurrency_limit(self) -> int:
+        return max(1, int(self.concurrency))
+
+    def on_response(self, status_code: Optional[int], latency: Optional[float] = None):
+        if status_code is None or status_code in THROTTLE_STATUSES or self.is_slow(latency):
+            self.back_off()
+        else:
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+
+    def is_slow(self, latency: Optional[float]) -> bool:
+        if latency is None:
+            return False
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        # The baseline drifts up slowly so a permanently slower server is eventually accepted
+        self.best_latency = self.latency if self.best_latency is None else min(self.latency,
+                                                                               self.best_latency * 1.001)
+        return self.latency > self.best_latency * self.latency_factor
+
+    def back_off(self):
+        now = time.monotonic()
+        if now - self.last_decrease < self.cooldown:
+            return
+        self.last_decrease = now
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        self.concurrency = max(1.0, self.concurrency * self.decrease)
+
+
+class AdaptiveHostLimiter(HostRateLimiter):
+    """
+    Per-host limiter whose rate and concurrency follow server feedback (see AimdController)
+
+    Every acquire() that returns must be paired with a release() carrying
+    the response status and latency; an acquire() cancelled while waiting
+    holds nothing. Retry-After pauses the host's bucket.
+    """
+
+    def __init__(self, requests_per_second: float = 2.0, max_requests_per_second: Optional[float] = None,
+                 concurrency: int = 10, burst: Optional[float] = None):
+        super().__init__(requests_per_second, burst)
+        self.max_requests_per_second = max_requests_per_second or requests_per_second * 10
+        self.concurrency = concurrency
+        self.controllers: Dict[str, AimdController] = {}
+        self.in_flight: Dict[str, int] = {}
+        self._slot_freed = asyncio.Condition()
+
+    def controller_for(self, url: str) -> AimdController:
+        host = urlparse(url).netloc
+        if host not in self.controllers:
+            self.controllers[host] = AimdController(self.requests_per_second, self.max_requests_per_second,
+                                                    max_concurrency=self.concurrency)
+            self.in_flight[host] = 0
+        return self.controllers[host]
+
+    async def acquire(self, url: str):
+        """
+        Wait for a concurrency slot and a token for the host of `url`
+
+        If cancelled while waiting, acquire() holds no slot, so callers call
+        it before, not inside, the try block whose finally releases.
+        """
+        host = urlparse(url).netloc
+        controller = self.controller_for(url)
+        async with self._slot_freed:
+            await self._slot_freed.wait_for(lambda: self.in_flight[host] < controller.concurrency_limit)
+            self.in_flight[host] += 1
+
+        bucket = self.bucket_for(url)
+        bucket.set_rate(controller.rate)
+        try:
+            await bucket.acquire()
+        except asyncio.CancelledError:
+            # The caller only releases after acquire() returns, so a cancelled wait gives the slot back here
+            await self._free_slot(host)
+            raise
+
+    async def release(self, url: str, status_code: Optional[int] = None, latency: Optional[float] = None,
+                      retry_after: Optional[float] = None):
+        host = urlparse(url).netloc
+        self.controller_for(url).on_response(status_code, latency)
+        await super().release(url, status_code, latency, retry_after)
+        await self._free_slot(host)
+
+    async def _free_slot(self, host: str):
+        # Counted down at once and announced from a shielded task, so a cancellation
+        # while waiting for the lock neither leaks the slot nor loses the wakeup
+        self.in_flight[host] -= 1
+        await asyncio.shield(self._notify_slot_freed())
+
+    async def _notify_slot_freed(self):
+        async with self._slot_freed:
+            self._slot_freed.notify_all()
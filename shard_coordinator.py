@@ -0,0 +1,332 @@
+"""
+Sharded crawling: a SQLite lease coordinator and the workers that use it
+
+Author: Business Analytics Team
+Purpose: Split the SKU range into shards so several processes or machines can crawl it together
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sqlite3
+import time
+from collections import namedtuple
+from contextlib import suppress
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, Optional
+
+from product_aggregates import ProductAggregates, aggregates_path
+from product_writers import ParquetProductWriter
+
+# Shard states
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+Shard = namedtuple('Shard', ['shard_id', 'start_sku', 'end_sku'])
+
+
+class ShardCoordinator:
+    """
+    Lease queue of SKU shards and the merged results, in one SQLite database
+
+    A worker leases a pending shard for lease_seconds and renews the lease
+    with heartbeat() while it crawls. A shard whose lease expires (its
+    worker died) is handed to the next worker that asks, up to max_attempts
+    leases. Results are keyed by SKU, so a shard crawled twice merges into
+    one row per product, keeping the most recent scrape.
+
+    Every process opens its own connection; on one box, or on machines that
+    share a local-disk database through a single host, SQLite's locking
+    serializes the lease updates.
+    """
+
+    def __init__(self, path: str = "shards.db", lease_seconds: float = 120.0, max_attempts: int = 5):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # Autocommit mode; lease changes use explicit BEGIN IMMEDIATE transactions. Workers renew
+        # leases from a helper thread, one call at a time, so the connection is not tied to one thread
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS shards (
+                shard_id INTEGER PRIMARY KEY,
+                start_sku INTEGER NOT NULL,
+                end_sku INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                worker TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                products INTEGER,
+                pages INTEGER
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                sku INTEGER PRIMARY KEY,
+                shard_id INTEGER NOT NULL,
+                worker TEXT NOT NULL,
+                scraped_at TEXT NOT NULL,
+                product TEXT NOT NULL
+            )
+        """)
+
+    def plan(self, start_sku: int, max_sku: int, shard_size: int = 500):
+        """
+        Replace the shard plan with shards of shard_size SKUs covering start_sku..max_sku
+        """
+        shards = [(start, min(start + shard_size - 1, max_sku), PENDING)
+                  for start in range(start_sku, max_sku + 1, shard_size)]
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute("DELETE FROM shards")
+            self.conn.execute("DELETE FROM results")
+            self.conn.executemany("INSERT INTO shards (start_sku, end_sku, state) VALUES (?, ?, ?)", shards)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def lease(self, worker_id: str) -> Optional[Shard]:
+        """
+        Lease the next pending or expired shard to worker_id, or None when there is none left
+        """
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Shards that used up their attempts are given up on rather than crashing worker after worker
+            self.conn.execute(
+                "UPDATE shards SET state = ?, worker = NULL WHERE state = ? AND lease_expires < ? AND attempts >= ?",
+                (FAILED, LEASED, now, self.max_attempts)
+            )
+            row = self.conn.execute(
+                "SELECT shard_id, start_sku, end_sku FROM shards "
+                "WHERE state = ? OR (state = ? AND lease_expires < ?) ORDER BY shard_id LIMIT 1",
+                (PENDING, LEASED, now)
+            ).fetchone()
+            if row:
+                self.conn.execute(
+                    "UPDATE shards SET state = ?, worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                    "WHERE shard_id = ?",
+                    (LEASED, worker_id, now + self.lease_seconds, row[0])
+                )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return Shard(*row) if row else None
+
+    def heartbeat(self, shard: Shard, worker_id: str) -> bool:
+        """
+        Renew a lease; False when the shard has meanwhile been leased to another worker
+        """
+        cursor = self.conn.execute(
+            "UPDATE shards SET lease_expires = ? WHERE shard_id = ? AND state = ? AND worker = ?",
+            (time.time() + self.lease_seconds, shard.shard_id, LEASED, worker_id)
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, shard: Shard, worker_id: str, products: Iterable[Dict], pages: int) -> bool:
+        """
+        Merge a shard's products and mark it done, in one transaction
+
+        Returns False, merging nothing, when worker_id no longer holds the
+        lease: the shard then belongs to the worker that leased it since.
+        """
+        rows = [(product['sku'], shard.shard_id, worker_id, product['scraped_at'],
+                 json.dumps(product, ensure_ascii=False)) for product in products]
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = self.conn.execute(
+                "UPDATE shards SET state = ?, lease_expires = NULL, products = ?, pages = ? "
+                "WHERE shard_id = ? AND state = ? AND worker = ?",
+                (DONE, len(rows), pages, shard.shard_id, LEASED, worker_id)
+            )
+            if cursor.rowcount != 1:
+                self.conn.execute("ROLLBACK")
+                return False
+            # Deduplicate by SKU, keeping the most recent scrape
+            self.conn.executemany(
+                "INSERT INTO results (sku, shard_id, worker, scraped_at, product) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(sku) DO UPDATE SET shard_id = excluded.shard_id, worker = excluded.worker, "
+                "scraped_at = excluded.scraped_at, product = excluded.product "
+                "WHERE excluded.scraped_at > results.scraped_at",
+                rows
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def state_counts(self) -> Dict[str, int]:
+        return dict(self.conn.execute("SELECT state, COUNT(*) FROM shards GROUP BY state"))
+
+    def product_count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def iter_products(self) -> Iterator[Dict]:
+        """
+        Yield the merged products in SKU order without loading them all at once
+        """
+        for (product_json,) in self.conn.execute("SELECT product FROM results ORDER BY sku"):
+            yield json.loads(product_json)
+
+    def close(self):
+        self.conn.close()
+
+
+def run_worker(coordinator_path: str, base_url: str, worker_id: Optional[str] = None, concurrency: int = 10,
+               requests_per_second: float = 2.0, lease_seconds: float = 120.0) -> int:
+    """
+    Crawl shards until none are left; returns the number of shards this worker completed
+    """
+    from ecommerce_scraper import EcommerceMarketScraper
+
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    logger = logging.getLogger(__name__)
+    coordinator = ShardCoordinator(coordinator_path, lease_seconds)
+    scraper = EcommerceMarketScraper(base_url, enable_logging=False, output_format='none')
+    completed = 0
+
+    async def crawl_shard(shard: Shard) -> bool:
+        """
+        Crawl a shard while renewing its lease; False when the lease was lost and the crawl abandoned
+        """
+        stopped = asyncio.Event()
+
+        async def keep_leased():
+            while True:
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(stopped.wait(), lease_seconds / 3)
+                    return
+                # A busy database can hold this write for the whole busy timeout, so keep it off the event loop
+                if not await asyncio.to_thread(coordinator.heartbeat, shard, worker_id):
+                    return
+
+        heartbeat = asyncio.create_task(keep_leased())
+        # Shards are crawled in full: the consecutive-failure stop only makes sense for the whole range
+        crawl = asyncio.create_task(scraper.crawl_async(
+            shard.start_sku, shard.end_sku, shard.end_sku - shard.start_sku + 1,
+            concurrency=concurrency, requests_per_second=requests_per_second))
+        try:
+            await asyncio.wait((crawl, heartbeat), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            # Stop rather than cancel, so a renewal still running in its thread ends before the connection is reused
+            stopped.set()
+            await asyncio.wait((heartbeat,))
+        if crawl.done():
+            # Re-raises a failed crawl
+            crawl.result()
+            return True
+
+        # Another worker has the shard now; crawling on would only duplicate its requests
+        logger.warning(f"Worker {worker_id} lost the lease on shard {shard.shard_id}; abandoning it")
+        crawl.cancel()
+        with suppress(asyncio.CancelledError):
+            await crawl
+        return False
+
+    while True:
+        shard = coordinator.lease(worker_id)
+        if shard is None:
+            break
+        logger.info(f"Worker {worker_id} crawling shard {shard.shard_id} (SKU {shard.start_sku}-{shard.end_sku})")
+        scraper.products_data.clear()
+        if not asyncio.run(crawl_shard(shard)):
+            continue
+        if coordinator.complete(shard, worker_id, scraper.products_data, shard.end_sku - shard.start_sku + 1):
+            completed += 1
+        else:
+            logger.warning(f"Worker {worker_id} lost the lease on shard {shard.shard_id} before completing it; "
+                           f"its results were discarded")
+
+    coordinator.close()
+    return completed
+
+
+def run_local_workers(coordinator_path: str, base_url: str, workers: int = 4, concurrency: int = 10,
+                      requests_per_second: float = 2.0, lease_seconds: float = 120.0):
+    """
+    Start `workers` worker processes on this machine and wait for them to drain the shard queue
+    """
+    processes = [multiprocessing.Process(target=run_worker,
+                                         args=(coordinator_path, base_url, f"local-{i}", concurrency,
+                                               requests_per_second, lease_seconds))
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+def merge_results(coordinator_path: str, filename: Optional[str] = None) -> str:
+    """
+    Write the merged products to one Parquet file, with aggregates for the report and dashboard
+    """
+    filename = filename or f"ecommerce_products_{datetime.now().strftime('%Y%m%d_%H%M%S')}.parquet"
+    coordinator = ShardCoordinator(coordinator_path)
+    aggregates = ProductAggregates()
+    with ParquetProductWriter(filename) as writer:
+        for product in coordinator.iter_products():
+            writer.write(product)
+            aggregates.add(product)
+    aggregates.save(aggregates_path(filename))
+    coordinator.close()
+    return filename
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded crawling with a SQLite lease coordinator")
+    parser.add_argument('--db', default="shards.db", help="coordinator database")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    plan = commands.add_parser('plan', help="split a SKU range into shards")
+    plan.add_argument('--start', type=int, default=0)
+    plan.add_argument('--max', type=int, default=50000)
+    plan.add_argument('--shard-size', type=int, default=500)
+
+    for name, help_text in (('work', "run one worker until the queue is empty"),
+                            ('local', "run several workers on this machine")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('--base-url', default="https://store.nerokas.co.ke/SKU-")
+        command.add_argument('--concurrency', type=int, default=10)
+        command.add_argument('--rps', type=float, default=2.0, help="requests per second per worker")
+        command.add_argument('--lease-seconds', type=float, default=120.0)
+    commands.choices['work'].add_argument('--worker-id')
+    commands.choices['local'].add_argument('--workers', type=int, default=4)
+
+    merge = commands.add_parser('merge', help="write the merged products to Parquet")
+    merge.add_argument('--output')
+
+    commands.add_parser('status', help="show shard states and the merged product count")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == 'plan':
+        coordinator = ShardCoordinator(args.db)
+        coordinator.plan(args.start, args.max, args.shard_size)
+        print(f"Planned {sum(coordinator.state_counts().values())} shards")
+    elif args.command == 'work':
+        completed = run_worker(args.db, args.base_url, args.worker_id, args.concurrency, args.rps,
+                               args.lease_seconds)
+        print(f"Completed {completed} shards")
+    elif args.command == 'local':
+        run_local_workers(args.db, args.base_url, args.workers, args.concurrency, args.rps, args.lease_seconds)
+    elif args.command == 'merge':
+        print(f"Merged products written to {merge_results(args.db, args.output)}")
+    elif args.command == 'status':
+        coordinator = ShardCoordinator(args.db)
+        print(f"Shards: {coordinator.state_counts()}, products: {coordinator.product_count()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""
+SKU-space index and probe scheduling
+
+Author: Business Analytics Team
+Purpose: Remember which SKU ranges are live or dead across runs and decide what to probe next
+"""
+
+import sqlite3
+from bisect import bisect_right
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+# SKU states
+LIVE = 'live'
+DEAD = 'dead'
+UNKNOWN = 'unknown'
+
+
+class ConsecutiveFailureTracker:
+    """
+    Tracks consecutive failures in dispatch order while results complete out of order
+
+    Each result is recorded under the sequence number it was dispatched with.
+    Results are only folded into the failure run once every earlier sequence
+    number has settled, so the stop decision matches a sequential scan.
+    Schedulers ask may_stop_before() before dispatching, so nothing past the
+    stop is probed either.
+    """
+
+    def __init__(self, max_consecutive_failures: int):
+        self.max_consecutive_failures = max_consecutive_failures
+        self.consecutive_failures = 0
+        self.next_seq = 0
+        self.settled: Dict[int, bool] = {}
+        self.stop_seq: Optional[int] = None
+
+    @property
+    def should_stop(self) -> bool:
+        return self.stop_seq is not None
+
+    def may_stop_before(self, seq: int) -> bool:
+        """
+        Whether the results outstanding before seq could still complete a run of failures
+        """
+        outstanding = seq - self.next_seq
+        return outstanding > 0 and self.consecutive_failures + outstanding >= self.max_consecutive_failures
+
+    def record(self, seq: int, success: bool) -> bool:
+        """
+        Record the outcome for a sequence number; returns True when the run has just hit the limit
+        """
+        self.settled[seq] = success
+        was_stopped = self.should_stop
+
+        while self.next_seq in self.settled:
+            if self.settled.pop(self.next_seq):
+                self.consecutive_failures = 0
+            else:
+                self.consecutive_failures += 1
+            if not self.should_stop and self.consecutive_failures >= self.max_consecutive_failures:
+                self.stop_seq = self.next_seq
+            self.next_seq += 1
+
+        return self.should_stop and not was_stopped
+
+
+class SkuIndex:
+    """
+    Sorted, non-overlapping intervals of live and dead SKUs, persisted in SQLite
+
+    SKUs not covered by any interval are unknown.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sku_intervals (
+                start_sku INTEGER PRIMARY KEY,
+                end_sku INTEGER NOT NULL,
+                state TEXT NOT NULL
+            )
+        """)
+        self.conn.commit()
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        self.states: List[str] = []
+        for start, end, state in self.conn.execute(
+                "SELECT start_sku, end_sku, state FROM sku_intervals ORDER BY start_sku"):
+            self.starts.append(start)
+            self.ends.append(end)
+            self.states.append(state)
+
+    def state_of(self, sku: int) -> str:
+        i = bisect_right(self.starts, sku) - 1
+        if i >= 0 and self.ends[i] >= sku:
+            return self.states[i]
+        return UNKNOWN
+
+    def mark(self, sku: int, state: str):
+        """
+        Set the state of one SKU, splitting and merging intervals as needed
+        """
+        if self.state_of(sku) == state:
+            return
+
+        i = bisect_right(self.starts, sku) - 1
+        if i >= 0 and self.ends[i] >= sku:
+            # Cut sku out of the interval that contains it
+            start, end, old_state = self.starts[i], self.ends[i], self.states[i]
+            del self.starts[i], self.ends[i], self.states[i]
+            if sku < end:
+                self.insert(i, sku + 1, end, old_state)
+            if start < sku:
+                self.insert(i, start, sku - 1, old_state)
+                i += 1
+        else:
+            i += 1
+
+        if state == UNKNOWN:
+            return
+        self.insert(i, sku, sku, state)
+
+        # Merge with the neighbours when they are adjacent and in the same state
+        if i + 1 < len(self.starts) and self.starts[i + 1] == sku + 1 and self.states[i + 1] == state:
+            self.ends[i] = self.ends[i + 1]
+            del self.starts[i + 1], self.ends[i + 1], self.states[i + 1]
+        if i > 0 and self.ends[i - 1] == sku - 1 and self.states[i - 1] == state:
+            self.ends[i - 1] = self.ends[i]
+            del self.starts[i], self.ends[i], self.states[i]
+
+    def insert(self, i: int, start: int, end: int, state: str):
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.states.insert(i, state)
+
+    def intervals(self, start_sku: int, max_sku: int) -> Iterator[Tuple[int, int, str]]:
+        """
+        Yield (start, end, state) intervals covering start_sku..max_sku, filling gaps as unknown
+        """
+        cursor = start_sku
+        i = max(bisect_right(self.starts, start_sku) - 1, 0)
+        while i < len(self.starts) and cursor <= max_sku:
+            start, end, state = self.starts[i], self.ends[i], self.states[i]
+            i += 1
+            if end < cursor:
+                continue
+            if start > cursor:
+                yield cursor, min(start - 1, max_sku), UNKNOWN
+                if start > max_sku:
+                    return
+            yield max(start, cursor), min(end, max_sku), state
+            cursor = end + 1
+        if cursor <= max_sku:
+            yield cursor, max_sku, UNKNOWN
+
+    def counts(self) -> Dict[str, int]:
+        totals = {LIVE: 0, DEAD: 0}
+        for start, end, state in zip(self.starts, self.ends, self.states):
+            totals[state] += end - start + 1
+        return totals
+
+    def save(self):
+        with self.conn:
+            self.conn.execute("DELETE FROM sku_intervals")
+            self.conn.executemany(
+                "INSERT INTO sku_intervals (start_sku, end_sku, state) VALUES (?, ?, ?)",
+                zip(self.starts, self.ends, self.states)
+            )
+
+
+class LinearProbeScheduler:
+    """
+    Probe every SKU in order, stopping after a run of consecutive failures
+
+    next_sku() returns None without being exhausted while the SKUs in flight
+    could still end the run; callers wait for results and ask again.
+    """
+
+    def __init__(self, start_sku: int, max_sku: int, max_consecutive_failures: int):
+        self.skus = iter(range(start_sku, max_sku + 1))
+        self.tracker = ConsecutiveFailureTracker(max_consecutive_failures)
+        self.seqs: Dict[int, int] = {}
+        self.dispatched = 0
+        self.done = False
+
+    @property
+    def consecutive_failures(self) -> int:
+        return self.tracker.consecutive_failures
+
+    @property
+    def in_flight(self) -> int:
+        return len(self.seqs)
+
+    @property
+    def exhausted(self) -> bool:
+        """
+        True once no further SKU will ever be handed out
+        """
+        return self.done or self.tracker.should_stop
+
+    def next_sku(self) -> Optional[int]:
+        if self.exhausted or self.tracker.may_stop_before(self.dispatched):
+            return None
+        sku = next(self.skus, None)
+        if sku is None:
+            self.done = True
+            return None
+        self.seqs[sku] = self.dispatched
+        self.dispatched += 1
+        return sku
+
+    def report(self, sku: int, is_product: bool) -> bool:
+        """
+        Record a result; returns True when the failure limit has just been reached
+        """
+        return self.tracker.record(self.seqs.pop(sku), is_product)
+
+
+class AdaptiveProbeScheduler:
+    """
+    Probe order driven by the SKU index
+
+    Known-live SKUs are probed first, then unknown SKUs in order (with the
+    consecutive-failure stop rule), then a sparse sample of each dead gap at
+    exponentially growing distance from both of its ends. A hit anywhere
+    outside the known-live set backfills its neighbourhood, which in turn
+    keeps expanding while it finds products.
+    """
+
+    def __init__(self, index: SkuIndex, start_sku: int, max_sku: int, max_consecutive_failures: int,
+                 backfill_window: int = 20):
+        self.start_sku = start_sku
+        self.max_sku = max_sku
+        self.backfill_window = backfill_window
+        self.tracker = ConsecutiveFailureTracker(max_consecutive_failures)
+
+        live: List[int] = []
+        unknown: List[int] = []
+        dead_samples: List[int] = []
+        for start, end, state in index.intervals(start_sku, max_sku):
+            if state == LIVE:
+                live.extend(range(start, end + 1))
+            elif state == UNKNOWN:
+                unknown.extend(range(start, end + 1))
+            else:
+                dead_samples.extend(self.sparse_sample(start, end))
+
+        self.live_queue = deque(live)
+        self.unknown_queue = deque(unknown)
+        self.dead_queue = deque(dead_samples)
+        self.backfill_queue: deque = deque()
+        self.known_live: Set[int] = set(live)
+        self.scheduled: Set[int] = set(live) | set(unknown) | set(dead_samples)
+        self.unknown_seqs: Dict[int, int] = {}
+        self.unknown_dispatched = 0
+        self.in_flight_skus: Set[int] = set()
+
+    @staticmethod
+    def sparse_sample(start: int, end: int) -> List[int]:
+        """
+        SKUs at distance 0, 1, 3, 7, 15, ... from either end of a dead gap
+        """
+        samples = []
+        step = 1
+        while step - 1 <= end - start:
+            samples.append(start + step - 1)
+            samples.append(end - step + 1)
+            step *= 2
+        return sorted(set(samples))
+
+    @property
+    def consecutive_failures(self) -> int:
+        return self.tracker.consecutive_failures
+
+    @property
+    def in_flight(self) -> int:
+        return len(self.in_flight_skus)
+
+    @property
+    def exhausted(self) -> bool:
+        """
+        True once no further SKU will ever be handed out
+        """
+        queues_empty = not (self.backfill_queue or self.live_queue or self.dead_queue
+                            or (self.unknown_queue and not self.tracker.should_stop))
+        return queues_empty and not self.in_flight_skus
+
+    def next_sku(self) -> Optional[int]:
+        if self.backfill_queue:
+            sku = self.backfill_queue.popleft()
+        elif self.live_queue:
+            sku = self.live_queue.popleft()
+        elif (self.unknown_queue and not self.tracker.should_stop
+              and not self.tracker.may_stop_before(self.unknown_dispatched)):
+            sku = self.unknown_queue.popleft()
+            self.unknown_seqs[sku] = self.unknown_dispatched
+            self.unknown_dispatched += 1
+        elif self.dead_queue:
+            sku = self.dead_queue.popleft()
+        else:
+            return None
+        self.in_flight_skus.add(sku)
+        return sku
+
+    def report(self, sku: int, is_product: bool) -> bool:
+        """
+        Record a result; returns True when the unknown-range failure limit has just been reached
+        """
+        self.in_flight_skus.discard(sku)
+        if is_product and sku not in self.known_live:
+            self.backfill_around(sku)
+        if sku in self.unknown_seqs:
+            return self.tracker.record(self.unknown_seqs.pop(sku), is_product)
+        return False
+
+    def backfill_around(self, sku: int):
+        """
+        Schedule the not yet scheduled neighbours of a new hit, nearest first
+        """
+        for distance in range(1, self.backfill_window + 1):
+            for neighbour in (sku - distance, sku + distance):
+                if self.start_sku <= neighbour <= self.max_sku and neighbour not in self.scheduled:
+                    self.scheduled.add(neighbour)
+                    self.backfill_queue.append(neighbour)
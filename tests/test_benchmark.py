@@ -0,0 +1,95 @@
+"""
+Tests for the benchmark regression check
+
+Author: Business Analytics Team
+Purpose: Check which metrics are flagged against a results history, and that only comparable runs are compared
+"""
+
+import json
+
+import pytest
+
+import benchmark
+from benchmark import find_regressions, load_results, run_benchmarks
+
+BASELINE = {
+    'end_to_end': {'pages_per_second': 200.0, 'wall_seconds': 10.0, 'peak_rss_mb': 150.0, 'products': 700},
+    'parse': {'per_page_ms': 2.0},
+    'memory': {'bytes_per_product': 900.0},
+}
+
+
+def results(**changes):
+    """
+    BASELINE with some metrics replaced, as 'section.metric': value
+    """
+    copy = json.loads(json.dumps(BASELINE))
+    for name, value in changes.items():
+        section, metric = name.split('.')
+        copy[section][metric] = value
+    return copy
+
+
+def test_metrics_are_flagged_in_the_direction_that_is_worse():
+    assert find_regressions(BASELINE, BASELINE) == []
+    # Throughput down, time and memory up: all worse
+    flagged = find_regressions(BASELINE, results(**{'end_to_end.pages_per_second': 150.0,
+                                                    'end_to_end.wall_seconds': 12.0,
+                                                    'parse.per_page_ms': 2.5}))
+    assert [line.split(':')[0] for line in flagged] == ['end_to_end.pages_per_second', 'end_to_end.wall_seconds',
+                                                        'parse.per_page_ms']
+    assert flagged[0] == "end_to_end.pages_per_second: 200 -> 150 (+25% worse)"
+    # The same changes the other way round are improvements
+    assert find_regressions(BASELINE, results(**{'end_to_end.pages_per_second': 300.0,
+                                                 'end_to_end.wall_seconds': 5.0})) == []
+
+
+@pytest.mark.parametrize('value, threshold, flagged', [
+    (10.9, 0.10, False),
+    (11.2, 0.10, True),
+    (11.2, 0.20, False),
+])
+def test_threshold(value, threshold, flagged):
+    regressions = find_regressions(BASELINE, results(**{'end_to_end.wall_seconds': value}), threshold)
+    assert bool(regressions) == flagged
+
+
+def test_metrics_without_a_baseline_or_direction_are_not_compared():
+    previous = results(**{'memory.bytes_per_product': 0})
+    current = results(**{'end_to_end.products': 10, 'memory.bytes_per_product': 5000.0})
+    current['analytics'] = {'analyze_seconds': 99.0}
+    # products has no better direction, a zero baseline gives no ratio, and analytics is new
+    assert find_regressions(previous, current) == []
+
+
+def test_run_is_compared_with_the_last_comparable_one(tmp_path, monkeypatch):
+    sections = {'end_to_end': 'bench_end_to_end', 'parse': 'bench_parse', 'output': 'bench_output',
+                'memory': 'bench_memory', 'analytics': 'bench_analytics'}
+    current = results(**{'parse.per_page_ms': 3.0})
+    current.update(output={}, analytics={})
+    for section, function in sections.items():
+        monkeypatch.setattr(benchmark, function, lambda *args, section=section, **kwargs: current[section])
+    path = str(tmp_path / "benchmark_results.jsonl")
+    assert load_results(path) == []
+
+    config = {'skus': 300, 'concurrency': 20, 'parser_processes': 0, 'page_size': 20000, 'latency': 0.0,
+              'not_found_rate': 0.3, 'error_rate': 0.0}
+    history = [
+        {'quick': True, 'config': config, 'results': results(**{'parse.per_page_ms': 1.0})},
+        {'quick': True, 'config': config, 'results': BASELINE},
+        # Later, but a full run or another configuration: not comparable
+        {'quick': False, 'config': config, 'results': results(**{'parse.per_page_ms': 3.0})},
+        {'quick': True, 'config': dict(config, concurrency=50), 'results': results(**{'parse.per_page_ms': 3.0})},
+    ]
+    with open(path, 'w') as f:
+        f.write('\n'.join(json.dumps(record) for record in history) + '\n\n')
+
+    record = run_benchmarks(quick=True, results_path=path)
+    assert record['regressions'] == ["parse.per_page_ms: 2 -> 3 (+50% worse)"]
+    saved = load_results(path)
+    assert len(saved) == len(history) + 1
+    assert saved[-1]['regressions'] == record['regressions']
+
+    # With no comparable history nothing is flagged
+    other = run_benchmarks(quick=True, concurrency=8, results_path=path)
+    assert other['regressions'] == []
@@ -0,0 +1,133 @@
+"""
+Tests for the command-line interface
+
+Author: Business Analytics Team
+Purpose: Check exit codes, config validation, resuming from the journal and the partial results a SIGTERM leaves
+"""
+
+import glob
+import os
+import signal
+
+import pandas as pd
+import pytest
+
+import cli
+from ecommerce_scraper import EcommerceMarketScraper
+from mock_storefront import MockStorefront
+
+MAX_SKU = 20
+TERMINATED_AT = 9
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # cli.main installs a SIGTERM handler; put the test runner's back afterwards
+    monkeypatch.chdir(tmp_path)
+    handler = signal.getsignal(signal.SIGTERM)
+    yield tmp_path
+    signal.signal(signal.SIGTERM, handler)
+
+
+def crawl_args(store: MockStorefront, *options: str):
+    return ['crawl', '--base-url', store.base_url, '--rps', '200', '--history', '', '--search-index', '',
+            '--cache-dir', '', *options]
+
+
+def write_config(path, text: str) -> str:
+    path.write_text(text)
+    return str(path)
+
+
+def test_crawl_exit_codes(monkeypatch):
+    with MockStorefront(page_size=0) as store:
+        assert cli.main(crawl_args(store, '--start', '1', '--max', str(MAX_SKU))) == cli.EXIT_OK
+    with MockStorefront(page_size=0, not_found_rate=1.0) as store:
+        assert cli.main(crawl_args(store, '--start', '1', '--max', str(MAX_SKU))) == cli.EXIT_NO_PRODUCTS
+
+        def failing_crawl(*args, **kwargs):
+            raise RuntimeError("storefront changed its markup")
+
+        monkeypatch.setattr(EcommerceMarketScraper, 'run_market_analysis', failing_crawl)
+        assert cli.main(crawl_args(store, '--start', '1', '--max', str(MAX_SKU))) == cli.EXIT_ERROR
+
+
+@pytest.mark.parametrize('config', [
+    "[crawl]\nbogus = 1\n",
+    "[crawler]\nstart = 1\n",
+    "bogus = 1\n",
+    "[crawl]\noutput-format = 'xlsx'\n",
+], ids=['unknown-key', 'unknown-section', 'unknown-top-level-key', 'invalid-choice'])
+def test_bad_config_is_a_usage_error(workdir, config, capsys):
+    path = write_config(workdir / "scraper.toml", config)
+    with pytest.raises(SystemExit) as exit_info:
+        cli.main(['--config', path, 'status'])
+    assert exit_info.value.code == cli.EXIT_USAGE
+    assert "config" in capsys.readouterr().err
+
+
+def test_parser_processes_need_a_concurrent_crawl():
+    with pytest.raises(SystemExit) as exit_info:
+        cli.main(['crawl', '--parser-processes', '2'])
+    assert exit_info.value.code == cli.EXIT_USAGE
+
+
+def test_sigterm_saves_partial_results_and_resume_continues_the_journaled_range(monkeypatch):
+    with MockStorefront(page_size=0) as store:
+        expected = [sku for sku in range(1, MAX_SKU + 1) if store.sku_exists(sku)]
+        scrape = EcommerceMarketScraper.scrape_product_with_outcome
+
+        def terminating_scrape(scraper, sku):
+            if sku == TERMINATED_AT:
+                os.kill(os.getpid(), signal.SIGTERM)
+            return scrape(scraper, sku)
+
+        monkeypatch.setattr(EcommerceMarketScraper, 'scrape_product_with_outcome', terminating_scrape)
+        assert cli.main(crawl_args(store, '--start', '1', '--max', str(MAX_SKU))) == cli.EXIT_TERMINATED
+
+        # The products settled before the signal are saved, with their aggregates
+        partial_path, = glob.glob("ecommerce_products_*.parquet")
+        assert os.path.exists(partial_path.replace('.parquet', '_aggregates.json'))
+        saved = list(pd.read_parquet(partial_path, columns=['sku'])['sku'])
+        assert saved == [sku for sku in expected if sku < TERMINATED_AT]
+        os.remove(partial_path)
+
+        # resume takes the SKU range from the journal and fetches only what the first run left
+        monkeypatch.setattr(EcommerceMarketScraper, 'scrape_product_with_outcome', scrape)
+        resume_args = ['resume', *crawl_args(store)[1:]]
+        assert cli.main(resume_args) == cli.EXIT_OK
+        assert store.requests_served == MAX_SKU
+
+    resumed_path, = glob.glob("ecommerce_products_*.parquet")
+    assert list(pd.read_parquet(resumed_path, columns=['sku'])['sku']) == expected
+
+
+def test_resume_without_a_journaled_crawl_needs_a_range():
+    assert cli.main(['resume']) == cli.EXIT_USAGE
+
+
+def test_report_streams_an_output_without_current_aggregates(capsys):
+    with MockStorefront(page_size=0) as store:
+        assert cli.main(crawl_args(store, '--start', '1', '--max', str(MAX_SKU))) == cli.EXIT_OK
+    output, = glob.glob("ecommerce_products_*.parquet")
+    capsys.readouterr()
+    assert cli.main(['report']) == cli.EXIT_OK
+    report = capsys.readouterr().out
+    assert os.path.basename(output) in report.splitlines()[0]
+
+    os.remove(output.replace('.parquet', '_aggregates.json'))
+    assert cli.main(['report', output]) == cli.EXIT_OK
+    # The same report, streamed from the rows
+    assert capsys.readouterr().out.splitlines()[1:] == report.splitlines()[1:]
+
+
+def test_export_writes_outputs_without_a_crawl_profile():
+    with MockStorefront(page_size=0) as store:
+        assert cli.main(crawl_args(store, '--start', '1', '--max', str(MAX_SKU))) == cli.EXIT_OK
+    for path in glob.glob("ecommerce_*"):
+        if not path.endswith('.log'):
+            os.remove(path)
+
+    assert cli.main(['export', '--output-format', 'csv']) == cli.EXIT_OK
+    assert len(glob.glob("ecommerce_products_*.csv")) == 1
+    assert not glob.glob("ecommerce_profile_*.json")
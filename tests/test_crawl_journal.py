@@ -0,0 +1,73 @@
+"""
+Tests for the crawl journal and resuming an interrupted crawl
+
+Author: Business Analytics Team
+Purpose: Check that a resumed crawl refetches nothing it already settled and writes every product exactly once
+"""
+
+import glob
+
+import pandas as pd
+import pytest
+
+from crawl_journal import ERROR, INVALID, NOT_FOUND, PRODUCT, CrawlJournal
+from ecommerce_scraper import EcommerceMarketScraper
+from mock_storefront import MockStorefront
+
+MAX_SKU = 30
+INTERRUPTED_AT = 12
+
+
+def test_errors_are_not_settled(tmp_path):
+    journal = CrawlJournal(str(tmp_path / "journal.db"))
+    journal.record(1, PRODUCT, {'sku': 1, 'product_name': 'Board'})
+    journal.record(2, NOT_FOUND)
+    journal.record(3, INVALID)
+    journal.record(4, ERROR)
+
+    assert journal.settled_outcomes(1, 4) == {1: True, 2: False, 3: False}
+    assert journal.settled_outcomes(2, 3) == {2: False, 3: False}
+
+    journal.record(4, PRODUCT, {'sku': 4, 'product_name': 'Sensor'})
+    assert [product['sku'] for product in journal.iter_products()] == [1, 4]
+    journal.close()
+
+
+def crawl(store: MockStorefront, resume: bool) -> EcommerceMarketScraper:
+    scraper = EcommerceMarketScraper(store.base_url, enable_logging=False, journal_path="journal.db",
+                                     output_format='both')
+    scraper.run_market_analysis(1, MAX_SKU, resume=resume, requests_per_second=200)
+    return scraper
+
+
+def test_resumed_crawl_neither_duplicates_nor_misses_rows(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with MockStorefront(page_size=0) as store:
+        expected = [sku for sku in range(1, MAX_SKU + 1) if store.sku_exists(sku)]
+
+        # Kill the first run as it reaches INTERRUPTED_AT, before that SKU is settled
+        scrape = EcommerceMarketScraper.scrape_product_with_outcome
+
+        def interrupting_scrape(scraper, sku):
+            if sku == INTERRUPTED_AT:
+                raise KeyboardInterrupt
+            return scrape(scraper, sku)
+
+        monkeypatch.setattr(EcommerceMarketScraper, 'scrape_product_with_outcome', interrupting_scrape)
+        with pytest.raises(KeyboardInterrupt):
+            crawl(store, resume=False)
+        assert store.requests_served == INTERRUPTED_AT - 1
+        assert not glob.glob("ecommerce_products_*.parquet")
+
+        monkeypatch.setattr(EcommerceMarketScraper, 'scrape_product_with_outcome', scrape)
+        resumed = crawl(store, resume=True)
+
+    # Only the SKUs the first run did not settle are fetched again
+    assert store.requests_served == MAX_SKU
+    assert resumed.collected_count() == len(expected)
+
+    parquet_paths = glob.glob("ecommerce_products_*.parquet")
+    csv_paths = glob.glob("ecommerce_products_*.csv")
+    assert len(parquet_paths) == len(csv_paths) == 1
+    assert list(pd.read_parquet(parquet_paths[0], columns=['sku'])['sku']) == expected
+    assert list(pd.read_csv(csv_paths[0], usecols=['sku'])['sku']) == expected
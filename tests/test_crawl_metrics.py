@@ -0,0 +1,66 @@
+"""
+Tests for crawl instrumentation
+
+Author: Business Analytics Team
+Purpose: Check stage statistics, forwarding from parser processes, and the counts a crawl leaves in its profile
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from crawl_journal import PRODUCT
+from crawl_metrics import CrawlMetrics, StageStats
+from ecommerce_scraper import EcommerceMarketScraper
+from mock_storefront import MockStorefront
+
+
+def test_stage_stats_summarize_observations():
+    stats = StageStats()
+    for milliseconds in range(1, 101):
+        stats.observe(milliseconds / 1000)
+
+    summary = stats.to_dict()
+    assert summary['count'] == 100
+    assert summary['mean_ms'] == pytest.approx(50.5)
+    assert summary['p50_ms'] == pytest.approx(50, rel=0.02)
+    assert summary['p99_ms'] == pytest.approx(99, rel=0.02)
+    assert summary['max_ms'] == pytest.approx(100)
+
+
+def test_forwarded_observations_are_drained_once():
+    worker = CrawlMetrics()
+    worker.forward = True
+    with worker.time('parse'):
+        pass
+    worker.observe('extract', 0.002)
+
+    observations = worker.drain()
+    assert [stage for stage, _ in observations] == ['parse', 'extract']
+    assert worker.drain() == []
+
+    parent = CrawlMetrics()
+    for stage, seconds in observations:
+        parent.observe(stage, seconds)
+    assert parent.stages['extract'].count == 1 and parent.unreported == []
+
+
+def test_crawl_profile_counts_every_response_and_stage(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with MockStorefront(page_size=0) as store:
+        scraper = EcommerceMarketScraper(store.base_url, enable_logging=False, output_format='csv')
+        asyncio.run(scraper.run_market_analysis_async(1, 30, concurrency=4, requests_per_second=500,
+                                                      parser_processes=2))
+        products = sum(store.sku_exists(sku) for sku in range(1, 31))
+
+    profile_path, = tmp_path.glob("ecommerce_profile_*.json")
+    profile = json.loads(profile_path.read_text())
+    assert profile['pages'] == 30
+    assert profile['status_codes'] == {'200': products, '404': 30 - products}
+    assert profile['outcomes'][PRODUCT] == products
+    assert profile['bytes_downloaded'] > 0
+    # Parse timings come back from the parser processes
+    assert profile['stages']['parse']['count'] == products
+    assert profile['stages']['ttfb']['count'] == 30
+    assert profile['stages']['record']['count'] == 30
@@ -0,0 +1,38 @@
+"""
+Tests for crawl output discovery
+
+Author: Business Analytics Team
+Purpose: Check that the newest run is found by its timestamped name and that Parquet wins over its CSV export
+"""
+
+import os
+
+from crawl_outputs import find_latest_output
+
+
+def touch(directory, name: str, mtime: float = 1_000_000_000) -> str:
+    path = directory / name
+    path.write_bytes(b"")
+    os.utime(path, (mtime, mtime))
+    return str(path)
+
+
+def test_no_output_found(tmp_path):
+    touch(tmp_path, "ecommerce_products_20250101_120000_summary.txt")
+    touch(tmp_path, "ecommerce_delta_20250101_120000.csv")
+    assert find_latest_output(str(tmp_path)) is None
+
+
+def test_newest_run_is_picked_by_its_stem_not_its_mtime(tmp_path):
+    newest = touch(tmp_path, "ecommerce_products_20250302_080000.csv", mtime=1_000_000_000)
+    # An older run whose file was touched later, e.g. by a copy
+    touch(tmp_path, "ecommerce_products_20250301_235959.parquet", mtime=2_000_000_000)
+    touch(tmp_path, "ecommerce_products_20241231_000000.parquet")
+    assert find_latest_output(str(tmp_path)) == newest
+
+
+def test_parquet_wins_over_the_csv_of_the_same_run(tmp_path):
+    touch(tmp_path, "ecommerce_products_20250301_120000.csv", mtime=2_000_000_000)
+    parquet = touch(tmp_path, "ecommerce_products_20250301_120000.parquet")
+    touch(tmp_path, "ecommerce_products_20250228_120000.parquet")
+    assert find_latest_output(str(tmp_path)) == parquet
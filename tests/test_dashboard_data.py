@@ -0,0 +1,68 @@
+"""
+Tests for the dashboard's data access layer
+
+Author: Business Analytics Team
+Purpose: Check that the mtime-keyed loaders pick up a rewritten crawl output and never serve its stale aggregates
+"""
+
+import functools
+import os
+
+import pandas as pd
+
+from dashboard_data import file_version, load_aggregates, read_columns
+from mock_storefront import generate_product
+from product_aggregates import ProductAggregates, aggregates_path
+from product_writers import ParquetProductWriter
+
+
+def export(path: str, product_count: int, mtime: float):
+    """
+    Write a crawl output with its aggregates, both stamped with mtime
+    """
+    aggregates = ProductAggregates()
+    with ParquetProductWriter(path) as writer:
+        for sku in range(product_count):
+            product = generate_product(sku)
+            writer.write(product)
+            aggregates.add(product)
+    aggregates.save(aggregates_path(path))
+    for written in (path, aggregates_path(path)):
+        os.utime(written, (mtime, mtime))
+
+
+def test_rewritten_output_gets_a_new_cache_key_and_is_reloaded(tmp_path):
+    path = str(tmp_path / "ecommerce_products_20250301_120000.parquet")
+    # The dashboard caches loaders on (path, file_version(path)) the same way
+    load_columns = functools.lru_cache()(lambda path, mtime, columns: read_columns(path, list(columns)))
+
+    export(path, 10, mtime=1_000_000_000)
+    first = load_columns(path, file_version(path), ('sku', 'brand'))
+    assert list(first.columns) == ['sku', 'brand'] and len(first) == 10
+    assert load_columns(path, file_version(path), ('sku', 'brand')) is first
+
+    export(path, 25, mtime=1_000_000_060)
+    reloaded = load_columns(path, file_version(path), ('sku', 'brand'))
+    assert reloaded is not first and len(reloaded) == 25
+    assert load_aggregates(path).product_count == 25
+
+
+def test_aggregates_older_than_their_output_are_not_served(tmp_path):
+    path = str(tmp_path / "ecommerce_products_20250301_120000.parquet")
+    export(path, 10, mtime=1_000_000_000)
+    assert load_aggregates(path).product_count == 10
+
+    # The output is rewritten but its aggregates file is not
+    with ParquetProductWriter(path) as writer:
+        writer.write(generate_product(1))
+    os.utime(path, (1_000_000_060, 1_000_000_060))
+    assert load_aggregates(path) is None
+    assert load_aggregates(str(tmp_path / "ecommerce_products_20250101_000000.parquet")) is None
+
+
+def test_read_columns_skips_columns_an_older_csv_lacks(tmp_path):
+    path = str(tmp_path / "ecommerce_products_20240101_000000.csv")
+    pd.DataFrame({'sku': [1, 2], 'brand': ['Bosch', 'Seeed'], 'product_name': ['Sensor', 'Board']}).to_csv(
+        path, index=False)
+    frame = read_columns(path, ['sku', 'brand', 'price_numeric'])
+    assert list(frame.columns) == ['sku', 'brand']
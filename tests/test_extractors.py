@@ -0,0 +1,63 @@
+"""
+Golden-file tests for the extractor backends
+
+Author: Business Analytics Team
+Purpose: Prove that the soup and fast backends produce the same product records on tricky pages
+"""
+
+import glob
+import json
+import os
+
+import pytest
+
+from bs4.builder import ParserRejectedMarkup
+
+from crawl_journal import ERROR, INVALID, PRODUCT
+from ecommerce_scraper import EcommerceMarketScraper
+from product_extractors import EXTRACTOR_BACKENDS, create_extractor, product_fields
+
+# Each <name>.html page has a <name>.json holding its SKU, URL and expected record (null for invalid pages);
+# pages the HTML parser rejects also have "outcome": "error"
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures', 'extractors')
+FIXTURES = sorted(os.path.splitext(os.path.basename(path))[0]
+                  for path in glob.glob(os.path.join(FIXTURE_DIR, '*.html')))
+
+
+@pytest.fixture(scope='module')
+def scraper():
+    return EcommerceMarketScraper(enable_logging=False)
+
+
+def load_fixture(name: str):
+    with open(os.path.join(FIXTURE_DIR, f"{name}.html"), 'rb') as f:
+        content = f.read()
+    with open(os.path.join(FIXTURE_DIR, f"{name}.json"), encoding='utf-8') as f:
+        golden = json.load(f)
+    return content, golden
+
+
+@pytest.mark.parametrize('backend', sorted(EXTRACTOR_BACKENDS))
+@pytest.mark.parametrize('name', FIXTURES)
+def test_backend_matches_golden_record(scraper, backend, name):
+    content, golden = load_fixture(name)
+    if golden.get('outcome') == ERROR:
+        with pytest.raises(ParserRejectedMarkup):
+            create_extractor(backend, scraper).extract(content, golden['sku'], golden['url'])
+        return
+    product_data = create_extractor(backend, scraper).extract(content, golden['sku'], golden['url'])
+    if golden['expected'] is None:
+        assert product_data is None
+    else:
+        assert product_data is not None
+        assert product_fields(product_data) == golden['expected']
+
+
+@pytest.mark.parametrize('backend', sorted(EXTRACTOR_BACKENDS))
+@pytest.mark.parametrize('name', FIXTURES)
+def test_backend_settles_page_like_golden_outcome(backend, name):
+    content, golden = load_fixture(name)
+    scraper = EcommerceMarketScraper(enable_logging=False, extractor=backend)
+    outcome, _ = scraper.classify_response(golden['sku'], golden['url'], 200, content)
+    expected = golden.get('outcome') or (INVALID if golden['expected'] is None else PRODUCT)
+    assert outcome == expected
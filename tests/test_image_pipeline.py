@@ -0,0 +1,57 @@
+"""
+Tests for the product image stage
+
+Author: Business Analytics Team
+Purpose: Check perceptual hashing and that each picture is downloaded and described once across URLs and runs
+"""
+
+import asyncio
+import io
+
+from PIL import Image
+
+from image_pipeline import ImagePipeline, hamming_distance, perceptual_hash
+from mock_storefront import MockStorefront, generate_product, render_product_image
+
+
+def open_image(content: bytes) -> Image.Image:
+    return Image.open(io.BytesIO(content))
+
+
+def test_perceptual_hash_matches_resized_and_recompressed_copies():
+    original = open_image(render_product_image("0:1"))
+    buffer = io.BytesIO()
+    original.resize((150, 150)).save(buffer, 'JPEG', quality=40)
+    copy = open_image(buffer.getvalue())
+    other = open_image(render_product_image("0:2"))
+
+    assert len(perceptual_hash(original)) == 16
+    assert hamming_distance(perceptual_hash(original), perceptual_hash(copy)) <= 4
+    assert hamming_distance(perceptual_hash(original), perceptual_hash(other)) > 10
+
+
+def test_shared_images_are_fetched_and_described_once(tmp_path):
+    with MockStorefront(page_size=0, not_found_rate=0.0) as store:
+        products = [generate_product(sku, base_url=store.base_url) for sku in range(1, 21)]
+        brands = {product['brand'] for product in products}
+
+        pipeline = ImagePipeline(str(tmp_path / "images"), concurrency=4, requests_per_second=200)
+        stats = asyncio.run(pipeline.run(products))
+        served = store.requests_served
+        # Every URL is settled, so a second run downloads nothing
+        again = asyncio.run(pipeline.run(products))
+
+    # Each product has its own picture plus its brand's logo, shared under a URL per product
+    assert stats['image_urls'] == stats['downloaded'] == 40
+    assert stats['new_images'] == 20 + len(brands)
+    assert stats['duplicate_images'] == 20 - len(brands)
+    assert stats['failed'] == 0
+    assert again['already_fetched'] == 40 and again['downloaded'] == 0
+    assert store.requests_served == served
+
+    frame = pipeline.image_frame()
+    assert len(frame) == 40
+    logos = frame[frame['position'] == 1]
+    assert logos['hash'].nunique() == len(brands)
+    assert pipeline.conn.execute("SELECT COUNT(*) FROM images").fetchone()[0] == 20 + len(brands)
+    pipeline.close()
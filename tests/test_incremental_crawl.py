@@ -0,0 +1,117 @@
+"""
+Tests for incremental re-crawls against the mock storefront
+
+Author: Business Analytics Team
+Purpose: Check that unchanged pages are not re-parsed and that products are classified as new, changed or disappeared
+"""
+
+import pytest
+
+from crawl_journal import CHANGED, DISAPPEARED, NEW
+from ecommerce_scraper import EcommerceMarketScraper
+from mock_storefront import MockStorefront, generate_product, render_product_page
+
+
+class ChangingStorefront(MockStorefront):
+    """
+    Mock storefront whose products can be repriced, taken down or given a new ETag between crawls
+    """
+
+    def __init__(self, **options):
+        super().__init__(page_size=0, not_found_rate=0.0, **options)
+        self.repriced = set()
+        self.removed = set()
+        self.retagged = set()
+
+    def page_etag(self, sku: int, body: bytes) -> str:
+        etag = super().page_etag(sku, body)
+        return f'W/{etag}' if sku in self.retagged else etag
+
+    def sku_exists(self, sku: int) -> bool:
+        return sku not in self.removed and super().sku_exists(sku)
+
+    def product_page(self, sku: int) -> bytes:
+        product_data = generate_product(sku, self.seed, self.base_url)
+        if sku in self.repriced:
+            product_data['price_numeric'] += 1
+            product_data['price'] = f"KES {product_data['price_numeric']:,.2f}"
+        return render_product_page(product_data, self.page_size, self.seed)
+
+
+def crawl(store: ChangingStorefront, journal_path: str) -> EcommerceMarketScraper:
+    scraper = EcommerceMarketScraper(store.base_url, enable_logging=False, journal_path=journal_path,
+                                     output_format='csv')
+    parsed = []
+    parse_product_page = scraper.parse_product_page
+
+    def counting_parse(content, sku, url):
+        parsed.append(sku)
+        return parse_product_page(content, sku, url)
+
+    scraper.parse_product_page = counting_parse
+    scraper.parsed_skus = parsed
+    scraper.run_market_analysis(1, 7, incremental=True, requests_per_second=200)
+    return scraper
+
+
+def changes(scraper: EcommerceMarketScraper):
+    return {product['sku']: product['change_type'] for product in scraper.journal.iter_changes()}
+
+
+@pytest.mark.parametrize('etags', [True, False], ids=['not-modified', 'same-body-hash'])
+def test_recrawl_parses_only_changed_pages(tmp_path, monkeypatch, etags):
+    monkeypatch.chdir(tmp_path)
+    journal_path = str(tmp_path / "journal.db")
+    with ChangingStorefront(etags=etags) as store:
+        store.removed = {7}
+        first = crawl(store, journal_path)
+        assert first.parsed_skus == [1, 2, 3, 4, 5, 6]
+        assert changes(first) == {sku: NEW for sku in range(1, 7)}
+
+        store.repriced = {2}
+        store.removed = {3}
+        second = crawl(store, journal_path)
+
+    # Unchanged pages are answered with 304 or hash to the same body; either way they are not parsed
+    assert second.parsed_skus == [2, 7]
+    assert second.unchanged_pages == 4
+    assert store.not_modified_served == (4 if etags else 0)
+    assert changes(second) == {2: CHANGED, 3: DISAPPEARED, 7: NEW}
+
+    products = {product['sku']: product for product in second.collected_products()}
+    assert sorted(products) == [1, 2, 4, 5, 6, 7]
+    assert products[2]['price_numeric'] == pytest.approx(generate_product(2)['price_numeric'] + 1)
+    assert products[1]['product_name'] == generate_product(1)['product_name']
+
+
+def test_recrawl_without_changes_records_no_delta(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    journal_path = str(tmp_path / "journal.db")
+    with ChangingStorefront(etags=True) as store:
+        crawl(store, journal_path)
+        again = crawl(store, journal_path)
+
+    assert again.parsed_skus == []
+    assert again.unchanged_pages == 7
+    assert changes(again) == {}
+    assert again.collected_count() == 7
+
+
+def test_new_etag_of_an_unchanged_body_is_kept_for_the_next_crawl(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    journal_path = str(tmp_path / "journal.db")
+    with ChangingStorefront(etags=True) as store:
+        crawl(store, journal_path)
+        store.retagged = {3}
+        # The stale ETag gets a full response, but the body hashes the same, so it is not parsed
+        retagged = crawl(store, journal_path)
+        assert retagged.parsed_skus == []
+        assert store.not_modified_served == 6
+        assert retagged.journal.page_state(3)['etag'].startswith('W/')
+
+        # The next crawl sends the new ETag and gets a 304 for every page
+        again = crawl(store, journal_path)
+
+    assert again.parsed_skus == []
+    assert store.not_modified_served == 6 + 7
+    assert changes(again) == {}
@@ -0,0 +1,100 @@
+"""
+Tests for the raw page cache
+
+Author: Business Analytics Team
+Purpose: Check content-hash deduplication, eviction, the latest page per SKU and offline re-extraction
+"""
+
+import os
+
+import pytest
+
+from mock_storefront import generate_product, render_product_page
+from page_cache import PageCache, content_hash, reprocess
+
+BASE_URL = "http://store.test/SKU-"
+
+
+def page(sku: int) -> bytes:
+    return render_product_page(generate_product(sku, base_url=BASE_URL))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = PageCache(str(tmp_path / "cache"))
+    yield cache
+    cache.close()
+
+
+def blob_files(cache: PageCache):
+    return [name for _, _, names in os.walk(os.path.join(cache.directory, 'blobs')) for name in names]
+
+
+def test_identical_bodies_are_stored_once(cache):
+    body = page(1)
+    digest = cache.put(1, f"{BASE_URL}1", body, fetched_at='2026-10-01T00:00:00')
+    assert cache.put(1, f"{BASE_URL}1", body, fetched_at='2026-10-02T00:00:00') == digest
+    assert cache.put(2, f"{BASE_URL}2", body, fetched_at='2026-10-02T00:00:00') == digest
+    assert digest == content_hash(body)
+
+    stats = cache.stats()
+    assert (stats['skus'], stats['fetches'], stats['blobs']) == (2, 3, 1)
+    assert len(blob_files(cache)) == 1
+    assert cache.get(2) == body
+
+
+def test_get_returns_the_fetch_as_of_a_time(cache):
+    cache.put(1, f"{BASE_URL}1", b"<html>old</html>", fetched_at='2026-10-01T00:00:00')
+    cache.put(1, f"{BASE_URL}1", b"<html>new</html>", fetched_at='2026-10-02T00:00:00')
+
+    assert cache.get(1) == b"<html>new</html>"
+    assert cache.get(1, '2026-10-01T12:00:00') == b"<html>old</html>"
+    assert cache.get(1, '2026-09-30T00:00:00') is None
+    assert cache.get(2) is None
+
+
+def test_latest_pages_gives_the_newest_fetch_per_sku_in_range(cache):
+    for sku in range(1, 5):
+        cache.put(sku, f"{BASE_URL}{sku}", f"<html>{sku} old</html>".encode(), fetched_at='2026-10-01T00:00:00')
+    cache.put(2, f"{BASE_URL}2", b"<html>2 new</html>", fetched_at='2026-10-02T00:00:00')
+
+    latest = list(cache.latest_pages(2, 3))
+    assert [(sku, fetched_at) for sku, _, fetched_at, _, _, _ in latest] == [
+        (2, '2026-10-02T00:00:00'), (3, '2026-10-01T00:00:00')]
+    assert latest[0][3] == cache.blob_path(content_hash(b"<html>2 new</html>"))
+    assert len(list(cache.latest_pages())) == 4
+
+
+def test_eviction_drops_the_least_recently_fetched_bodies(tmp_path):
+    bodies = {sku: os.urandom(1000) for sku in range(1, 11)}
+    # Random bodies do not compress, so each blob takes about 1000 bytes
+    cache = PageCache(str(tmp_path / "cache"), max_bytes=5000, codec='gzip', batch_size=1)
+    for sku, body in bodies.items():
+        cache.put(sku, f"{BASE_URL}{sku}", body, fetched_at=f"2026-10-01T00:00:{sku:02d}")
+
+    assert cache.stored_bytes <= 5000
+    assert cache.get(10) == bodies[10]
+    assert cache.get(1) is None
+    kept = [sku for sku in bodies if cache.get(sku) is not None]
+    assert kept == list(range(kept[0], 11))
+    assert len(blob_files(cache)) == len(kept)
+    cache.close()
+
+
+def test_reprocess_extracts_products_from_the_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = PageCache("cache")
+    for sku in range(1, 6):
+        cache.put(sku, f"{BASE_URL}{sku}", page(sku), fetched_at='2026-10-01T00:00:00')
+    cache.put(6, f"{BASE_URL}6", b"<html><head><title>404 Not Found</title></head></html>",
+              fetched_at='2026-10-01T00:00:00')
+    cache.close()
+
+    scraper = reprocess("cache", processes=2, chunk_size=2, base_url=BASE_URL)
+
+    products = sorted(scraper.collected_products(), key=lambda product: product['sku'])
+    assert [product['sku'] for product in products] == [1, 2, 3, 4, 5]
+    assert [product['product_name'] for product in products] == [generate_product(sku)['product_name']
+                                                                 for sku in range(1, 6)]
+    assert all(product['scraped_at'] == '2026-10-01T00:00:00' for product in products)
+    assert (scraper.successful_scrapes, scraper.failed_scrapes) == (5, 1)
@@ -0,0 +1,85 @@
+"""
+Tests for the process-pool parsing stage
+
+Author: Business Analytics Team
+Purpose: Check that parsing in worker processes yields the same products as parsing on the event loop
+"""
+
+import asyncio
+
+import pytest
+
+from crawl_journal import INVALID, PRODUCT
+from ecommerce_scraper import EcommerceMarketScraper
+from mock_storefront import MockStorefront, generate_product, render_product_page
+from parse_pipeline import ParsePipeline
+
+BASE_URL = "http://store.test/SKU-"
+
+
+def async_crawl(store: MockStorefront, parser_processes: int):
+    scraper = EcommerceMarketScraper(store.base_url, enable_logging=False, output_format='csv')
+    asyncio.run(scraper.run_market_analysis_async(1, 40, concurrency=8, requests_per_second=500,
+                                                  parser_processes=parser_processes, parse_queue_size=4))
+    return scraper
+
+
+def product_names(scraper: EcommerceMarketScraper):
+    return {product['sku']: product['product_name'] for product in scraper.collected_products()}
+
+
+def test_pool_parsing_matches_in_process_parsing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with MockStorefront(page_size=0) as store:
+        in_process = async_crawl(store, parser_processes=0)
+        pooled = async_crawl(store, parser_processes=2)
+        expected = [sku for sku in range(1, 41) if store.sku_exists(sku)]
+
+    assert sorted(product_names(pooled)) == expected
+    assert product_names(pooled) == product_names(in_process)
+    assert pooled.failed_scrapes == in_process.failed_scrapes == 40 - len(expected)
+
+
+@pytest.mark.parametrize('content, outcome', [
+    (render_product_page(generate_product(3, base_url=BASE_URL)), PRODUCT),
+    (b"<html><head><title>404 Not Found</title></head></html>", INVALID),
+])
+def test_pipeline_reports_each_page_once(content, outcome):
+    results = []
+
+    async def scenario():
+        pipeline = ParsePipeline(BASE_URL, processes=1, queue_size=1)
+        pipeline.start(lambda sku, outcome, product_data: results.append((sku, outcome, product_data)))
+        await pipeline.put(3, f"{BASE_URL}3", content)
+        await pipeline.close()
+
+    asyncio.run(scenario())
+    assert [(sku, result) for sku, result, _ in results] == [(3, outcome)]
+    if outcome == PRODUCT:
+        assert results[0][2]['product_name'] == generate_product(3)['product_name']
+
+
+def test_failing_callback_does_not_stop_the_consumer():
+    recorded = []
+
+    def on_result(sku, outcome, product_data):
+        if sku == 2:
+            raise RuntimeError("journal is locked")
+        recorded.append(sku)
+
+    async def feed(pipeline: ParsePipeline):
+        for sku in range(1, 5):
+            await pipeline.put(sku, f"{BASE_URL}{sku}", render_product_page(generate_product(sku, base_url=BASE_URL)))
+        await pipeline.close()
+
+    async def scenario():
+        pipeline = ParsePipeline(BASE_URL, processes=1, queue_size=1)
+        pipeline.start(on_result)
+        # A dead consumer would leave put() waiting on the full queue
+        try:
+            await asyncio.wait_for(feed(pipeline), timeout=10)
+        finally:
+            pipeline.executor.shutdown(cancel_futures=True)
+
+    asyncio.run(scenario())
+    assert recorded == [1, 3, 4]
@@ -0,0 +1,111 @@
+"""
+Tests for the price history store
+
+Author: Business Analytics Team
+Purpose: Check per-SKU history, run-to-run price changes, the brand index and resumed snapshots
+"""
+
+import pytest
+
+from crawl_journal import PRODUCT
+from ecommerce_scraper import EcommerceMarketScraper
+from mock_storefront import generate_product
+from price_history import PriceHistory
+
+
+def price_point(sku: int, price: float, brand: str = 'Acme'):
+    return {'sku': sku, 'scraped_at': '2026-10-16T12:00:00', 'price_numeric': price, 'currency': 'KES',
+            'stock_status': 'In Stock', 'brand': brand, 'category': 'Phones'}
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = PriceHistory(str(tmp_path / "history.db"))
+    yield history
+    history.close()
+
+
+def record_snapshot(history: PriceHistory, products) -> str:
+    snapshot = history.start_snapshot()
+    for product in products:
+        history.record(product)
+    history.flush()
+    return snapshot
+
+
+def test_sku_history_is_in_snapshot_order(history):
+    first = record_snapshot(history, [price_point(1, 100.0), price_point(2, 50.0)])
+    second = record_snapshot(history, [price_point(1, 90.0)])
+
+    sku_history = history.sku_history(1)
+    assert list(sku_history['snapshot']) == [first, second]
+    assert list(sku_history['price_numeric']) == [100.0, 90.0]
+    assert list(history.sku_history(1, since=second)['price_numeric']) == [90.0]
+
+
+def test_price_changes_between_two_snapshots(history):
+    first = record_snapshot(history, [price_point(1, 100.0), price_point(2, 50.0), price_point(3, 10.0)])
+    # SKU 2 is unchanged, SKU 3 disappeared and SKU 4 is new: only SKU 1 changed
+    second = record_snapshot(history, [price_point(1, 120.0), price_point(2, 50.0), price_point(4, 5.0)])
+
+    changes = history.price_changes(first, second)
+    assert list(changes['sku']) == [1]
+    assert changes['change'].iloc[0] == 20.0
+    assert changes['change_pct'].iloc[0] == pytest.approx(20.0)
+
+
+def test_brand_price_index_over_matched_skus(history):
+    first = record_snapshot(history, [price_point(1, 100.0, 'Acme'), price_point(2, 100.0, 'Acme'),
+                                      price_point(3, 40.0, 'Zeta')])
+    second = record_snapshot(history, [price_point(1, 110.0, 'Acme'), price_point(2, 90.0, 'Acme'),
+                                       price_point(3, 50.0, 'Zeta'), price_point(4, 999.0, 'Zeta')])
+
+    index = history.brand_price_index(first, second).set_index('brand')
+    assert index.loc['Acme', 'price_index'] == pytest.approx(100.0)
+    assert (index.loc['Acme', 'raised'], index.loc['Acme', 'lowered']) == (1, 1)
+    # SKU 4 has no base price, so it does not move Zeta's index
+    assert index.loc['Zeta', 'matched_skus'] == 1
+    assert index.loc['Zeta', 'price_index'] == pytest.approx(125.0)
+
+
+def test_runs_started_together_get_their_own_snapshots(history):
+    snapshots = [history.start_snapshot() for _ in range(20)]
+    assert len(set(snapshots)) == 20
+    assert history.snapshots() == sorted(snapshots)
+
+
+def test_run_killed_before_first_flush_resumes_its_own_snapshot(tmp_path):
+    def scraper():
+        return EcommerceMarketScraper(enable_logging=False, output_format='none',
+                                      journal_path=str(tmp_path / "journal.db"),
+                                      history_path=str(tmp_path / "history.db"))
+
+    def product(price: float):
+        return dict(generate_product(1), price_numeric=price)
+
+    day1 = scraper()
+    day1.load_settled_outcomes(0, 10, resume=False)
+    day1.open_product_stream()
+    day1.store_outcome(1, PRODUCT, product(100.0))
+    day1.price_history.close()
+    day1.journal.close()
+
+    # Day 2 is killed before its price points reach the database
+    day2 = scraper()
+    day2.load_settled_outcomes(0, 10, resume=False)
+    day2.open_product_stream()
+    day2.store_outcome(1, PRODUCT, product(120.0))
+    day2.price_history.conn.close()
+    day2.journal.close()
+
+    resumed = scraper()
+    resumed.load_settled_outcomes(0, 10, resume=True)
+    resumed.open_product_stream(resume=True)
+    resumed.price_history.flush()
+
+    first, second = resumed.price_history.snapshots()
+    assert list(resumed.price_history.sku_history(1)['price_numeric']) == [100.0, 120.0]
+    assert resumed.price_history.snapshot == second
+    assert list(resumed.price_history.price_changes(first, second)['sku']) == [1]
+    resumed.price_history.close()
+    resumed.journal.close()
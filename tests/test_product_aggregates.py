@@ -0,0 +1,69 @@
+"""
+Tests for the running aggregates and the summary report
+
+Author: Business Analytics Team
+Purpose: Make sure brand, category and stock rankings match value_counts, with ties in first-seen order
+"""
+
+import random
+
+import pandas as pd
+
+from mock_storefront import generate_product
+from product_aggregates import ProductAggregates, summary_report, top_counts
+
+
+def first_seen_counts(values):
+    counts = {}
+    for value in values:
+        counts[value] = counts.get(value, 0) + 1
+    return counts
+
+
+def first_seen_ranking(values):
+    """
+    value_counts with its ties put in first-seen order
+    """
+    first_seen = {value: position for position, value in reversed(list(enumerate(values)))}
+    return sorted(pd.Series(values).value_counts().items(), key=lambda item: (-item[1], first_seen[item[0]]))
+
+
+def test_top_counts_breaks_ties_by_first_sight():
+    rng = random.Random(3)
+    for _ in range(500):
+        values = [rng.choice('abcdefghijklmnopqrst') for _ in range(rng.randint(1, 200))]
+        assert top_counts(first_seen_counts(values)) == first_seen_ranking(values)
+    assert top_counts(first_seen_counts('aabbbc'), 2) == [('b', 3), ('a', 2)]
+    assert top_counts(first_seen_counts('cabbac')) == [('c', 2), ('a', 2), ('b', 2)]
+
+
+def test_empty_values_are_not_counted_like_in_the_csv_export(tmp_path):
+    products = [generate_product(sku) for sku in range(1, 31)]
+    for product in products[::4]:
+        product.update(brand='', category='', stock_status='')
+    aggregates = ProductAggregates()
+    for product in products:
+        aggregates.add(product)
+
+    path = tmp_path / "products.csv"
+    pd.DataFrame(products)[['brand', 'category', 'stock_status']].to_csv(path, index=False)
+    csv = pd.read_csv(path)
+    assert aggregates.brand_counts() == csv['brand'].value_counts().to_dict()
+    assert aggregates.categories == csv['category'].value_counts().to_dict()
+    assert aggregates.stock_statuses == csv['stock_status'].value_counts().to_dict()
+    # The products still count, and the breakdowns keep them under ''
+    assert aggregates.product_count == 30
+    assert aggregates.groups[('', '', '')][0] == len(products[::4])
+
+
+def test_report_labels_the_sketch_median_as_approximate():
+    aggregates = ProductAggregates()
+    for sku, price in enumerate([100.0, 250.0, 1234.56]):
+        aggregates.add(dict(generate_product(sku), price_numeric=price))
+
+    approximate = summary_report(aggregates)
+    assert "Median price (approx. ±0.5%): " in approximate
+    median = float(approximate.split("Median price (approx. ±0.5%): ")[1].split()[0])
+    assert abs(median - 250.0) <= 250.0 * 0.005
+
+    assert "Median price: 250.00 KES" in summary_report(aggregates, median_price=250.0)
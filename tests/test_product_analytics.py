@@ -0,0 +1,154 @@
+"""
+Tests for the market analytics views
+
+Author: Business Analytics Team
+Purpose: Check the streamed aggregates and the share, availability, price and tag views against pandas on the rows
+"""
+
+import os
+
+import pandas as pd
+import pytest
+
+from mock_storefront import generate_product
+from product_aggregates import ProductAggregates, aggregates_path, tag_words, top_counts
+from product_analytics import (aggregate_output, analyze_output, price_distribution, share, stock_availability,
+                               top_tag_words, word_cloud_image)
+from product_writers import ParquetProductWriter
+
+
+def sample_products(count: int = 300):
+    products = [generate_product(sku) for sku in range(count)]
+    # Some products without a brand or stock status, as the scraper records them
+    for product in products[::7]:
+        product.update(brand='', stock_status='')
+    return products
+
+
+def aggregate(products) -> ProductAggregates:
+    aggregates = ProductAggregates()
+    for product in products:
+        aggregates.add(product)
+    return aggregates
+
+
+def test_streamed_output_keeps_first_seen_order(tmp_path):
+    products = [generate_product(sku) for sku in range(400)]
+    path = str(tmp_path / "products.parquet")
+    with ParquetProductWriter(path) as writer:
+        for product in products:
+            writer.write(product)
+    aggregates = aggregate(products)
+
+    streamed = aggregate_output(path, batch_size=64)
+    assert list(streamed.brand_counts().items()) == list(aggregates.brand_counts().items())
+    assert list(streamed.categories.items()) == list(aggregates.categories.items())
+    assert {key: stats[:2] for key, stats in streamed.groups.items()} == \
+        {key: stats[:2] for key, stats in aggregates.groups.items()}
+    assert {key: stats[2] for key, stats in streamed.groups.items()} == \
+        pytest.approx({key: stats[2] for key, stats in aggregates.groups.items()})
+    assert streamed.tag_words == aggregates.tag_words
+    brands = pd.Series([product['brand'] for product in products])
+    assert dict(top_counts(streamed.brand_counts())) == brands.value_counts().to_dict()
+
+
+def test_analysis_is_redone_for_an_output_rewritten_after_its_aggregates(tmp_path):
+    path = str(tmp_path / "products.parquet")
+
+    def export(product_count: int):
+        with ParquetProductWriter(path) as writer:
+            for sku in range(product_count):
+                writer.write(generate_product(sku))
+
+    export(10)
+    assert analyze_output(path).product_count == 10
+    saved = os.path.getmtime(aggregates_path(path))
+
+    # A re-export over the same path, later than the saved aggregates
+    export(25)
+    os.utime(path, (saved + 1, saved + 1))
+    assert analyze_output(path).product_count == 25
+    assert ProductAggregates.load(aggregates_path(path)).product_count == 25
+
+
+def test_share_matches_a_groupby_over_the_rows():
+    products = sample_products()
+    frame = pd.DataFrame(products)
+    shares = share(aggregate(products), 'brand').set_index('brand')
+
+    named = frame[frame['brand'] != '']
+    expected = named.groupby('brand')['price_numeric'].agg(['count', 'sum', 'mean'])
+    assert sorted(shares.index) == sorted(expected.index)
+    assert shares['products'].to_dict() == expected['count'].to_dict()
+    # Products without a brand stay in the denominators
+    assert shares['share'].to_dict() == pytest.approx((expected['count'] / len(frame)).to_dict())
+    assert shares['avg_price'].to_dict() == pytest.approx(expected['mean'].to_dict())
+    value_shares = expected['sum'] / frame['price_numeric'].sum()
+    assert shares['value_share'].to_dict() == pytest.approx(value_shares.to_dict())
+
+
+def test_share_folds_the_tail_into_other():
+    aggregates = aggregate(sample_products())
+    full = share(aggregates, 'category')
+    limited = share(aggregates, 'category', limit=3)
+
+    assert list(limited['category']) == [*full['category'][:3], 'Other']
+    assert limited['products'].iloc[-1] == full['products'][3:].sum()
+    assert limited['products'].sum() == full['products'].sum()
+
+
+def test_stock_availability_matches_a_crosstab_of_the_rows():
+    products = sample_products()
+    frame = pd.DataFrame(products)
+    table = stock_availability(aggregate(products)).set_index('category')
+
+    stocked = frame[frame['stock_status'] != '']
+    expected = pd.crosstab(stocked['category'], stocked['stock_status'])
+    assert table[list(expected.columns)].to_dict() == expected.to_dict()
+    in_stock = (stocked['stock_status'] == 'In Stock').groupby(stocked['category']).mean()
+    assert table['in_stock_rate'].to_dict() == pytest.approx(in_stock.to_dict())
+    # Largest categories first
+    totals = table[list(expected.columns)].sum(axis=1)
+    assert list(totals) == sorted(totals, reverse=True)
+
+
+def test_price_distribution_counts_every_priced_product_once():
+    products = sample_products()
+    bands = price_distribution(aggregate(products))
+
+    assert bands['products'].sum() == len(products)
+    assert (bands['price_from'].iloc[1:].values == pytest.approx(bands['price_to'].iloc[:-1].values))
+    prices = pd.Series([product['price_numeric'] for product in products])
+    # Bands are sketch buckets regrouped, so their edges hold the prices within the sketch's 0.5%
+    assert bands['price_from'].iloc[0] <= prices.min() * 1.005
+    assert bands['price_to'].iloc[-1] >= prices.max() * 0.995
+    assert price_distribution(ProductAggregates()).empty
+
+
+def test_top_tag_words_ranks_by_count_then_word():
+    products = sample_products()
+    words = pd.Series([word for product in products for word in tag_words(product['tags'])])
+    top = top_tag_words(aggregate(products), limit=5)
+
+    ranked = sorted(words.value_counts().items(), key=lambda item: (-item[1], item[0]))
+    assert list(top.items()) == ranked[:5]
+    assert len(top_tag_words(aggregate(products), limit=None)) == words.nunique()
+
+
+def test_word_cloud_is_rendered_once_per_input(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    assert word_cloud_image({}, cache_dir=cache_dir) is None
+
+    wordcloud = pytest.importorskip('wordcloud')
+    frequencies = {'sensor': 12, 'module': 7, 'board': 3}
+    path = word_cloud_image(frequencies, width=200, height=100, cache_dir=cache_dir)
+    assert os.path.exists(path) and path.endswith('.png')
+    assert os.listdir(cache_dir) == [os.path.basename(path)]
+
+    # A second call with the same input is served from the cache without rendering
+    def no_render(*args, **kwargs):
+        raise AssertionError("word cloud rendered again")
+
+    monkeypatch.setattr(wordcloud.WordCloud, 'generate_from_frequencies', no_render)
+    assert word_cloud_image(dict(reversed(frequencies.items())), width=200, height=100,
+                            cache_dir=cache_dir) == path
@@ -0,0 +1,74 @@
+"""
+Round-trip tests for the compact product store
+
+Author: Business Analytics Team
+Purpose: Make sure the store hands back exactly the records that were appended, in the same key order
+"""
+
+import pytest
+
+from mock_storefront import generate_product
+from product_records import CompactProductStore
+
+
+def as_items(records):
+    # Comparing item lists also checks the key order, which dict equality ignores
+    return [list(record.items()) for record in records]
+
+
+def round_trip(products, spill_text: bool = False) -> CompactProductStore:
+    store = CompactProductStore(spill_text)
+    for product in products:
+        store.append(product)
+    assert as_items(store) == as_items(products)
+    return store
+
+
+def test_ordinary_records_round_trip():
+    products = [generate_product(sku) for sku in range(300)]
+    store = round_trip(products)
+    assert not store.extras
+    assert list(store[-1].items()) == list(products[-1].items())
+    with pytest.raises(IndexError):
+        store[len(products)]
+
+
+def test_odd_typed_values_round_trip_through_extras():
+    product = generate_product(1)
+    product.update(
+        sku=2 ** 70,
+        price_numeric=1500,
+        rating=None,
+        brand=None,
+        product_name=['not', 'text'],
+        image_urls=['http://127.0.0.1/a.jpg', 7],
+        specifications={'Pins': 8},
+        scraped_at='2026-10-16T12:00:00+03:00',
+    )
+    product['change_type'] = 'changed'
+    store = round_trip([generate_product(0), product, generate_product(2)])
+    assert set(store.extras) == {1}
+    assert type(store[1]['price_numeric']) is int
+
+
+@pytest.mark.parametrize('timestamp', ['yesterday', '2026-10-16 12:00:00', '2026-10-16T12:00:00.000000'])
+def test_timestamps_that_would_not_round_trip_are_kept_as_is(timestamp):
+    round_trip([dict(generate_product(1), scraped_at=timestamp)])
+
+
+def test_missing_fields_stay_missing():
+    product = generate_product(1)
+    for field in ('brand', 'price_numeric', 'image_urls', 'scraped_at', 'reviews_text'):
+        del product[field]
+    store = round_trip([generate_product(0), product])
+    assert 'brand' not in store[1]
+
+
+def test_spilled_text_round_trips():
+    products = [generate_product(sku) for sku in range(50)]
+    products[3]['product_description'] = "Ünïcode ✓ 電子 🚀 " * 500
+    products[4]['reviews_text'] = ''
+    store = round_trip(products, spill_text=True)
+    # Spilled values are read back from disk on every access
+    assert as_items(store) == as_items(products)
+    store.close()
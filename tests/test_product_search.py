@@ -0,0 +1,100 @@
+"""
+Tests for the product search index
+
+Author: Business Analytics Team
+Purpose: Check query escaping, keyword matching, facet counts, updates and removals, and an empty index
+"""
+
+import pytest
+
+from product_search import ProductSearchIndex, match_query
+
+
+def product(sku: int, name: str, brand: str, category: str, stock_status: str = 'In Stock',
+            price: float = 1000.0, **fields):
+    return dict({'sku': sku, 'product_name': name, 'brand': brand, 'category': category,
+                 'stock_status': stock_status, 'price_numeric': price, 'currency': 'KES',
+                 'url': f"http://store.test/{sku}", 'scraped_at': '2026-10-16T12:00:00'}, **fields)
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = ProductSearchIndex(str(tmp_path / "search.db"))
+    yield index
+    index.close()
+
+
+@pytest.fixture
+def catalog(index):
+    index.add_all([
+        product(1, 'ESP32-C3 (WiFi) Board', 'Espressif', 'Microcontrollers', price=850.0),
+        product(2, 'Arduino Uno R3', 'Arduino', 'Microcontrollers', 'Out of Stock', 1500.0,
+                tags='starter kit'),
+        product(3, 'Raspberry Pi 4', 'Raspberry', 'Single Board Computers', price=9000.0,
+                specifications={'RAM': '4GB'}),
+        product(4, 'ESP8266 NodeMCU', 'Espressif', 'Microcontrollers', 'Out of Stock', 600.0),
+    ])
+    return index
+
+
+def test_match_query_quotes_words_and_prefixes_the_last():
+    assert match_query('ESP32-C3 (WiFi)') == '"ESP32" "C3" "WiFi"*'
+    assert match_query('  "*( ') is None
+
+
+def test_fts_syntax_in_text_is_searched_literally(catalog):
+    results = catalog.search('ESP32-C3 (WiFi)')
+    assert list(results['sku']) == [1]
+    assert catalog.search('NOT OR "').empty
+
+
+def test_every_word_must_match_and_the_last_is_a_prefix(catalog):
+    assert sorted(catalog.search('esp')['sku']) == [1, 4]
+    assert list(catalog.search('raspberry 4')['sku']) == [3]
+    assert list(catalog.search('starter')['sku']) == [2]
+    assert list(catalog.search('ram 4gb')['sku']) == [3]
+    assert catalog.search('arduino raspberry').empty
+
+
+def test_filters_combine_with_text(catalog):
+    results = catalog.search('', brands=['Espressif'], stock_statuses=['In Stock'])
+    assert list(results['sku']) == [1]
+    assert catalog.count(categories=['Microcontrollers'], max_price=1000.0) == 2
+    assert catalog.count('esp', min_price=700.0) == 1
+
+
+def test_facet_counts_leave_out_their_own_filter(catalog):
+    facets = catalog.facets(brands=['Espressif'])
+    assert facets['brand'] == {'Espressif': 2, 'Arduino': 1, 'Raspberry': 1}
+    assert facets['category'] == {'Microcontrollers': 2}
+    assert facets['stock_status'] == {'In Stock': 1, 'Out of Stock': 1}
+
+    assert catalog.facets('board')['brand'] == {'Espressif': 1, 'Raspberry': 1}
+
+
+def test_adding_a_sku_again_replaces_it(catalog):
+    catalog.add(product(2, 'Arduino Mega 2560', 'Arduino', 'Microcontrollers', price=2500.0))
+    catalog.flush()
+
+    assert catalog.product_count() == 4
+    assert catalog.search('uno').empty
+    assert list(catalog.search('mega')['price_numeric']) == [2500.0]
+    assert catalog.facets()['stock_status'] == {'In Stock': 3, 'Out of Stock': 1}
+
+
+def test_removed_sku_is_no_longer_found(catalog):
+    catalog.remove(3)
+    catalog.flush()
+
+    assert catalog.product_count() == 3
+    assert catalog.search('raspberry').empty
+    assert 'Raspberry' not in catalog.facets()['brand']
+
+
+def test_empty_index(index):
+    assert index.product_count() == 0
+    assert index.search('anything').empty
+    assert index.search().empty
+    assert index.count() == 0
+    assert index.facets() == {'brand': {}, 'category': {}, 'stock_status': {}}
+    assert index.price_range() == (None, None)
@@ -0,0 +1,58 @@
+"""
+Tests for the streaming Parquet writer
+
+Author: Business Analytics Team
+Purpose: Check that the Parquet and CSV outputs of a run hold the same rows, and that unfinished files are never visible
+"""
+
+import glob
+import os
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from ecommerce_scraper import EcommerceMarketScraper
+from mock_storefront import MockStorefront, generate_product
+from product_writers import PRODUCT_SCHEMA, ParquetProductWriter
+
+# Scalar columns both outputs carry unchanged
+SHARED_COLUMNS = ['sku', 'product_name', 'price', 'price_numeric', 'currency', 'stock_status', 'brand',
+                  'category', 'model', 'rating', 'review_count', 'tags', 'url']
+
+
+def test_parquet_and_csv_outputs_hold_the_same_rows(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with MockStorefront(page_size=0) as store:
+        scraper = EcommerceMarketScraper(store.base_url, enable_logging=False, output_format='both')
+        scraper.run_market_analysis(1, 40, requests_per_second=200)
+
+    parquet_path, = glob.glob("ecommerce_products_*.parquet")
+    csv_path, = glob.glob("ecommerce_products_*.csv")
+    assert parquet_path[:-len('.parquet')] == csv_path[:-len('.csv')]
+
+    parquet = pd.read_parquet(parquet_path).sort_values('sku', ignore_index=True)
+    csv = pd.read_csv(csv_path, keep_default_na=False).sort_values('sku', ignore_index=True)
+    assert len(parquet) == len(csv) == scraper.collected_count() > 0
+    for column in SHARED_COLUMNS:
+        assert parquet[column].astype(str).tolist() == csv[column].astype(str).tolist(), column
+
+    # CSV flattens specifications into spec_ columns and joins the image URLs
+    assert [dict(specs)['Model'] for specs in parquet['specifications']] == csv['spec_model'].tolist()
+    assert ['|'.join(urls) for urls in parquet['image_urls']] == csv['image_urls'].tolist()
+
+
+def test_rows_stay_in_the_partial_file_until_close(tmp_path):
+    path = str(tmp_path / "products.parquet")
+    writer = ParquetProductWriter(path, batch_size=2)
+    for sku in range(1, 6):
+        writer.write(generate_product(sku))
+
+    assert writer.rows_written == 4
+    assert not os.path.exists(path)
+    assert os.path.exists(f"{path}.partial")
+
+    writer.close()
+    assert not os.path.exists(f"{path}.partial")
+    table = pq.read_table(path)
+    assert table.schema.equals(PRODUCT_SCHEMA)
+    assert table.column('sku').to_pylist() == [1, 2, 3, 4, 5]
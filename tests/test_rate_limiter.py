@@ -0,0 +1,147 @@
+"""
+Tests for the token bucket, the AIMD controller and the adaptive host limiter
+
+Author: Business Analytics Team
+Purpose: Check Retry-After pacing, rate and concurrency adaptation, and that concurrency slots always come back
+"""
+
+import asyncio
+import time
+
+from rate_limiter import RETRY_BACKOFF_BASE, RETRY_BACKOFF_MAX, AdaptiveHostLimiter, AimdController, TokenBucket, \
+    backoff_delay
+
+URL = "http://store.test/SKU-1"
+
+
+def test_cancelled_acquire_frees_its_slot():
+    async def scenario():
+        # One token: the second acquire() holds a slot while it waits for the next token
+        limiter = AdaptiveHostLimiter(0.5, concurrency=2, burst=1)
+        await limiter.acquire(URL)
+        waiting = asyncio.create_task(limiter.acquire(URL))
+        await asyncio.sleep(0.05)
+        assert limiter.in_flight['store.test'] == 2
+
+        waiting.cancel()
+        try:
+            await waiting
+        except asyncio.CancelledError:
+            pass
+        assert limiter.in_flight['store.test'] == 1
+
+        await limiter.release(URL, 200, 0.01)
+        assert limiter.in_flight['store.test'] == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_release_still_wakes_waiters():
+    async def scenario():
+        limiter = AdaptiveHostLimiter(100, concurrency=1, burst=10)
+        await limiter.acquire(URL)
+        waiting = asyncio.create_task(limiter.acquire(URL))
+        await asyncio.sleep(0.05)
+
+        # Hold the condition's lock so release() is cancelled while it waits to notify
+        async with limiter._slot_freed:
+            releasing = asyncio.create_task(limiter.release(URL, 200, 0.01))
+            await asyncio.sleep(0.05)
+            releasing.cancel()
+            try:
+                await releasing
+            except asyncio.CancelledError:
+                pass
+
+        await asyncio.wait_for(waiting, timeout=1.0)
+        assert limiter.in_flight['store.test'] == 1
+
+    asyncio.run(scenario())
+
+
+def test_pause_restarts_from_an_empty_bucket():
+    async def scenario():
+        bucket = TokenBucket(rate=20, capacity=10)
+        bucket.pause(0.2)
+        started = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    # The pause, then one token per 1/20 s: no burst of the full capacity once it ends
+    assert asyncio.run(scenario()) >= 0.2 + 5 / 20 - 0.02
+
+
+def test_rate_cut_keeps_the_tokens_already_earned():
+    async def scenario():
+        limiter = AdaptiveHostLimiter(100, concurrency=10, burst=10)
+        controller = limiter.controller_for(URL)
+        bucket = limiter.bucket_for(URL)
+        bucket.tokens, bucket.updated = 0, time.monotonic()
+        # About 5 tokens earned at 100 req/s before the controller backs off to 1 req/s
+        await asyncio.sleep(0.05)
+        controller.rate = 1.0
+        started = time.monotonic()
+        await limiter.acquire(URL)
+        await limiter.release(URL, 200, 0.01)
+        return time.monotonic() - started, bucket
+
+    waited, bucket = asyncio.run(scenario())
+    assert waited < 0.1
+    assert bucket.rate == 1.0 and bucket.tokens >= 3
+
+
+def test_retry_after_pauses_the_host():
+    async def scenario():
+        limiter = AdaptiveHostLimiter(20, concurrency=10, burst=10)
+        await limiter.acquire(URL)
+        await limiter.release(URL, 503, 0.01, retry_after=0.2)
+        started = time.monotonic()
+        await limiter.acquire(URL)
+        await limiter.release(URL, 200, 0.01)
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) >= 0.2
+
+
+def test_aimd_increases_additively_up_to_max_rate():
+    controller = AimdController(rate=2.0, max_rate=3.0, max_concurrency=4, increase=0.5, cooldown=0.0)
+    controller.on_response(429)
+    assert (controller.rate, controller.concurrency) == (1.0, 2.0)
+    controller.on_response(200, 0.1)
+    assert (controller.rate, controller.concurrency) == (1.5, 2.5)
+    for _ in range(100):
+        controller.on_response(200, 0.1)
+    assert controller.rate == 3.0
+    assert controller.concurrency_limit == 4
+
+
+def test_aimd_decreases_once_per_cooldown():
+    controller = AimdController(rate=8.0, max_rate=8.0, min_rate=1.0, max_concurrency=8, cooldown=60.0)
+    controller.on_response(429)
+    assert (controller.rate, controller.concurrency_limit) == (4.0, 4)
+
+    # Within the cooldown further throttling counts as the same congestion signal
+    controller.on_response(503)
+    controller.on_response(None)
+    assert (controller.rate, controller.concurrency_limit) == (4.0, 4)
+
+    controller.last_decrease -= 60.0
+    controller.on_response(None)
+    assert (controller.rate, controller.concurrency_limit) == (2.0, 2)
+
+
+def test_aimd_backs_off_on_latency_and_respects_min_rate():
+    controller = AimdController(rate=1.0, max_rate=1.0, min_rate=0.5, cooldown=0.0)
+    for _ in range(5):
+        controller.on_response(200, 0.1)
+    controller.on_response(200, 5.0)
+    assert controller.rate == 0.5
+    controller.on_response(429)
+    assert controller.rate == 0.5
+
+
+def test_backoff_delay_follows_the_shared_policy():
+    for attempt in range(1, 10):
+        delay = backoff_delay(attempt)
+        assert 0 <= delay <= min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** (attempt - 1))
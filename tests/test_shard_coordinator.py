@@ -0,0 +1,131 @@
+"""
+Tests for the shard lease coordinator
+
+Author: Business Analytics Team
+Purpose: Check lease expiry, hand-over, that a stale worker can no longer commit, and that renewals never stall a crawl
+"""
+
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from mock_storefront import MockStorefront
+from shard_coordinator import DONE, FAILED, LEASED, ShardCoordinator, run_worker
+
+LEASE_SECONDS = 0.4
+
+
+def product(sku: int, scraped_at: str = '2026-10-16T12:00:00'):
+    return {'sku': sku, 'scraped_at': scraped_at, 'product_name': f"Product {sku}"}
+
+
+@pytest.fixture
+def clients(tmp_path):
+    # Two workers, each with its own connection to the same database
+    path = str(tmp_path / "shards.db")
+    first, second = ShardCoordinator(path, LEASE_SECONDS), ShardCoordinator(path, LEASE_SECONDS)
+    first.plan(0, 9, shard_size=10)
+    yield first, second
+    first.close()
+    second.close()
+
+
+def test_leased_shard_is_not_handed_out_twice(clients):
+    first, second = clients
+    assert first.lease('worker-1') is not None
+    assert second.lease('worker-2') is None
+
+
+def test_expired_lease_goes_to_the_next_worker(clients):
+    first, second = clients
+    shard = first.lease('worker-1')
+    time.sleep(LEASE_SECONDS * 1.5)
+
+    assert second.lease('worker-2') == shard
+    assert second.conn.execute("SELECT worker, attempts FROM shards").fetchone() == ('worker-2', 2)
+
+
+def test_stale_worker_cannot_renew_or_complete(clients):
+    first, second = clients
+    shard = first.lease('worker-1')
+    time.sleep(LEASE_SECONDS * 1.5)
+    second.lease('worker-2')
+
+    assert not first.heartbeat(shard, 'worker-1')
+    assert not first.complete(shard, 'worker-1', [product(1)], pages=10)
+    assert first.product_count() == 0
+    assert first.state_counts() == {LEASED: 1}
+
+    assert second.heartbeat(shard, 'worker-2')
+    assert second.complete(shard, 'worker-2', [product(1), product(2)], pages=10)
+    assert first.state_counts() == {DONE: 1}
+    assert first.product_count() == 2
+    # Completing again is refused: the shard is no longer leased
+    assert not second.complete(shard, 'worker-2', [product(3)], pages=10)
+    assert second.product_count() == 2
+
+
+def test_heartbeat_keeps_the_lease(clients):
+    first, second = clients
+    shard = first.lease('worker-1')
+    for _ in range(3):
+        time.sleep(LEASE_SECONDS / 2)
+        assert first.heartbeat(shard, 'worker-1')
+        assert second.lease('worker-2') is None
+    assert first.complete(shard, 'worker-1', [product(1)], pages=10)
+
+
+def test_shard_is_given_up_after_max_attempts(tmp_path):
+    coordinator = ShardCoordinator(str(tmp_path / "shards.db"), LEASE_SECONDS, max_attempts=2)
+    coordinator.plan(0, 9, shard_size=10)
+    for attempt in range(2):
+        assert coordinator.lease(f"worker-{attempt}") is not None
+        time.sleep(LEASE_SECONDS * 1.5)
+
+    assert coordinator.lease('worker-3') is None
+    assert coordinator.state_counts() == {FAILED: 1}
+    coordinator.close()
+
+
+def test_results_keep_the_most_recent_scrape(clients):
+    first, _ = clients
+    first.plan(0, 19, shard_size=10)
+    one, two = first.lease('worker-1'), first.lease('worker-1')
+    first.complete(two, 'worker-1', [product(5, '2026-10-16T12:00:02')], pages=10)
+    first.complete(one, 'worker-1', [product(5, '2026-10-16T12:00:01')], pages=10)
+    assert [p['scraped_at'] for p in first.iter_products()] == ['2026-10-16T12:00:02']
+
+
+def test_busy_database_does_not_stall_the_crawl(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = str(tmp_path / "shards.db")
+    planner = ShardCoordinator(path)
+    planner.plan(1, 40, shard_size=40)
+
+    with MockStorefront(page_size=0, latency=0.02) as store:
+        def hold_write_lock():
+            # Once the crawl is under way, keep the database locked across several heartbeats
+            while store.requests_served < 5:
+                time.sleep(0.005)
+            locker = sqlite3.connect(path, isolation_level=None)
+            locker.execute("BEGIN IMMEDIATE")
+            served_before = store.requests_served
+            time.sleep(0.5)
+            progress.append(store.requests_served - served_before)
+            locker.execute("COMMIT")
+            locker.close()
+
+        progress = []
+        locker = threading.Thread(target=hold_write_lock)
+        locker.start()
+        completed = run_worker(path, store.base_url, 'worker-1', concurrency=2, requests_per_second=500,
+                               lease_seconds=0.15)
+        locker.join()
+
+    assert completed == 1
+    # Heartbeats waited on the lock in a thread while the event loop kept fetching
+    assert progress[0] >= 5
+    assert planner.state_counts() == {DONE: 1}
+    planner.close()
@@ -0,0 +1,150 @@
+"""
+Tests for the SKU interval index and the adaptive probe scheduler
+
+Author: Business Analytics Team
+Purpose: Check interval merging against a per-SKU reference and the order in which SKUs are probed
+"""
+
+import asyncio
+import random
+import sqlite3
+
+from ecommerce_scraper import EcommerceMarketScraper
+from mock_storefront import MockStorefront
+from sku_index import DEAD, LIVE, UNKNOWN, AdaptiveProbeScheduler, SkuIndex
+
+MAX_FAILURES = 8
+# One gap a SKU short of the failure limit, then one that reaches it
+SHORT_GAP = range(5, 5 + MAX_FAILURES - 1)
+STOPPING_GAP = range(21, 21 + MAX_FAILURES)
+
+
+class GappedStorefront(MockStorefront):
+    """
+    Mock storefront where every SKU is a product except those in the gaps
+    """
+
+    def __init__(self):
+        super().__init__(page_size=0, not_found_rate=0.0)
+
+    def sku_exists(self, sku: int) -> bool:
+        return sku not in SHORT_GAP and sku not in STOPPING_GAP
+
+
+def new_index() -> SkuIndex:
+    return SkuIndex(sqlite3.connect(":memory:"))
+
+
+def reference_intervals(states, start_sku: int, max_sku: int):
+    """
+    Runs of equal state in a per-SKU dict, the way intervals() should report them
+    """
+    runs = []
+    for sku in range(start_sku, max_sku + 1):
+        state = states.get(sku, UNKNOWN)
+        if runs and runs[-1][2] == state:
+            runs[-1][1] = sku
+        else:
+            runs.append([sku, sku, state])
+    return [tuple(run) for run in runs]
+
+
+def probe_all(scheduler: AdaptiveProbeScheduler, live_skus):
+    """
+    Run the scheduler sequentially against a storefront whose products are live_skus; returns the probe order
+    """
+    probed = []
+    while True:
+        sku = scheduler.next_sku()
+        if sku is None:
+            return probed
+        probed.append(sku)
+        scheduler.report(sku, sku in live_skus)
+
+
+def test_intervals_match_per_sku_states_after_random_marks():
+    rng = random.Random(7)
+    index, states = new_index(), {}
+    for _ in range(3000):
+        sku = rng.randint(0, 200)
+        state = rng.choice((LIVE, DEAD, UNKNOWN))
+        index.mark(sku, state)
+        if state == UNKNOWN:
+            states.pop(sku, None)
+        else:
+            states[sku] = state
+
+        if rng.random() < 0.05:
+            start = rng.randint(-5, 200)
+            end = rng.randint(start, 210)
+            assert list(index.intervals(start, end)) == reference_intervals(states, start, end)
+
+    assert list(index.intervals(-5, 210)) == reference_intervals(states, -5, 210)
+    # Stored intervals are merged: no two neighbours touch in the same state
+    for i in range(len(index.starts) - 1):
+        assert index.ends[i] < index.starts[i + 1]
+        assert not (index.ends[i] + 1 == index.starts[i + 1] and index.states[i] == index.states[i + 1])
+
+
+def test_saved_intervals_load_back():
+    conn = sqlite3.connect(":memory:")
+    index = SkuIndex(conn)
+    for sku in (3, 4, 5, 9):
+        index.mark(sku, LIVE)
+    index.mark(7, DEAD)
+    index.save()
+    assert list(SkuIndex(conn).intervals(0, 10)) == list(index.intervals(0, 10))
+
+
+def test_probe_order_is_live_then_unknown_then_dead_samples():
+    index = new_index()
+    for sku in range(10, 13):
+        index.mark(sku, LIVE)
+    for sku in range(20, 41):
+        index.mark(sku, DEAD)
+
+    scheduler = AdaptiveProbeScheduler(index, 0, 50, max_consecutive_failures=1000)
+    probed = probe_all(scheduler, live_skus={10, 11, 12})
+    unknown = [*range(0, 10), *range(13, 20), *range(41, 51)]
+    # Dead samples at distance 0, 1, 3, 7, 15 from both ends of 20..40
+    assert probed == [10, 11, 12, *unknown, 20, 21, 23, 25, 27, 33, 35, 37, 39, 40]
+
+
+def test_hit_in_a_dead_gap_backfills_its_neighbours_first():
+    index = new_index()
+    for sku in range(0, 100):
+        index.mark(sku, DEAD)
+
+    scheduler = AdaptiveProbeScheduler(index, 0, 99, max_consecutive_failures=1000, backfill_window=2)
+    probed = probe_all(scheduler, live_skus={3})
+    # The hit at 3 schedules 2, 4, 1 (already sampled), 5 before the remaining samples
+    assert probed[:5] == [0, 1, 3, 2, 4]
+    assert probed[5] == 5
+
+
+def test_finds_products_across_a_dead_gap_without_a_linear_scan():
+    index = new_index()
+    for sku in range(0, 1000):
+        index.mark(sku, DEAD)
+    # New products appeared in the middle of what past runs saw as dead
+    new_products = set(range(730, 761))
+
+    probed = probe_all(AdaptiveProbeScheduler(index, 0, 999, max_consecutive_failures=100), new_products)
+    assert new_products <= set(probed)
+    assert len(probed) < 150
+
+
+def test_concurrent_crawl_stops_where_a_sequential_scan_would(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with GappedStorefront() as store:
+        scraper = EcommerceMarketScraper(store.base_url, enable_logging=False, journal_path="journal.db",
+                                         output_format='none')
+        asyncio.run(scraper.run_market_analysis_async(1, 60, MAX_FAILURES, concurrency=6, requests_per_second=500))
+        served = store.requests_served
+
+    stop_sku = STOPPING_GAP[-1]
+    journaled = [sku for sku, in scraper.journal.conn.execute("SELECT sku FROM outcomes ORDER BY sku")]
+    # Nothing past the last SKU of the stopping gap is fetched or journaled
+    assert journaled == list(range(1, stop_sku + 1))
+    assert served == stop_sku
+    assert scraper.collected_count() == stop_sku - len(SHORT_GAP) - len(STOPPING_GAP)